@@ -0,0 +1,223 @@
+# app/analytics.py
+
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from app.config import get_settings
+from app.currency import convert_record_cents, day_number
+from app.archive import load_user_records
+from app.money import from_cents
+from app.user_cache import UserCache
+
+# Outliers are only flagged in categories with at least this many expenses.
+MIN_OUTLIER_SAMPLES = 5
+
+
+class RecordFrame:
+    """
+    One user's records as parallel NumPy columns, amounts already converted
+    to cents of the base currency. Built once per cache fill; every analytic
+    below is a handful of array operations over it.
+    """
+
+    def __init__(self, ids: np.ndarray, days: np.ndarray, cents: np.ndarray,
+                 is_expense: np.ndarray, category_codes: np.ndarray, categories: List[str]):
+        self.ids = ids                        # S12: ObjectId bytes
+        self.days = days                      # int64: day_number(date)
+        self.cents = cents                    # int64
+        self.is_expense = is_expense          # bool
+        self.category_codes = category_codes  # int64 index into categories
+        self.categories = categories
+
+    def __len__(self) -> int:
+        return len(self.cents)
+
+    @classmethod
+    def from_records(cls, records: List[dict], base_currency: str) -> "RecordFrame":
+        cents = convert_record_cents(records, base_currency) if records else np.zeros(0, np.int64)
+        categories, category_codes = np.unique(
+            np.array([record.get("category", "") for record in records], dtype=object),
+            return_inverse=True)
+        return cls(
+            ids=np.array([record["_id"].binary for record in records], dtype="S12"),
+            days=np.fromiter((day_number(record["date"]) for record in records),
+                             dtype=np.int64, count=len(records)),
+            cents=cents,
+            is_expense=np.fromiter((record.get("type") == "expense" for record in records),
+                                   dtype=bool, count=len(records)),
+            category_codes=category_codes.astype(np.int64),
+            categories=[str(category) for category in categories],
+        )
+
+    def record_id(self, index: int) -> ObjectId:
+        return ObjectId(bytes(self.ids[index]))
+
+
+async def load_frame(user_id: str) -> RecordFrame:
+    """
+    Read all of a user's records (only the fields analytics need) into a frame.
+    """
+    projection = {"_id": 1, "amount_cents": 1, "amount": 1, "currency": 1,
+                  "date": 1, "type": 1, "category": 1}
+    records = await load_user_records(user_id, projection)
+    return RecordFrame.from_records(records, get_settings().base_currency)
+
+
+frame_cache = UserCache(
+    load_frame, get_settings().analytics_cache_max_users, get_settings().analytics_cache_ttl_seconds)
+
+
+def records_changed(records: List[dict]):
+    """
+    Drop cached frames of the users owning these records.
+    """
+    frame_cache.invalidate(*{record["user_id"] for record in records})
+
+
+# -------- Analytics --------
+
+def today_number() -> int:
+    return datetime.now(timezone.utc).date().toordinal()
+
+
+def month_number(days: np.ndarray) -> np.ndarray:
+    """
+    Months since year 0 (year * 12 + month - 1) for ordinal day numbers.
+    """
+    as_dates = (days - date(1970, 1, 1).toordinal()).astype("datetime64[D]")
+    return as_dates.astype("datetime64[M]").astype(np.int64) + 1970 * 12
+
+
+def daily_expenses(frame: RecordFrame, first_day: int, last_day: int) -> np.ndarray:
+    """
+    Expense cents per day from first_day to last_day inclusive.
+    """
+    mask = frame.is_expense & (frame.days >= first_day) & (frame.days <= last_day)
+    return np.bincount(frame.days[mask] - first_day, weights=frame.cents[mask],
+                       minlength=last_day - first_day + 1).astype(np.int64)
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing mean over `window` entries; the first entries average what is
+    available so far.
+    """
+    totals = np.cumsum(values, dtype=np.float64)
+    totals[window:] = totals[window:] - totals[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return totals / counts
+
+
+def monthly_totals(frame: RecordFrame, months: int, today: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Income and expense cents for the last `months` calendar months,
+    including the current one.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Month numbers, income, expense.
+    """
+    last_month = int(month_number(np.array([today]))[0])
+    first_month = last_month - months + 1
+    record_months = month_number(frame.days)
+    mask = (record_months >= first_month) & (record_months <= last_month)
+    offsets = record_months[mask] - first_month
+    income = np.bincount(offsets[~frame.is_expense[mask]],
+                         weights=frame.cents[mask][~frame.is_expense[mask]], minlength=months)
+    expense = np.bincount(offsets[frame.is_expense[mask]],
+                          weights=frame.cents[mask][frame.is_expense[mask]], minlength=months)
+    return (np.arange(first_month, last_month + 1),
+            income.astype(np.int64), expense.astype(np.int64))
+
+
+def month_over_month(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Change from the previous month, absolute and as a fraction (NaN where
+    the previous month is zero). The first month has no previous one.
+    """
+    change = np.diff(values, prepend=values[:1])
+    previous = np.concatenate([[0], values[:-1]]).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(previous > 0, change / previous, np.nan)
+    fraction[0] = np.nan
+    return change, fraction
+
+
+def category_shares(frame: RecordFrame, first_day: int) -> List[Tuple[str, int, float]]:
+    """
+    Expense cents and share of total expenses per category since first_day,
+    largest first.
+    """
+    mask = frame.is_expense & (frame.days >= first_day)
+    totals = np.bincount(frame.category_codes[mask], weights=frame.cents[mask],
+                         minlength=len(frame.categories)).astype(np.int64)
+    grand_total = totals.sum()
+    order = np.argsort(-totals, kind="stable")
+    return [(frame.categories[i], int(totals[i]), float(totals[i] / grand_total))
+            for i in order if totals[i] > 0]
+
+
+def find_outliers(frame: RecordFrame, first_day: int, threshold: float) -> List[Tuple[int, float]]:
+    """
+    Expenses since first_day whose amount is more than `threshold` standard
+    deviations above their category's mean over the user's whole history.
+
+    Returns:
+        List[Tuple[int, float]]: (frame index, z-score), highest score first.
+    """
+    expense = frame.is_expense
+    codes = frame.category_codes[expense]
+    amounts = frame.cents[expense].astype(np.float64)
+    size = len(frame.categories)
+    counts = np.bincount(codes, minlength=size)
+    sums = np.bincount(codes, weights=amounts, minlength=size)
+    squares = np.bincount(codes, weights=amounts ** 2, minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = sums / counts
+        stds = np.sqrt(np.maximum(squares / counts - means ** 2, 0))
+
+    indices = np.flatnonzero(expense & (frame.days >= first_day))
+    record_codes = frame.category_codes[indices]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = (frame.cents[indices] - means[record_codes]) / stds[record_codes]
+    flagged = ((counts[record_codes] >= MIN_OUTLIER_SAMPLES) & (stds[record_codes] > 0)
+               & (scores > threshold))
+    order = np.argsort(-scores[flagged], kind="stable")
+    return [(int(i), float(z)) for i, z in zip(indices[flagged][order], scores[flagged][order])]
+
+
+def format_month(month: int) -> str:
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def assistant_context(frame: RecordFrame, today: Optional[int] = None) -> str:
+    """
+    A few lines summarising the user's spending trends, for the assistant's prompt.
+    """
+    if not len(frame):
+        return "No transactions recorded yet."
+    today = today or today_number()
+    currency = get_settings().base_currency
+    months, income, expense = monthly_totals(frame, 2, today)
+    change, fraction = month_over_month(expense)
+    lines = [
+        f"Spending this month ({format_month(months[-1])}): "
+        f"{from_cents(int(expense[-1])):.2f} {currency}; last month: "
+        f"{from_cents(int(expense[0])):.2f} {currency}."
+    ]
+    if not np.isnan(fraction[-1]):
+        lines.append(f"Change vs last month: {fraction[-1]:+.0%}.")
+    shares = category_shares(frame, today - 29)
+    if shares:
+        lines.append("Top categories (30 days): " + ", ".join(
+            f"{category} {share:.0%}" for category, _, share in shares[:5]) + ".")
+    outliers = find_outliers(frame, today - 29, threshold=3.0)
+    if outliers:
+        lines.append("Unusually large recent expenses: " + ", ".join(
+            f"{from_cents(int(frame.cents[i])):.2f} {currency} on "
+            f"{frame.categories[frame.category_codes[i]]} "
+            f"({date.fromordinal(int(frame.days[i])).isoformat()})"
+            for i, _ in outliers[:3]) + ".")
+    return "\n".join(lines)
@@ -0,0 +1,397 @@
+# app/archive.py
+"""
+Tiered storage for old records.
+
+Records dated (and last updated) more than ARCHIVE_AFTER_DAYS ago are moved
+from the hot records collection to archived_records, a zstd-compressed
+collection with only the indexes cold reads need, so the hot collection's
+indexes cover recent data only. Per-day rollups of the archived amounts
+(archived_rollups) let summaries skip the archived records entirely.
+
+Users with archived records carry archived_before on their user document:
+reads only consult the cold tier when they reach back past it. Updating an
+archived record first moves it back to the hot tier.
+
+Archival normally runs in the background; it can also be run by hand:
+
+    python -m app.archive
+"""
+
+import asyncio
+import heapq
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.config import get_settings
+from app.database import mongo
+
+DUPLICATE_KEY_ERROR = 11000
+
+def as_utc(value: datetime) -> datetime:
+    # Dates read back from MongoDB are naive UTC.
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def archive_cutoff(now: Optional[datetime] = None) -> datetime:
+    now = now or datetime.now(timezone.utc)
+    return now - timedelta(days=get_settings().archive_after_days)
+
+
+def reads_archive(user: dict, date_from: Optional[datetime] = None) -> bool:
+    """
+    Whether a read of the user's records from date_from on can reach the
+    cold tier.
+    """
+    archived_before = user.get("archived_before")
+    return archived_before is not None and (
+        date_from is None or as_utc(date_from) < as_utc(archived_before))
+
+
+def record_tiers(user: dict, date_from: Optional[datetime] = None) -> list:
+    """
+    The collections a read of the user's records has to consult.
+    """
+    tiers = [mongo.records_reader]
+    if reads_archive(user, date_from):
+        tiers.append(mongo.archived_records)
+    return tiers
+
+
+# -------- Reads across tiers --------
+
+def bson_sort_value(value) -> tuple:
+    """
+    A merge key ordering a sort field as MongoDB does: null and missing
+    values (e.g. records without a description) before any other value.
+    Each sortable field otherwise holds values of a single type.
+    """
+    return (value is not None, value)
+
+
+async def find_across_tiers(tiers: list, query_filter: dict, sort: list,
+                            skip: int = 0, limit: Optional[int] = None,
+                            projection: Optional[dict] = None) -> List[dict]:
+    """
+    Find records in every tier as if they were one collection.
+
+    With more than one tier, each is read in sort order up to skip + limit
+    keys (sort fields and _id only), the keys are merged, and then only the
+    requested page is read in full.
+
+    Args:
+        tiers (list): Collections from record_tiers().
+        query_filter (dict): The filter, applied to every tier.
+        sort (list): Sort keys, all in the same direction (see build_records_sort).
+        skip (int): Number of records to skip.
+        limit (Optional[int]): Maximum number of records to return; None for all.
+        projection (Optional[dict]): Fields to read, including _id and the
+            sort fields; None for whole records.
+
+    Returns:
+        List[dict]: The matching records in sort order.
+    """
+    if len(tiers) == 1:
+        cursor = tiers[0].find(query_filter, projection).sort(sort).skip(skip)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=None)
+
+    def sort_key(document):
+        return tuple(bson_sort_value(document.get(field)) for field, _ in sort)
+
+    descending = sort[0][1] == -1
+    if limit is None:
+        per_tier = [await tier.find(query_filter, projection).sort(sort).to_list(length=None) for tier in tiers]
+        return list(heapq.merge(*per_tier, key=sort_key, reverse=descending))[skip:]
+
+    key_projection = {field: 1 for field, _ in sort}
+    per_tier = []
+    for index, tier in enumerate(tiers):
+        keys = await tier.find(query_filter, key_projection).sort(sort).limit(skip + limit).to_list(length=None)
+        per_tier.append([(index, key) for key in keys])
+    page = list(heapq.merge(*per_tier, key=lambda item: sort_key(item[1]), reverse=descending))
+    page = page[skip:skip + limit]
+
+    documents = {}
+    for index, tier in enumerate(tiers):
+        ids = [key["_id"] for tier_index, key in page if tier_index == index]
+        if ids:
+            async for document in tier.find({"_id": {"$in": ids}, "user_id": query_filter["user_id"]}, projection):
+                documents[document["_id"]] = document
+    # Skip records moved or deleted between the two reads.
+    return [documents[key["_id"]] for _, key in page if key["_id"] in documents]
+
+
+async def count_across_tiers(tiers: list, query_filter: dict) -> int:
+    total = 0
+    for tier in tiers:
+        total += await tier.count_documents(query_filter)
+    return total
+
+
+async def find_records_by_ids(user_id: str, ids: List[ObjectId]) -> Dict[ObjectId, dict]:
+    """
+    The user's records with these ids, from whichever tier holds them.
+    """
+    found = {
+        record["_id"]: record
+        async for record in mongo.records_reader.find({"_id": {"$in": ids}, "user_id": user_id})
+    }
+    missing = [record_id for record_id in ids if record_id not in found]
+    if missing:
+        async for record in mongo.archived_records.find({"_id": {"$in": missing}, "user_id": user_id}):
+            found[record["_id"]] = record
+    return found
+
+
+async def load_user_records(user_id: str, projection: dict) -> List[dict]:
+    """
+    All of a user's records from both tiers, e.g. to build an in-memory index.
+    """
+    records = await mongo.records_reader.find({"user_id": user_id}, projection).to_list(length=None)
+    records += await mongo.archived_records.find({"user_id": user_id}, projection).to_list(length=None)
+    return records
+
+
+# -------- Summaries --------
+
+async def day_groups(collection, query_filter: dict) -> List[dict]:
+    """
+    Sum amounts exactly in the database per currency, UTC day, type and category.
+
+    Returns:
+        List[dict]: One record-like group (currency, day, date, type,
+        category, amount_cents) per combination present.
+    """
+    pipeline = [
+        {"$match": query_filter},
+        {"$group": {
+            "_id": {
+                "currency": "$currency",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
+                "type": "$type",
+                "category": "$category",
+            },
+            "amount_cents": {"$sum": "$amount_cents"},
+        }},
+    ]
+    groups = []
+    async for row in collection.aggregate(pipeline):
+        groups.append({
+            "currency": row["_id"].get("currency"),
+            "day": row["_id"]["day"],
+            "type": row["_id"]["type"],
+            "category": row["_id"]["category"],
+            "date": date.fromisoformat(row["_id"]["day"]),
+            "amount_cents": row["amount_cents"],
+        })
+    return groups
+
+
+def whole_days(date_from: Optional[datetime], date_to: Optional[datetime]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    The span of whole UTC days inside [date_from, date_to): its first
+    midnight and its end midnight (None where unbounded).
+    """
+    first = end = None
+    if date_from is not None:
+        date_from = as_utc(date_from)
+        first = datetime.combine(date_from.date(), time(), timezone.utc)
+        if first < date_from:
+            first += timedelta(days=1)
+    if date_to is not None:
+        end = datetime.combine(as_utc(date_to).date(), time(), timezone.utc)
+    return first, end
+
+
+async def archived_day_groups(user_id: str, date_from: Optional[datetime],
+                              date_to: Optional[datetime]) -> List[dict]:
+    """
+    day_groups() of the user's archived records in [date_from, date_to).
+
+    Whole days come from the rollups; only partial days at the ends of the
+    range are summed from the archived records themselves.
+    """
+    first, end = whole_days(date_from, date_to)
+    if first is not None and end is not None and first >= end:
+        query_filter = {"user_id": user_id, "date": {"$gte": date_from, "$lt": date_to}}
+        return await day_groups(mongo.archived_records, query_filter)
+
+    day_range = {}
+    if first is not None:
+        day_range["$gte"] = first.strftime("%Y-%m-%d")
+    if end is not None:
+        day_range["$lt"] = end.strftime("%Y-%m-%d")
+    rollup_filter = {"user_id": user_id, **({"day": day_range} if day_range else {})}
+    groups = [
+        {**{field: rollup[field] for field in ("currency", "day", "type", "category", "amount_cents")},
+         "date": date.fromisoformat(rollup["day"])}
+        async for rollup in mongo.archived_rollups.find(rollup_filter)
+    ]
+    if date_from is not None and first > as_utc(date_from):
+        groups += await day_groups(mongo.archived_records, {
+            "user_id": user_id, "date": {"$gte": date_from, "$lt": first}})
+    if date_to is not None and end < as_utc(date_to):
+        groups += await day_groups(mongo.archived_records, {
+            "user_id": user_id, "date": {"$gte": end, "$lt": date_to}})
+    return groups
+
+
+async def refresh_rollups(user_id: str, days: Iterable[str]):
+    """
+    Recompute the rollups of the given UTC days (YYYY-MM-DD) from the
+    archived records. Recomputing rather than incrementing keeps the rollups
+    right even if archival is interrupted and rerun.
+    """
+    for day in sorted(set(days)):
+        start = datetime.combine(date.fromisoformat(day), time(), timezone.utc)
+        groups = await day_groups(mongo.archived_records, {
+            "user_id": user_id, "date": {"$gte": start, "$lt": start + timedelta(days=1)}})
+        operations = [DeleteMany({"user_id": user_id, "day": day})] + [
+            InsertOne({"user_id": user_id, "day": day, "currency": group["currency"],
+                       "type": group["type"], "category": group["category"],
+                       "amount_cents": group["amount_cents"]})
+            for group in groups
+        ]
+        try:
+            await mongo.archived_rollups.bulk_write(operations, ordered=True)
+        except BulkWriteError as e:
+            # A concurrent refresh of the same day wrote the same rollups.
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+                raise
+
+
+def utc_day(value: datetime) -> str:
+    return as_utc(value).strftime("%Y-%m-%d")
+
+
+# -------- Moving records between tiers --------
+
+async def archive_user_records(user_id: str, cutoff: datetime, batch_size: int = 1000) -> int:
+    """
+    Move a user's records dated and last updated before cutoff to the cold tier.
+
+    Returns:
+        int: The number of records archived.
+    """
+    candidates = {"user_id": user_id, "date": {"$lt": cutoff}, "updated_at": {"$lt": cutoff}}
+    if await mongo.records.find_one(candidates, {"_id": 1}) is None:
+        return 0
+    # Route reads to the cold tier before any record leaves the hot one.
+    await mongo.users.update_one({"_id": ObjectId(user_id)}, {"$max": {"archived_before": cutoff}})
+
+    archived = 0
+    while True:
+        batch = await mongo.records.find(candidates).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return archived
+        ids = [record["_id"] for record in batch]
+        try:
+            await mongo.archived_records.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Copied by an earlier run that was interrupted before deleting.
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+                raise
+        # Delete the hot records one by one to learn which ones this run
+        # moved: a record updated after it was read stays hot, and one the
+        # user deleted meanwhile is gone. Either way its copy is dropped, so
+        # a deleted record does not come back from the cold tier.
+        moved = set()
+        for record_id in ids:
+            if await mongo.records.find_one_and_delete(
+                    {"_id": record_id, "user_id": user_id, "updated_at": {"$lt": cutoff}},
+                    {"_id": 1}) is not None:
+                moved.add(record_id)
+        not_moved = [record_id for record_id in ids if record_id not in moved]
+        if not_moved:
+            await mongo.archived_records.delete_many({"_id": {"$in": not_moved}, "user_id": user_id})
+        await refresh_rollups(user_id, (utc_day(record["date"]) for record in batch))
+        archived += len(moved)
+
+
+async def archive_records(now: Optional[datetime] = None, batch_size: int = 1000) -> int:
+    """
+    Archive old records of every user.
+    """
+    cutoff = archive_cutoff(now)
+    archived = 0
+    async for user in mongo.users.find({}, {"_id": 1}):
+        archived += await archive_user_records(str(user["_id"]), cutoff, batch_size)
+    return archived
+
+
+async def restore_record(user_id: str, record_id: ObjectId) -> Optional[dict]:
+    """
+    Move an archived record back to the hot tier (before it is updated).
+
+    Returns:
+        Optional[dict]: The record, or None if the user has no such archived record.
+    """
+    record = await mongo.archived_records.find_one({"_id": record_id, "user_id": user_id})
+    if record is None:
+        return None
+    try:
+        await mongo.records.insert_one(record)
+    except DuplicateKeyError:
+        pass
+    await mongo.archived_records.delete_one({"_id": record_id, "user_id": user_id})
+    await refresh_rollups(user_id, [utc_day(record["date"])])
+    return record
+
+
+async def delete_archived_record(user_id: str, record_id: ObjectId) -> Optional[dict]:
+    record = await mongo.archived_records.find_one_and_delete({"_id": record_id, "user_id": user_id})
+    if record is not None:
+        await refresh_rollups(user_id, [utc_day(record["date"])])
+    return record
+
+
+class ArchiveScheduler:
+    """
+    Background task calling archive_records() every `interval` seconds.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                archived = await archive_records()
+                if archived:
+                    print(f"Archived {archived} records.")
+            except Exception as e:
+                print(f"Error archiving records: {e}")
+            await asyncio.sleep(self.interval)
+
+
+archive_scheduler = ArchiveScheduler(get_settings().archive_interval_seconds)
+
+
+if __name__ == "__main__":
+    async def main():
+        mongo.connect()
+        try:
+            print(f"Archived {await archive_records()} records.")
+        finally:
+            mongo.close()
+
+    asyncio.run(main())
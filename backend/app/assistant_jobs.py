@@ -0,0 +1,200 @@
+# app/assistant_jobs.py
+"""
+Personal assistant questions answered as background jobs.
+
+Submitting a question stores a job and queues its prompt; a fixed number of
+worker tasks per process call the LLM microservice, so slow generations
+hold neither a client connection nor more than `workers` threads. Jobs and
+their answers live in the assistant_jobs collection until expires_at, so a
+client can poll any API worker for the result.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.config import get_settings
+from app.database import mongo
+from app.http_client import get_http_session
+from app.metrics import ASSISTANT_JOB_QUEUE_LATENCY, timed
+
+# How often a waiting poll re-reads a job another process is running.
+JOB_POLL_INTERVAL_SECONDS = 0.5
+
+FINISHED_STATUSES = ("done", "failed")
+
+# The error of jobs cut short by the process stopping.
+RESTARTED_ERROR = "The server restarted. Please ask again."
+
+
+class AssistantQueueFull(Exception):
+    """
+    Raised when a job is submitted while the queue is at max_pending.
+    """
+
+
+def generate_answer(prompt: str) -> str:
+    """
+    Ask the LLM microservice for an answer. Blocking, for at most
+    llm_timeout_seconds per connection attempt and per read.
+    """
+    settings = get_settings()
+    with timed("llm"):
+        llm_response = get_http_session().post(
+            f"{settings.llm_service_url}/generate", json={"prompt": prompt},
+            timeout=settings.llm_timeout_seconds)
+    llm_response.raise_for_status()
+    return llm_response.json().get("response", "No response from AI.")
+
+
+class AssistantJobQueue:
+    """
+    Bounded queue of assistant jobs, run by `workers` background tasks.
+
+    Prompts are held in memory only: jobs still queued when the process
+    stops are marked failed, and the client submits them again.
+    """
+
+    def __init__(self, workers: int, max_pending: int, ttl_seconds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.running = 0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks = []
+        # Completion events of this process's jobs, for waiting polls.
+        self._finished: Dict[ObjectId, asyncio.Event] = {}
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        abandoned = []
+        while not self._queue.empty():
+            job_id, user_id, _, _ = self._queue.get_nowait()
+            abandoned.append(UpdateOne(
+                {"_id": job_id, "user_id": user_id},
+                {"$set": {"status": "failed", "error": RESTARTED_ERROR}}))
+            self._finished.pop(job_id, None)
+        if abandoned:
+            await mongo.assistant_jobs.bulk_write(abandoned, ordered=False)
+
+    def expires_at(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+
+    async def submit(self, user_id: str, prompt: str) -> dict:
+        """
+        Store a queued job for the prompt and hand it to the workers.
+
+        Returns:
+            dict: The job document.
+
+        Raises:
+            AssistantQueueFull: If max_pending jobs are already waiting.
+        """
+        if self._queue.full():
+            self.stats["rejected"] += 1
+            raise AssistantQueueFull()
+        job = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "status": "queued",
+            "created_at": datetime.now(timezone.utc),
+            "expires_at": self.expires_at(),
+        }
+        await mongo.assistant_jobs.insert_one(job)
+        try:
+            self._queue.put_nowait((job["_id"], user_id, prompt, time.perf_counter()))
+        except asyncio.QueueFull:
+            # Filled up while the job was being stored.
+            await mongo.assistant_jobs.delete_one({"_id": job["_id"], "user_id": user_id})
+            self.stats["rejected"] += 1
+            raise AssistantQueueFull()
+        self._finished[job["_id"]] = asyncio.Event()
+        self.stats["submitted"] += 1
+        return job
+
+    async def get(self, user_id: str, job_id: ObjectId, wait: float = 0) -> Optional[dict]:
+        """
+        The user's job, waiting up to `wait` seconds for it to finish.
+
+        Returns:
+            Optional[dict]: The job document, or None if the user has no such job.
+        """
+        deadline = time.perf_counter() + wait
+        while True:
+            job = await mongo.assistant_jobs.find_one({"_id": job_id, "user_id": user_id})
+            remaining = deadline - time.perf_counter()
+            if job is None or job["status"] in FINISHED_STATUSES or remaining <= 0:
+                return job
+            finished = self._finished.get(job_id)
+            try:
+                if finished is not None:
+                    await asyncio.wait_for(finished.wait(), remaining)
+                else:
+                    # Run by another process: poll.
+                    await asyncio.sleep(min(JOB_POLL_INTERVAL_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self):
+        while True:
+            job_id, user_id, prompt, queued_at = await self._queue.get()
+            ASSISTANT_JOB_QUEUE_LATENCY.observe((), time.perf_counter() - queued_at)
+            self.running += 1
+            try:
+                await self._run(job_id, user_id, prompt)
+            except Exception as e:
+                print(f"Error running assistant job {job_id}: {e}")
+            finally:
+                self.running -= 1
+                finished = self._finished.pop(job_id, None)
+                if finished is not None:
+                    finished.set()
+                self._queue.task_done()
+
+    async def _run(self, job_id: ObjectId, user_id: str, prompt: str):
+        job_filter = {"_id": job_id, "user_id": user_id}
+        await mongo.assistant_jobs.update_one(
+            job_filter, {"$set": {"status": "running", "started_at": datetime.now(timezone.utc)}})
+        try:
+            response = await asyncio.to_thread(generate_answer, prompt)
+            result = {"status": "done", "response": response}
+            self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            # Stopped mid-generation: don't leave the job "running" until it expires.
+            self.stats["failed"] += 1
+            await mongo.assistant_jobs.update_one(job_filter, {"$set": {
+                "status": "failed", "error": RESTARTED_ERROR,
+                "finished_at": datetime.now(timezone.utc), "expires_at": self.expires_at()}})
+            raise
+        except Exception as e:
+            result = {"status": "failed", "error": f"Error calling LLM microservice: {str(e)}"}
+            self.stats["failed"] += 1
+        await mongo.assistant_jobs.update_one(job_filter, {"$set": {
+            **result, "finished_at": datetime.now(timezone.utc), "expires_at": self.expires_at()}})
+
+
+assistant_jobs = AssistantJobQueue(
+    workers=get_settings().assistant_job_workers,
+    max_pending=get_settings().assistant_job_max_pending,
+    ttl_seconds=get_settings().assistant_job_ttl_seconds,
+)
@@ -0,0 +1,287 @@
+# app/attachments.py
+"""
+Attachment contents (receipts, invoices, ...) and their thumbnails.
+
+Contents are stored once per distinct content: attachment_blobs maps the
+SHA-256 of a file to where its bytes are stored, how many attachments
+use it and, once requested, its thumbnail. Each attachment document
+(attachments collection) points at a blob by hash, and the record only
+carries the attachments' metadata, so listings never touch the contents.
+
+Uploads and downloads are streamed in attachment_chunk_bytes pieces; a
+file is never held in memory whole. The bytes live in a GridFS bucket
+(ATTACHMENT_STORAGE=gridfs) or under ATTACHMENT_DIR (filesystem).
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.config import get_settings
+from app.database import mongo
+
+GRIDFS_BUCKET = "attachment_files"
+
+# Content types a thumbnail is made for.
+THUMBNAIL_CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+
+# Images are copied to a temporary file for decoding; up to this many
+# bytes of it are kept in memory.
+THUMBNAIL_SPOOL_BYTES = 1024 * 1024
+
+
+class AttachmentTooLarge(Exception):
+    """
+    Raised while uploading a file larger than attachment_max_bytes.
+    """
+
+
+class GridFSStorage:
+    """
+    Files stored in a GridFS bucket, as chunk documents in MongoDB.
+    Locations are the GridFS file ids.
+    """
+
+    def __init__(self, chunk_bytes: int):
+        self.chunk_bytes = chunk_bytes
+
+    def bucket(self):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+        return AsyncIOMotorGridFSBucket(mongo.db, bucket_name=GRIDFS_BUCKET,
+                                        chunk_size_bytes=self.chunk_bytes)
+
+    async def save(self, chunks: AsyncIterator[bytes]) -> str:
+        file_id = ObjectId()
+        grid_in = self.bucket().open_upload_stream_with_id(file_id, str(file_id))
+        try:
+            async for chunk in chunks:
+                await grid_in.write(chunk)
+        except BaseException:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+        return str(file_id)
+
+    async def open(self, location: str) -> AsyncIterator[bytes]:
+        grid_out = await self.bucket().open_download_stream(ObjectId(location))
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+
+    async def delete(self, location: str):
+        from gridfs.errors import NoFile
+        try:
+            await self.bucket().delete(ObjectId(location))
+        except NoFile:
+            pass
+
+
+class FileSystemStorage:
+    """
+    Files stored under a local directory. Locations are random names, so
+    a blob being deleted never shares a path with one being uploaded.
+    """
+
+    def __init__(self, root: str, chunk_bytes: int):
+        self.root = root
+        self.chunk_bytes = chunk_bytes
+
+    def path(self, location: str) -> str:
+        return os.path.join(self.root, location[:2], location)
+
+    async def save(self, chunks: AsyncIterator[bytes]) -> str:
+        location = uuid.uuid4().hex
+        path = self.path(location)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        file = await asyncio.to_thread(open, path, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(file.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(file.close)
+            await self.delete(location)
+            raise
+        await asyncio.to_thread(file.close)
+        return location
+
+    async def open(self, location: str) -> AsyncIterator[bytes]:
+        file = await asyncio.to_thread(open, self.path(location), "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(file.read, self.chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await asyncio.to_thread(file.close)
+
+    async def delete(self, location: str):
+        try:
+            await asyncio.to_thread(os.remove, self.path(location))
+        except FileNotFoundError:
+            pass
+
+
+def get_attachment_storage():
+    """
+    The storage selected by ATTACHMENT_STORAGE ("gridfs" or "filesystem").
+    """
+    settings = get_settings()
+    if settings.attachment_storage == "filesystem":
+        return FileSystemStorage(settings.attachment_dir, settings.attachment_chunk_bytes)
+    return GridFSStorage(settings.attachment_chunk_bytes)
+
+
+async def single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def store_blob(chunks: AsyncIterator[bytes], max_bytes: int) -> dict:
+    """
+    Store a stream of bytes, sharing the stored copy of identical content.
+
+    The content is hashed as it is written. If a blob with the same hash
+    exists, it gains a reference and the copy just written is deleted.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The content.
+        max_bytes (int): The largest content accepted.
+
+    Returns:
+        dict: The attachment_blobs document, with "size".
+
+    Raises:
+        AttachmentTooLarge: If the content exceeds max_bytes; nothing is kept.
+    """
+    digest = hashlib.sha256()
+    size = 0
+
+    async def hashed():
+        nonlocal size
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > max_bytes:
+                raise AttachmentTooLarge()
+            digest.update(chunk)
+            yield chunk
+
+    storage = get_attachment_storage()
+    location = await storage.save(hashed())
+    blob = await mongo.attachment_blobs.find_one_and_update(
+        {"_id": digest.hexdigest()},
+        {"$inc": {"refs": 1},
+         "$setOnInsert": {"location": location, "size": size, "created_at": datetime.now(timezone.utc)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    if blob["location"] != location:
+        # Already stored.
+        await storage.delete(location)
+    return blob
+
+
+async def release_blob(sha256: str):
+    """
+    Drop one reference to a blob, deleting its contents and thumbnail
+    with the last one.
+    """
+    blob = await mongo.attachment_blobs.find_one_and_update(
+        {"_id": sha256}, {"$inc": {"refs": -1}}, return_document=ReturnDocument.AFTER)
+    if blob is None or blob["refs"] > 0:
+        return
+    # An upload of the same content may have taken a reference meanwhile.
+    result = await mongo.attachment_blobs.delete_one({"_id": sha256, "refs": {"$lte": 0}})
+    if result.deleted_count:
+        storage = get_attachment_storage()
+        await storage.delete(blob["location"])
+        if blob.get("thumbnail"):
+            await storage.delete(blob["thumbnail"])
+
+
+async def release_record_attachments(record: dict):
+    """
+    Delete the attachments of a deleted record.
+    """
+    if not record.get("attachments"):
+        return
+    query_filter = {"user_id": record["user_id"], "record_id": str(record["_id"])}
+    attachments = await mongo.attachments.find(query_filter, {"sha256": 1}).to_list(length=None)
+    await mongo.attachments.delete_many(query_filter)
+    for attachment in attachments:
+        await release_blob(attachment["sha256"])
+
+
+def make_thumbnail(source, size: int, max_pixels: int) -> Optional[bytes]:
+    """
+    A JPEG at most size x size pixels of an image file. Blocking.
+
+    Only the image header is read before the size check, so an image of
+    more than max_pixels pixels (e.g. a small PNG of huge dimensions) is
+    never decoded.
+
+    Returns:
+        Optional[bytes]: The thumbnail, or None if Pillow is not installed,
+            the file is not an image it can read or it is too large.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    try:
+        with Image.open(source) as image:
+            # JPEGs are decoded at a reduced scale straight away.
+            image.draft("RGB", (size, size))
+            width, height = image.size
+            if width * height > max_pixels:
+                return None
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            output = io.BytesIO()
+            image.convert("RGB").save(output, format="JPEG", quality=80)
+            return output.getvalue()
+    except Exception:
+        return None
+
+
+async def get_thumbnail_location(blob: dict) -> Optional[str]:
+    """
+    Where the blob's thumbnail is stored, making it on first use.
+
+    Returns:
+        Optional[str]: The thumbnail's location, or None if none can be made.
+    """
+    if blob.get("thumbnail"):
+        return blob["thumbnail"]
+    storage = get_attachment_storage()
+    # Copy the image to a temporary file (kept in memory only while small),
+    # which Pillow can seek in.
+    with tempfile.SpooledTemporaryFile(max_size=THUMBNAIL_SPOOL_BYTES) as source:
+        async for chunk in storage.open(blob["location"]):
+            await asyncio.to_thread(source.write, chunk)
+        await asyncio.to_thread(source.seek, 0)
+        settings = get_settings()
+        thumbnail = await asyncio.to_thread(make_thumbnail, source, settings.attachment_thumbnail_size,
+                                            settings.attachment_thumbnail_max_pixels)
+    if thumbnail is None:
+        return None
+    location = await storage.save(single_chunk(thumbnail))
+    result = await mongo.attachment_blobs.update_one(
+        {"_id": blob["_id"], "thumbnail": {"$exists": False}}, {"$set": {"thumbnail": location}})
+    if result.modified_count:
+        return location
+    # Made by another request meanwhile, or the blob is gone.
+    await storage.delete(location)
+    blob = await mongo.attachment_blobs.find_one({"_id": blob["_id"]})
+    return blob.get("thumbnail") if blob else None
@@ -1,18 +1,31 @@
 # app/auth.py
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Header, Request
 from fastapi.security import OAuth2PasswordBearer
+from typing import Optional
 from app.utils import decode_access_token
-from app.database import users_collection
+from app.database import mongo
+from app.config import get_settings
 from bson import ObjectId
+import hmac
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/signin")
 
+# ASGI scope key under which POST /batch/ hands the user it authenticated
+# to its sub-requests. Only set in-process; clients cannot reach the scope.
+RESOLVED_USER_SCOPE_KEY = "app.current_user"
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
     """
     Dependency to get the current user based on JWT token.
+
+    Sub-requests of a batch reuse the user the batch request resolved.
     """
+    user = request.scope.get(RESOLVED_USER_SCOPE_KEY)
+    if user is not None:
+        return user
+
     try:
         payload = decode_access_token(token)
         user_id: str = payload.get("sub")
@@ -29,7 +42,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+    user = await mongo.users.find_one({"_id": ObjectId(user_id)})
     if user is None:
         raise HTTPException(
             status_code=401,
@@ -38,3 +51,22 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         )
 
     return user
+
+
+def is_admin_key(key: Optional[str]) -> bool:
+    """
+    Check a key against the configured ADMIN_API_KEY in constant time.
+    """
+    admin_api_key = get_settings().admin_api_key
+    return bool(admin_api_key and key and hmac.compare_digest(key, admin_api_key))
+
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """
+    Dependency for operational endpoints. They answer 404 when no
+    ADMIN_API_KEY is configured, so they are invisible by default.
+    """
+    if not get_settings().admin_api_key:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_key(x_admin_key):
+        raise HTTPException(status_code=403, detail="Admin key required.")
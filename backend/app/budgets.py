@@ -0,0 +1,222 @@
+# app/budgets.py
+
+import re
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.config import get_settings
+from app.currency import convert_record_cents
+from app.money import from_cents
+from app.database import mongo
+from app.notifications import email_queue
+
+# Fractions of a budget's limit at which the user is emailed, unless the
+# budget sets its own.
+DEFAULT_ALERT_THRESHOLDS = [0.8, 1.0]
+
+SpendKey = Tuple[str, str, str]  # (user_id, category_key, month)
+
+# Times recompute_spend rescans when spend is written during its scan.
+RECOMPUTE_ATTEMPTS = 3
+
+
+def category_key(category: str) -> str:
+    """
+    The key budgets and spend totals match a category on. Record listings
+    match categories case-insensitively, so "groceries" and "Groceries"
+    count towards the same budget.
+    """
+    return category.strip().lower()
+
+
+def month_key(value: datetime) -> str:
+    """
+    The calendar month (UTC) a record's spend counts towards, e.g. "2024-01".
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def spend_deltas(records: Iterable[dict], sign: int = 1) -> Dict[SpendKey, int]:
+    """
+    Sum expense amounts per (user_id, category_key, month), in cents of the
+    base currency. Income is ignored.
+    """
+    expenses = [record for record in records if record.get("type") == "expense"]
+    if not expenses:
+        return {}
+    cents = convert_record_cents(expenses, get_settings().base_currency)
+    deltas: Dict[SpendKey, int] = defaultdict(int)
+    for record, amount in zip(expenses, cents.tolist()):
+        key = (record["user_id"], category_key(record["category"]), month_key(record["date"]))
+        deltas[key] += sign * amount
+    return deltas
+
+
+async def apply_spend_deltas(deltas: Dict[SpendKey, int]):
+    """
+    Add the deltas to the monthly spend totals with one bulk $inc, then
+    queue alerts for budgets that crossed a threshold. Each write bumps the
+    total's version, which recompute_spend checks before replacing it.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    await mongo.budget_spend.bulk_write([
+        UpdateOne({"user_id": user_id, "category": category, "month": month},
+                  {"$inc": {"spent_cents": delta, "version": 1}}, upsert=True)
+        for (user_id, category, month), delta in deltas.items()
+    ], ordered=False)
+    increased = [key for key, delta in deltas.items() if delta > 0]
+    if increased:
+        await check_budget_alerts(increased)
+
+
+async def check_budget_alerts(keys: List[SpendKey]):
+    """
+    Email users whose spend in a budgeted category just crossed one of the
+    budget's thresholds. Each threshold alerts once per month: it is recorded
+    in the spend document with a conditional $addToSet, so concurrent
+    writers cannot both send it.
+    """
+    budgets = {}
+    # A user has a handful of budgets; match their categories by key here.
+    async for budget in mongo.budgets.find({"user_id": {"$in": list({user_id for user_id, _, _ in keys})}}):
+        budgets[(budget["user_id"], category_key(budget["category"]))] = budget
+    if not budgets:
+        return
+
+    alerts = []
+    for user_id, category, month in keys:
+        budget = budgets.get((user_id, category))
+        if budget is None:
+            continue
+        spend = await mongo.budget_spend.find_one(
+            {"user_id": user_id, "category": category, "month": month})
+        if spend is None:
+            continue
+        utilization = spend["spent_cents"] / budget["limit_cents"]
+        crossed = [t for t in budget.get("alert_thresholds", DEFAULT_ALERT_THRESHOLDS)
+                   if utilization >= t and t not in spend.get("alerted", [])]
+        for threshold in crossed:
+            result = await mongo.budget_spend.update_one(
+                {"_id": spend["_id"], "user_id": user_id, "alerted": {"$ne": threshold}},
+                {"$addToSet": {"alerted": threshold}})
+            if result.modified_count:
+                alerts.append((user_id, budget["category"], month, threshold,
+                               from_cents(spend["spent_cents"]), from_cents(budget["limit_cents"])))
+
+    for user_id, category, month, threshold, spent, limit in alerts:
+        await queue_budget_alert(user_id, category, month, threshold, spent, limit)
+
+
+async def queue_budget_alert(user_id: str, category: str, month: str,
+                             threshold: float, spent: float, limit: float):
+    user = await mongo.users.find_one({"_id": ObjectId(user_id)}, {"email": 1, "username": 1})
+    if not user:
+        return
+    subject = f"Budget alert: {category} at {threshold:.0%}"
+    content = (f"Hi {user.get('username', '')},\n\n"
+               f"Your {category} spending for {month} is {spent:.2f} "
+               f"of your {limit:.2f} budget ({spent / limit:.0%}).")
+    email_queue.submit(user["email"], subject, content)
+
+
+async def track_created_records(records: List[dict]):
+    """
+    Count newly stored records towards their month's spend. Tracking
+    failures are logged rather than raised: the records are already stored.
+    """
+    try:
+        await apply_spend_deltas(spend_deltas(records))
+    except Exception as e:
+        print(f"Error updating budget spend: {e}")
+
+
+async def track_updated_record(before: dict, after: dict):
+    """
+    Move a record's contribution from its old amount/category/type to the new one.
+    """
+    deltas = spend_deltas([before], sign=-1)
+    for key, delta in spend_deltas([after]).items():
+        deltas[key] = deltas.get(key, 0) + delta
+    try:
+        await apply_spend_deltas(deltas)
+    except Exception as e:
+        print(f"Error updating budget spend: {e}")
+
+
+async def track_deleted_record(record: dict):
+    try:
+        await apply_spend_deltas(spend_deltas([record], sign=-1))
+    except Exception as e:
+        print(f"Error updating budget spend: {e}")
+
+
+async def sum_month_spend(user_id: str, category: str, month: str) -> int:
+    """
+    The user's expenses in a category (matched by key) over a month, in
+    cents of the base currency. Amounts are summed per currency and day in
+    the database and the totals converted to the base currency.
+    """
+    year, month_number = int(month[:4]), int(month[5:])
+    start = datetime(year, month_number, 1, tzinfo=timezone.utc)
+    end = datetime(year + month_number // 12, month_number % 12 + 1, 1, tzinfo=timezone.utc)
+    pipeline = [
+        {"$match": {"user_id": user_id, "type": "expense", "date": {"$gte": start, "$lt": end},
+                    "category": {"$regex": f"^\\s*{re.escape(category_key(category))}\\s*$", "$options": "i"}}},
+        {"$group": {
+            "_id": {"currency": "$currency",
+                    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}},
+            "amount_cents": {"$sum": "$amount_cents"},
+        }},
+    ]
+    groups = []
+    async for row in mongo.records.aggregate(pipeline):
+        groups.append({"currency": row["_id"].get("currency"),
+                       "date": date.fromisoformat(row["_id"]["day"]),
+                       "amount_cents": row["amount_cents"]})
+    return int(convert_record_cents(groups, get_settings().base_currency).sum())
+
+
+async def recompute_spend(user_id: str, category: str, month: Optional[str] = None) -> int:
+    """
+    Rebuild one spend total from the records, e.g. for records written
+    before spend tracking existed.
+
+    The scanned total replaces the stored one only if no $inc landed
+    during the scan (the total's version is unchanged); otherwise the scan
+    is repeated, up to RECOMPUTE_ATTEMPTS times, after which the tracked
+    total is kept.
+
+    Returns:
+        int: The spend total, in cents.
+    """
+    month = month or month_key(datetime.now(timezone.utc))
+    spend_filter = {"user_id": user_id, "category": category_key(category), "month": month}
+    for _ in range(RECOMPUTE_ATTEMPTS):
+        current = await mongo.budget_spend.find_one(spend_filter, {"spent_cents": 1, "version": 1})
+        spent = await sum_month_spend(user_id, category, month)
+        if current is None:
+            try:
+                await mongo.budget_spend.insert_one({**spend_filter, "spent_cents": spent, "version": 1})
+                return spent
+            except DuplicateKeyError:
+                # Created by a concurrent $inc.
+                continue
+        version = current.get("version")
+        result = await mongo.budget_spend.update_one(
+            {"_id": current["_id"], "user_id": user_id,
+             "version": {"$exists": False} if version is None else version},
+            {"$set": {"spent_cents": spent}, "$inc": {"version": 1}})
+        if result.modified_count:
+            return spent
+    print(f"Spend of {user_id}/{category}/{month} kept changing; keeping the tracked total.")
+    current = await mongo.budget_spend.find_one(spend_filter, {"spent_cents": 1})
+    return current["spent_cents"] if current else 0
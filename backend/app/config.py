@@ -0,0 +1,128 @@
+# app/config.py
+
+from functools import lru_cache
+from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """
+    Backend configuration, read from the environment and the .env file.
+
+    Field names map to upper-case environment variables (mongo_uri -> MONGO_URI).
+    """
+
+    model_config = SettingsConfigDict(
+        env_file=".env", extra="ignore", str_strip_whitespace=True)
+
+    # -------- Database --------
+    mongo_uri: Optional[str] = None
+    mongo_database: str = "personal_finance_db"
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: int = 60000
+    mongo_wait_queue_timeout_ms: Optional[int] = None
+    # zlib ships with Python; snappy and zstd need python-snappy/zstandard.
+    mongo_compressors: str = "zlib"
+    mongo_listing_read_preference: str = "primary"
+
+    # -------- Auth --------
+    secret_key: Optional[str] = None
+    algorithm: str = "HS256"
+    access_token_expire_minutes: int = 30
+    refresh_token_expire_minutes: int = 1440
+    reset_token_expire_minutes: int = 30
+
+    # -------- Records --------
+    idempotency_key_ttl_seconds: int = 24 * 60 * 60
+    # Deletions are reported to syncing clients for this long; clients that
+    # have not synced since must resync in full.
+    record_tombstone_ttl_seconds: int = 30 * 24 * 60 * 60
+    record_write_buffer_enabled: bool = False
+    record_write_buffer_batch_size: int = 500
+    record_write_buffer_flush_ms: int = 50
+    record_write_buffer_max_pending: int = 10000
+    recurring_scheduler_enabled: bool = True
+    recurring_scheduler_interval_seconds: int = 60
+    recurring_max_templates_per_user: int = 100
+    # Move records older than archive_after_days to the cold tier (app.archive).
+    archive_enabled: bool = False
+    archive_after_days: int = 730
+    archive_interval_seconds: int = 6 * 60 * 60
+
+    # -------- Attachments --------
+    # "gridfs" (in MongoDB, shared by all workers) or "filesystem" (under
+    # attachment_dir, which must then be shared by all workers).
+    attachment_storage: str = "gridfs"
+    attachment_dir: str = "attachments"
+    attachment_max_bytes: int = 20 * 1024 * 1024
+    attachment_max_per_record: int = 10
+    # Size of the chunks files are stored and streamed in.
+    attachment_chunk_bytes: int = 255 * 1024
+    attachment_thumbnail_size: int = 256
+    # Images with more pixels (after JPEG draft scaling) get no thumbnail;
+    # decoding one takes about 4 bytes per pixel of worker memory.
+    attachment_thumbnail_max_pixels: int = 16_000_000
+
+    # -------- Currency --------
+    # Currency budgets, summaries and projections are reported in.
+    base_currency: str = "USD"
+    # CSV of date,currency,rate rows quoted in base_currency; defaults to
+    # app/data/exchange_rates.csv (quoted in USD).
+    exchange_rates_file: Optional[str] = None
+
+    # -------- Analytics --------
+    # Per-user record frames kept in memory, and how long another worker's
+    # writes can go unseen by this one.
+    analytics_cache_max_users: int = 256
+    analytics_cache_ttl_seconds: int = 300
+
+    # -------- Search --------
+    # Per-user inverted indexes kept in memory (roughly 50 MB per 100k
+    # records); writes in this worker update them in place.
+    search_index_max_users: int = 64
+    search_index_ttl_seconds: int = 300
+
+    # -------- Microservices --------
+    email_service_url: str = "http://email_microservice:9002"
+    sender_email: str = "default@example.com"
+    contact_recipient_email: Optional[str] = None
+    llm_service_url: str = "http://llm_microservice:9000"
+    # Seconds to wait for the LLM microservice to connect or answer; a job
+    # whose call times out is marked failed.
+    llm_timeout_seconds: float = 120
+
+    # -------- Operations --------
+    # Guards /admin/* and per-request profiling; those are disabled when unset.
+    admin_api_key: Optional[str] = None
+
+    # -------- Responses --------
+    # Bodies smaller than this are sent uncompressed (app.responses).
+    compression_min_size: int = 1024
+    compression_gzip_level: int = 6
+    # Brotli 4 and zstd 3 compress about as fast as gzip 6, and smaller.
+    compression_brotli_quality: int = 4
+    compression_zstd_level: int = 3
+
+    # -------- Rate limiting and load shedding --------
+    rate_limit_enabled: bool = True
+    # "memory" (per worker) or "mongo" (shared by all workers).
+    rate_limit_backend: str = "memory"
+    password_hashing_max_concurrency: int = 8
+    assistant_max_concurrency: int = 8
+
+    # -------- Personal assistant jobs --------
+    # LLM calls running at once per worker process; more jobs wait in the queue.
+    assistant_job_workers: int = 4
+    # Jobs queued beyond this are rejected with 503.
+    assistant_job_max_pending: int = 100
+    # How long a job and its answer are kept after submission or completion.
+    assistant_job_ttl_seconds: int = 3600
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """
+    Load the settings once per process.
+    """
+    return Settings()
@@ -6,7 +6,8 @@ import warnings
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
 from app.main import app
-from app.database import users_collection, records_collection
+from app.database import mongo, ensure_indexes
+from app.config import get_settings
 
 created_test_emails = []
 
@@ -26,11 +27,21 @@ def anyio_backend():
 
 @pytest_asyncio.fixture(scope="function")
 async def async_client():
+    # ASGITransport does not run the app lifespan, so build the indexes here;
+    # the Idempotency-Key unique constraint depends on them.
+    await ensure_indexes()
     transport = ASGITransport(app=app)
     async with AsyncClient(base_url="http://testserver", transport=transport) as client:
         yield client
 
 
+@pytest.fixture(scope="session", autouse=True)
+def disable_rate_limits():
+    # The suite signs up many users from one client address; tests that
+    # exercise the limits turn them back on explicitly.
+    get_settings().rate_limit_enabled = False
+
+
 @pytest.fixture(autouse=True)
 def ignore_warnings():
     warnings.filterwarnings("ignore")
@@ -42,7 +53,16 @@ async def cleanup_test_data():
     yield
     # After tests complete, delete each test user and their records
     for email in created_test_emails:
-        user = await users_collection.find_one({"email": email})
+        user = await mongo.users.find_one({"email": email})
         if user:
-            await users_collection.delete_one({"_id": user["_id"]})
-            await records_collection.delete_many({"user_id": str(user["_id"])})
+            await mongo.users.delete_one({"_id": user["_id"]})
+            await mongo.user_emails.delete_many({"user_id": user["_id"]})
+            await mongo.records.delete_many({"user_id": str(user["_id"])})
+            await mongo.attachments.delete_many({"user_id": str(user["_id"])})
+            await mongo.record_tombstones.delete_many({"user_id": str(user["_id"])})
+            await mongo.archived_records.delete_many({"user_id": str(user["_id"])})
+            await mongo.archived_rollups.delete_many({"user_id": str(user["_id"])})
+            await mongo.recurring_records.delete_many({"user_id": str(user["_id"])})
+            await mongo.budgets.delete_many({"user_id": str(user["_id"])})
+            await mongo.budget_spend.delete_many({"user_id": str(user["_id"])})
+            await mongo.assistant_jobs.delete_many({"user_id": str(user["_id"])})
@@ -0,0 +1,163 @@
+# app/currency.py
+
+import csv
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.config import get_settings
+from app.money import record_cents, round_cents
+
+DEFAULT_RATES_FILE = Path(__file__).parent / "data" / "exchange_rates.csv"
+
+
+class UnknownCurrencyError(ValueError):
+    """
+    Raised for a currency the exchange-rate table has no rates for.
+    """
+
+
+def day_number(value: Union[date, datetime]) -> int:
+    """
+    Days since 0001-01-01 (date.toordinal()), the table's date index.
+    """
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+
+class ExchangeRateTable:
+    """
+    Date-indexed exchange rates, held in memory as one sorted NumPy array of
+    days and one of rates per currency.
+
+    A rate is the value of one unit of the currency in the base currency.
+    Conversions use the latest rate on or before the amount's date, or the
+    earliest known rate for dates before the table starts.
+    """
+
+    def __init__(self, base_currency: str, rows: Iterable[tuple]):
+        self.base_currency = base_currency
+        by_currency: Dict[str, List[tuple]] = {}
+        for day, currency, rate in rows:
+            by_currency.setdefault(currency, []).append((day_number(day), float(rate)))
+        self._days: Dict[str, np.ndarray] = {}
+        self._rates: Dict[str, np.ndarray] = {}
+        for currency, entries in by_currency.items():
+            entries.sort()
+            self._days[currency] = np.array([day for day, _ in entries], dtype=np.int64)
+            self._rates[currency] = np.array([rate for _, rate in entries], dtype=np.float64)
+
+    @property
+    def currencies(self) -> List[str]:
+        return sorted({self.base_currency, *self._days})
+
+    def supports(self, currency: str) -> bool:
+        return currency == self.base_currency or currency in self._days
+
+    def rates_to_base(self, currency: str, days: np.ndarray) -> np.ndarray:
+        """
+        Rates converting `currency` to the base currency on each of `days`.
+        """
+        if currency == self.base_currency:
+            return np.ones(len(days), dtype=np.float64)
+        if currency not in self._days:
+            raise UnknownCurrencyError(f"No exchange rates for currency: {currency}")
+        index = np.searchsorted(self._days[currency], days, side="right") - 1
+        return self._rates[currency][np.clip(index, 0, None)]
+
+    def convert(self, amounts: Sequence[float], currencies: Sequence[str],
+                dates: Sequence[Union[date, datetime]], target: str) -> np.ndarray:
+        """
+        Convert many amounts to `target` at their own dates' rates.
+
+        Lookups are done once per distinct currency over all of its amounts
+        rather than once per amount.
+
+        Returns:
+            np.ndarray: The converted amounts, in input order.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        currencies = np.asarray(currencies, dtype=object)
+        days = np.fromiter((day_number(d) for d in dates), dtype=np.int64, count=len(amounts))
+
+        converted = np.empty_like(amounts)
+        for currency in set(currencies.tolist()):
+            mask = currencies == currency
+            if currency == target:
+                converted[mask] = amounts[mask]
+                continue
+            in_base = amounts[mask] * self.rates_to_base(currency, days[mask])
+            if target != self.base_currency:
+                in_base = in_base / self.rates_to_base(target, days[mask])
+            converted[mask] = in_base
+        return converted
+
+    def convert_one(self, amount: float, currency: str, on: Union[date, datetime],
+                    target: str) -> float:
+        return float(self.convert([amount], [currency], [on], target)[0])
+
+
+def convert_record_cents(records: Sequence[dict], target: str,
+                         table: Optional[ExchangeRateTable] = None) -> np.ndarray:
+    """
+    Convert the amounts of many record-like documents (amount_cents,
+    currency, date) to whole cents of `target` in one pass. Documents
+    without a currency are in the base currency. Amounts already in
+    `target` are returned unchanged.
+
+    Returns:
+        np.ndarray: int64 cents, in input order.
+    """
+    table = table or get_exchange_rates()
+    converted = table.convert(
+        [record_cents(record) for record in records],
+        [record.get("currency") or table.base_currency for record in records],
+        [record["date"] for record in records],
+        target,
+    )
+    return round_cents(converted)
+
+
+def load_exchange_rates(path: Union[str, Path], base_currency: str) -> ExchangeRateTable:
+    """
+    Read a CSV of date,currency,rate rows. Lines starting with # are
+    comments, except a "# base: <currency>" line stating the currency the
+    rates are quoted in; without one, they are taken to be in base_currency.
+
+    Args:
+        path (Union[str, Path]): The rates file.
+        base_currency (str): The currency the rates are quoted in.
+
+    Returns:
+        ExchangeRateTable: The loaded table.
+
+    Raises:
+        ValueError: If the file states another quote currency than base_currency.
+    """
+    with open(path, newline="") as f:
+        lines = f.readlines()
+    comments = [line.lstrip("#").partition(":") for line in lines if line.startswith("#")]
+    for key, _, value in comments:
+        if key.strip().lower() == "base" and value.strip().upper() != base_currency:
+            raise ValueError(f"The exchange rates in {path} are quoted in {value.strip().upper()}, "
+                             f"not BASE_CURRENCY ({base_currency}).")
+    rows = []
+    reader = csv.DictReader(line for line in lines if not line.startswith("#"))
+    for row in reader:
+        rows.append((date.fromisoformat(row["date"]), row["currency"].strip().upper(),
+                     float(row["rate"])))
+    return ExchangeRateTable(base_currency, rows)
+
+
+@lru_cache
+def get_exchange_rates() -> ExchangeRateTable:
+    """
+    The exchange-rate table from EXCHANGE_RATES_FILE, loaded once per process.
+    """
+    settings = get_settings()
+    return load_exchange_rates(
+        settings.exchange_rates_file or DEFAULT_RATES_FILE, settings.base_currency)
@@ -1,24 +1,393 @@
 # app/database.py
 
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReadPreference, monitoring
+from pymongo.errors import CollectionInvalid
 from pymongo.server_api import ServerApi
-import os
-from dotenv import load_dotenv
+from typing import Optional, TYPE_CHECKING
+import threading
+from app.config import Settings, get_settings
+from app.metrics import MongoCommandTimer
 
-load_dotenv()
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient
 
 
-def get_database():
-    uri = os.getenv("MONGO_URI")
-    if not uri:
-        raise ValueError("MONGO_URI environment variable is not set.")
-    client = AsyncIOMotorClient(uri, server_api=ServerApi("1"))
-    return client.get_database("personal_finance_db")
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Track connection pool usage from pymongo's pool events.
 
+    Events fire on driver threads, so counters are updated under a lock.
+    """
 
-# Then retrieve your specific collections from the database:
-db = get_database()
-users_collection = db.get_collection("users")
-records_collection = db.get_collection("records")
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "connections_in_use": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "pool_clears": 0,
+        }
 
+    def _add(self, name: str, delta: int = 1):
+        with self._lock:
+            self.counters[name] += delta
 
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add("pool_clears")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._add("checkouts")
+        self._add("connections_in_use")
+
+    def connection_checked_in(self, event):
+        self._add("connections_in_use", -1)
+
+
+def mongo_client_options(settings: Settings) -> dict:
+    """
+    Build AsyncIOMotorClient keyword arguments from the settings.
+
+    Args:
+        settings (Settings): The backend settings.
+
+    Returns:
+        dict: Pool sizing, wait queue timeout and wire compression settings.
+    """
+    options = {
+        "maxPoolSize": settings.mongo_max_pool_size,
+        "minPoolSize": settings.mongo_min_pool_size,
+        "maxIdleTimeMS": settings.mongo_max_idle_time_ms,
+        "compressors": settings.mongo_compressors,
+    }
+    if settings.mongo_wait_queue_timeout_ms:
+        options["waitQueueTimeoutMS"] = settings.mongo_wait_queue_timeout_ms
+    return options
+
+
+def read_preferences(mode: str):
+    """
+    Map a read preference name (e.g. "secondaryPreferred") to a pymongo object.
+    """
+    modes = {
+        "primary": ReadPreference.PRIMARY,
+        "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+        "secondary": ReadPreference.SECONDARY,
+        "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+        "nearest": ReadPreference.NEAREST,
+    }
+    if mode not in modes:
+        raise ValueError(f"Unknown read preference: {mode}")
+    return modes[mode]
+
+
+class MongoClientManager:
+    """
+    Own the process-wide AsyncIOMotorClient.
+
+    The client is created on connect() (called from the FastAPI lifespan) or
+    on first use, and is shared by every router until close(). Nothing is
+    created at import time, so the app can be imported without a database.
+    """
+
+    def __init__(self):
+        self.pool_metrics = PoolMetrics()
+        self._client: Optional["AsyncIOMotorClient"] = None
+
+    def connect(self) -> "AsyncIOMotorClient":
+        if self._client is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+
+            settings = get_settings()
+            if not settings.mongo_uri:
+                raise ValueError("MONGO_URI environment variable is not set.")
+            self._client = AsyncIOMotorClient(
+                settings.mongo_uri,
+                server_api=ServerApi("1"),
+                event_listeners=[self.pool_metrics, MongoCommandTimer()],
+                **mongo_client_options(settings),
+            )
+        return self._client
+
+    def use_client(self, client):
+        """
+        Install an already-built client, e.g. an in-memory stand-in used by
+        the benchmark suite.
+        """
+        self.close()
+        self._client = client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    @property
+    def db(self):
+        return self.connect().get_database(get_settings().mongo_database)
+
+    @property
+    def users(self):
+        return self.db.get_collection("users")
+
+    @property
+    def user_emails(self):
+        return self.db.get_collection("user_emails")
+
+    @property
+    def records(self):
+        return self.db.get_collection("records")
+
+    @property
+    def records_reader(self):
+        """
+        The records collection for listing and summary reads. With
+        MONGO_LISTING_READ_PREFERENCE=secondaryPreferred these reads are served
+        by secondaries and may lag the latest writes slightly.
+        """
+        mode = get_settings().mongo_listing_read_preference
+        if mode == "primary":
+            return self.records
+        return self.records.with_options(read_preference=read_preferences(mode))
+
+    @property
+    def recurring_records(self):
+        return self.db.get_collection("recurring_records")
+
+    @property
+    def budgets(self):
+        return self.db.get_collection("budgets")
+
+    @property
+    def budget_spend(self):
+        return self.db.get_collection("budget_spend")
+
+    @property
+    def migrations(self):
+        return self.db.get_collection("migrations")
+
+    @property
+    def archived_records(self):
+        return self.db.get_collection("archived_records")
+
+    @property
+    def archived_rollups(self):
+        return self.db.get_collection("archived_rollups")
+
+    @property
+    def record_tombstones(self):
+        return self.db.get_collection("record_tombstones")
+
+    @property
+    def assistant_jobs(self):
+        return self.db.get_collection("assistant_jobs")
+
+    @property
+    def attachments(self):
+        return self.db.get_collection("attachments")
+
+    @property
+    def attachment_blobs(self):
+        return self.db.get_collection("attachment_blobs")
+
+    @property
+    def idempotency_keys(self):
+        return self.db.get_collection("idempotency_keys")
+
+    @property
+    def rate_limits(self):
+        return self.db.get_collection("rate_limits")
+
+
+mongo = MongoClientManager()
+
+
+# Fields record listings may be sorted on. Each gets a (user_id, field, _id)
+# index so sorted pages are read in index order instead of sorted in memory;
+# _id breaks ties so pagination stays stable between requests.
+SORTABLE_RECORD_FIELDS = ("date", "type", "amount", "category", "description")
+
+# API field names whose documents store them under a different key.
+STORED_RECORD_FIELDS = {"amount": "amount_cents"}
+
+
+def stored_record_field(field: str) -> str:
+    """
+    The document key holding an API-level record field.
+    """
+    return STORED_RECORD_FIELDS.get(field, field)
+
+
+# Stored fields appended to the date sort index, so a default (newest
+# first) listing of a compact table view, fields=id,date,amount,category,type,
+# is answered from the index alone without reading the documents.
+COVERED_LISTING_FIELDS = ("amount_cents", "category", "type")
+
+
+def record_sort_index(field: str) -> IndexModel:
+    """
+    The (user_id, field, _id) index serving listings sorted on an API field.
+    """
+    stored = stored_record_field(field)
+    keys = [("user_id", ASCENDING), (stored, ASCENDING), ("_id", ASCENDING)]
+    name = f"user_id_{stored}_id"
+    if field == "date":
+        keys += [(covered, ASCENDING) for covered in COVERED_LISTING_FIELDS]
+        name = "_".join([name, *COVERED_LISTING_FIELDS])
+    return IndexModel(keys, name=name)
+
+
+# Compound indexes backing the filtered and sorted record listings. Every
+# listing query carries the user_id equality, so it always leads. The date
+# and amount sort indexes also serve the date/amount range filters.
+RECORD_INDEXES = [record_sort_index(field) for field in SORTABLE_RECORD_FIELDS] + [
+    IndexModel([("user_id", ASCENDING), ("type", ASCENDING), ("date", DESCENDING)],
+               name="user_id_type_date"),
+    # Delta sync reads a user's changes in (updated_at, _id) order.
+    IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+               name="user_id_updated_at_id"),
+    # One record per recurring template and occurrence, so materializing
+    # the same occurrence twice is a no-op. Unique indexes on a sharded
+    # collection must start with the shard key (see app.sharding).
+    IndexModel([("user_id", ASCENDING), ("recurring_id", ASCENDING), ("date", ASCENDING)],
+               name="user_id_recurring_id_date", unique=True,
+               partialFilterExpression={"recurring_id": {"$exists": True}}),
+]
+
+# The cold tier (see app.archive) is read per user by date, for listings
+# and archival, and by updated_at for delta sync. Listings sorted on other
+# fields sort the (rarely read) archived records in memory.
+ARCHIVED_RECORD_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)],
+               name="user_id_date_id"),
+    IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+               name="user_id_updated_at_id"),
+]
+
+# Archived records are compressed with zstd rather than the default snappy.
+ARCHIVED_RECORDS_STORAGE = {"wiredTiger": {"configString": "block_compressor=zstd"}}
+
+# One rollup per user, UTC day and currency/type/category combination.
+ARCHIVED_ROLLUP_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("day", ASCENDING), ("currency", ASCENDING),
+                ("type", ASCENDING), ("category", ASCENDING)],
+               name="user_id_day_currency_type_category", unique=True),
+]
+
+# Templates are listed per user; the scheduler scans active templates by next_run.
+RECURRING_RECORD_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_id_id"),
+    IndexModel([("active", ASCENDING), ("next_run", ASCENDING)], name="active_next_run"),
+]
+
+# One budget per user and category.
+BUDGET_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("category", ASCENDING)],
+               name="user_id_category", unique=True),
+]
+
+# Monthly spend totals, $inc'd on every expense write.
+BUDGET_SPEND_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("month", ASCENDING), ("category", ASCENDING)],
+               name="user_id_month_category", unique=True),
+]
+
+
+def record_tombstone_indexes(ttl_seconds: int) -> list:
+    """
+    Indexes for the record_tombstones collection: read in the same order as
+    records during delta sync, and expired ttl_seconds after the deletion.
+    """
+    return [
+        IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING), ("record_id", ASCENDING)],
+                   name="user_id_updated_at_record_id"),
+        IndexModel([("updated_at", ASCENDING)],
+                   name="updated_at_ttl", expireAfterSeconds=ttl_seconds),
+    ]
+
+
+def idempotency_key_indexes(ttl_seconds: int) -> list:
+    """
+    Indexes for the idempotency_keys collection: one reservation per user and
+    key, expired ttl_seconds after creation.
+    """
+    return [
+        IndexModel([("user_id", ASCENDING), ("key", ASCENDING)],
+                   name="user_id_key", unique=True),
+        IndexModel([("created_at", ASCENDING)],
+                   name="created_at_ttl", expireAfterSeconds=ttl_seconds),
+    ]
+
+
+# Assistant jobs are looked up by _id and deleted at their expires_at.
+ASSISTANT_JOB_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+]
+
+# A record's attachments are removed with it. Blobs are keyed by content
+# hash (_id) and need no other index.
+ATTACHMENT_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("record_id", ASCENDING)], name="user_id_record_id"),
+]
+
+# Rate limit buckets are deleted once they would have refilled completely.
+RATE_LIMIT_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+]
+
+
+async def ensure_indexes():
+    """
+    Create the indexes the routers rely on. Safe to call repeatedly.
+    """
+    await mongo.records.create_indexes(RECORD_INDEXES)
+    try:
+        # Storage options only apply when the collection is created.
+        await mongo.db.create_collection("archived_records", storageEngine=ARCHIVED_RECORDS_STORAGE)
+    except CollectionInvalid:
+        pass
+    except NotImplementedError:
+        # In-memory stand-ins (the benchmark's mongomock) take no storage
+        # options; the collection is then created uncompressed on first use.
+        pass
+    await mongo.archived_records.create_indexes(ARCHIVED_RECORD_INDEXES)
+    await mongo.archived_rollups.create_indexes(ARCHIVED_ROLLUP_INDEXES)
+    await mongo.recurring_records.create_indexes(RECURRING_RECORD_INDEXES)
+    await mongo.budgets.create_indexes(BUDGET_INDEXES)
+    await mongo.budget_spend.create_indexes(BUDGET_SPEND_INDEXES)
+    await mongo.record_tombstones.create_indexes(
+        record_tombstone_indexes(get_settings().record_tombstone_ttl_seconds))
+    await mongo.idempotency_keys.create_indexes(
+        idempotency_key_indexes(get_settings().idempotency_key_ttl_seconds))
+    await mongo.assistant_jobs.create_indexes(ASSISTANT_JOB_INDEXES)
+    await mongo.attachments.create_indexes(ATTACHMENT_INDEXES)
+    await mongo.rate_limits.create_indexes(RATE_LIMIT_INDEXES)
@@ -0,0 +1,16 @@
+# app/http_client.py
+
+from functools import lru_cache
+
+
+@lru_cache
+def get_http_session():
+    """
+    Shared requests.Session for calls to the email and LLM microservices.
+
+    Created on first use, so importing the app does not load requests, and
+    reused afterwards so repeated calls keep their pooled connections.
+    """
+    import requests
+
+    return requests.Session()
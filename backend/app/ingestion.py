@@ -0,0 +1,218 @@
+# app/ingestion.py
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+from app.config import get_settings
+from app.database import mongo
+from app.record_events import records_created
+
+# Mongo's duplicate key error. A retried batch may contain documents that the
+# failed attempt already wrote; those are treated as stored.
+DUPLICATE_KEY_ERROR = 11000
+
+
+class BufferFullError(Exception):
+    """
+    Raised when the write buffer holds max_pending records and cannot accept more.
+    """
+
+
+class RecordWriteBuffer:
+    """
+    Coalesce record inserts into insert_many batches.
+
+    Records are assigned their ObjectId by the caller and acknowledged as soon
+    as they are queued. A background task flushes the queue whenever it
+    reaches max_batch_size, or after flush_interval seconds, whichever comes
+    first.
+
+    Durability: an acknowledged record lives only in this process' memory
+    until its batch is flushed. If the process dies before that, the record is
+    lost. Clients that need a durable acknowledgement must use the default,
+    unbuffered create.
+
+    Backpressure: at most max_pending records may wait for a flush. Past that,
+    submit() raises BufferFullError so the caller can shed load instead of
+    growing memory without bound.
+
+    A batch that fails to insert is retried max_retries times, waiting
+    retry_backoff seconds before the first retry and twice as long before
+    each next one, so a short database outage (e.g. a replica set election)
+    does not exhaust the retries. After that its records are dropped and
+    counted in the "dropped" stat.
+
+    on_stored, if given, is awaited with the documents of each flushed batch
+    that made it into the collection, and on_dropped with those dropped.
+    Errors raised by a hook are logged; they never stop the flush task.
+    """
+
+    def __init__(
+        self,
+        get_collection: Callable,
+        max_batch_size: int = 500,
+        flush_interval: float = 0.05,
+        max_pending: int = 10000,
+        max_retries: int = 3,
+        retry_backoff: float = 0.25,
+        on_stored: Optional[Callable[[List[dict]], Awaitable]] = None,
+        on_dropped: Optional[Callable[[List[dict]], Awaitable]] = None,
+    ):
+        self.get_collection = get_collection
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_stored = on_stored
+        self.on_dropped = on_dropped
+        self._pending: List[dict] = []
+        self._batch_ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"accepted": 0, "flushed": 0, "batches": 0, "dropped": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        """
+        Start the background flush task.
+        """
+        if not self.running:
+            self._stopping = False
+            self._batch_ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the flush task and write out everything still queued.
+        """
+        if self._task is not None:
+            # Let an in-flight flush finish rather than cancelling it mid-batch.
+            self._stopping = True
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+        while self._pending:
+            await self.flush()
+
+    def submit(self, document: dict):
+        """
+        Queue a record for insertion. The document must already carry its _id.
+
+        Raises:
+            BufferFullError: If max_pending records are already queued.
+        """
+        if len(self._pending) >= self.max_pending:
+            raise BufferFullError("Record write buffer is full.")
+        self._pending.append(document)
+        self.stats["accepted"] += 1
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_ready.set()
+
+    async def flush(self):
+        """
+        Insert up to max_batch_size queued records with a single insert_many.
+        """
+        if not self._pending:
+            return
+        batch = self._pending[:self.max_batch_size]
+        del self._pending[:self.max_batch_size]
+
+        stored: List[dict] = []
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                await self.get_collection().insert_many(batch, ordered=False)
+                stored.extend(batch)
+                batch = []
+                break
+            except BulkWriteError as e:
+                failed = {error["index"] for error in e.details.get("writeErrors", [])
+                          if error.get("code") != DUPLICATE_KEY_ERROR}
+                stored.extend(doc for index, doc in enumerate(batch) if index not in failed)
+                batch = [doc for index, doc in enumerate(batch) if index in failed]
+                if not batch:
+                    break
+            except Exception as e:
+                print(f"Error flushing record batch (attempt {attempt + 1}): {e}")
+
+        if batch:
+            print(f"Dropping {len(batch)} buffered records after {self.max_retries} retries.")
+            self.stats["dropped"] += len(batch)
+            await self._call_hook(self.on_dropped, batch)
+        if stored:
+            self.stats["flushed"] += len(stored)
+            self.stats["batches"] += 1
+            await self._call_hook(self.on_stored, stored)
+
+    async def _call_hook(self, hook: Optional[Callable[[List[dict]], Awaitable]], documents: List[dict]):
+        if hook is None:
+            return
+        try:
+            await hook(documents)
+        except Exception as e:
+            # The records' fate is settled; keep flushing the next batches.
+            print(f"Error in record write buffer hook {getattr(hook, '__name__', hook)}: {e}")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            while self._pending:
+                await self.flush()
+
+
+async def release_idempotency_keys(records: List[dict]):
+    """
+    Free the Idempotency-Keys reserved for buffered records that were
+    dropped, so the clients' retries insert them again instead of getting a
+    409 until the keys expire. Keys of records written despite the error
+    are kept.
+    """
+    by_user: Dict[str, List] = {}
+    for record in records:
+        by_user.setdefault(record["user_id"], []).append(record["_id"])
+    try:
+        # One query per user, so each pins the user_id shard key.
+        for user_id, ids in by_user.items():
+            written = await mongo.records.find(
+                {"_id": {"$in": ids}, "user_id": user_id}, {"_id": 1}).to_list(length=None)
+            written_ids = {record["_id"] for record in written}
+            await mongo.idempotency_keys.delete_many({
+                "user_id": user_id,
+                "record_id": {"$in": [record_id for record_id in ids if record_id not in written_ids]},
+            })
+    except Exception as e:
+        # The database is likely still down; the keys expire with their TTL.
+        print(f"Error releasing idempotency keys of dropped records: {e}")
+
+
+def create_record_write_buffer() -> RecordWriteBuffer:
+    """
+    Build the records write buffer from the settings.
+    """
+    settings = get_settings()
+    return RecordWriteBuffer(
+        lambda: mongo.records,
+        max_batch_size=settings.record_write_buffer_batch_size,
+        flush_interval=settings.record_write_buffer_flush_ms / 1000,
+        max_pending=settings.record_write_buffer_max_pending,
+        on_stored=records_created,
+        on_dropped=release_idempotency_keys,
+    )
+
+
+record_write_buffer = create_record_write_buffer()
@@ -1,10 +1,54 @@
 # main.py
-from app.routers import users, records, personal_assistant, contact
+from contextlib import asynccontextmanager
+from app.routers import users, records, recurring, budgets, analytics, personal_assistant, contact, admin, batch, attachments
+from app.database import mongo, ensure_indexes
+from app.migrations import run_migrations
+from app.ingestion import record_write_buffer
+from app.recurrence import recurring_scheduler
+from app.archive import archive_scheduler
+from app.notifications import email_queue
+from app.assistant_jobs import assistant_jobs
+from app.analytics import frame_cache
+from app.currency import get_exchange_rates
+from app.search import search_indexes
+from app.config import get_settings
+from app.metrics import record_request_metrics, render_metrics
+from app.profiling import profile_request
+from app.responses import CompressionMiddleware, FastJSONResponse, compression_stats
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Refuse to start with exchange rates quoted in another currency than BASE_CURRENCY.
+    get_exchange_rates()
+    # One Motor client per worker, shared by all routers and closed on shutdown.
+    mongo.connect()
+    # Build the indexes backing the record filters before serving traffic.
+    await ensure_indexes()
+    # Bring existing documents up to date (e.g. float amounts to integer cents).
+    await run_migrations()
+    await email_queue.start()
+    await assistant_jobs.start()
+    if get_settings().record_write_buffer_enabled:
+        await record_write_buffer.start()
+    if get_settings().recurring_scheduler_enabled:
+        await recurring_scheduler.start()
+    if get_settings().archive_enabled:
+        await archive_scheduler.start()
+    yield
+    await archive_scheduler.stop()
+    await recurring_scheduler.stop()
+    # Write out buffered records before the process exits.
+    await record_write_buffer.stop()
+    await assistant_jobs.stop()
+    await email_queue.stop()
+    mongo.close()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Specify the origins that should be allowed to make requests.
 # For local development, include your frontend URL.
@@ -23,12 +67,60 @@ app.add_middleware(
     allow_headers=["*"],           # Allow all headers
 )
 
+# Negotiated zstd/brotli/gzip compression of large bodies.
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=get_settings().compression_min_size,
+    gzip_level=get_settings().compression_gzip_level,
+    brotli_quality=get_settings().compression_brotli_quality,
+    zstd_level=get_settings().compression_zstd_level,
+)
+
+# Per-route latency histograms, DB/outbound time and the Server-Timing header.
+app.middleware("http")(record_request_metrics)
+# Opt-in cProfile of a single request (X-Profile + X-Admin-Key headers).
+app.middleware("http")(profile_request)
+
 app.include_router(users.router)
 app.include_router(records.router)
+app.include_router(attachments.router)
+app.include_router(recurring.router)
+app.include_router(budgets.router)
+app.include_router(analytics.router)
 app.include_router(personal_assistant.router)
 app.include_router(contact.router)
+app.include_router(admin.router)
+app.include_router(batch.router)
 
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the Personal Finance API!"}
+
+
+@app.get("/metrics/db-pool")
+async def db_pool_metrics():
+    return mongo.pool_metrics.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Expose request, database and outbound-call metrics in Prometheus text format.
+    """
+    gauges = {f"mongo_pool_{name}": value
+              for name, value in mongo.pool_metrics.snapshot().items()}
+    gauges["record_write_buffer_pending"] = record_write_buffer.pending
+    gauges["email_queue_pending"] = email_queue.pending
+    gauges["assistant_jobs_pending"] = assistant_jobs.pending
+    gauges["assistant_jobs_running"] = assistant_jobs.running
+    for name, value in assistant_jobs.stats.items():
+        gauges[f"assistant_jobs_{name}"] = value
+    for name, value in compression_stats.items():
+        gauges[f"compression_{name}"] = value
+    gauges["analytics_cache_hits"] = frame_cache.stats["hits"]
+    gauges["analytics_cache_misses"] = frame_cache.stats["misses"]
+    gauges["search_index_hits"] = search_indexes.stats["hits"]
+    gauges["search_index_misses"] = search_indexes.stats["misses"]
+    return PlainTextResponse(
+        render_metrics(gauges), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,206 @@
+# app/metrics.py
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import Request
+from pymongo import monitoring
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    A labelled Prometheus-style histogram.
+
+    Observations may come from the event loop, driver threads and the
+    threadpool running background tasks, so updates are made under a lock.
+    """
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts, then sum, then count.
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            base = format_labels(self.label_names, labels)
+            for bound, count in zip(self.buckets, values):
+                yield f"{self.name}_bucket{format_labels(self.label_names + ('le',), labels + (str(bound),))} {count}"
+            yield f"{self.name}_bucket{format_labels(self.label_names + ('le',), labels + ('+Inf',))} {values[-1]}"
+            yield f"{self.name}_sum{base} {values[-2]}"
+            yield f"{self.name}_count{base} {values[-1]}"
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ("method", "route", "status"),
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds",
+    "Time spent in MongoDB commands, as reported by the driver.",
+    ("command",),
+)
+EXTERNAL_CALL_LATENCY = Histogram(
+    "external_call_duration_seconds",
+    "Time spent calling the LLM and email microservices.",
+    ("service",),
+)
+
+
+ASSISTANT_JOB_QUEUE_LATENCY = Histogram(
+    "assistant_job_queue_seconds",
+    "Time personal assistant jobs wait for a worker.",
+    (),
+)
+
+
+class RequestTimings:
+    """
+    Time spent by the current request outside the handler's own code.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.db_operations = 0
+        self.db_seconds = 0.0
+        self.external_seconds: Dict[str, float] = {}
+
+    def add_db(self, seconds: float):
+        with self._lock:
+            self.db_operations += 1
+            self.db_seconds += seconds
+
+    def add_external(self, service: str, seconds: float):
+        with self._lock:
+            self.external_seconds[service] = self.external_seconds.get(service, 0.0) + seconds
+
+
+# The RequestTimings of the request being handled. Motor runs driver calls
+# with a copy of the caller's context, so command events see it too.
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "current_timings", default=None)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    Attribute every MongoDB command to the histogram and the current request.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_LATENCY.observe((event.command_name,), seconds)
+        timings = current_timings.get()
+        if timings is not None:
+            timings.add_db(seconds)
+
+
+@contextmanager
+def timed(service: str):
+    """
+    Time an outbound call, e.g. `with timed("llm"): ...`.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        EXTERNAL_CALL_LATENCY.observe((service,), seconds)
+        timings = current_timings.get()
+        if timings is not None:
+            timings.add_external(service, seconds)
+
+
+def server_timing_header(total_seconds: float, timings: RequestTimings) -> str:
+    """
+    Build a Server-Timing header value (durations in milliseconds).
+    """
+    entries = [
+        f"app;dur={total_seconds * 1000:.1f}",
+        f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.db_operations} ops"',
+    ]
+    for service, seconds in sorted(timings.external_seconds.items()):
+        entries.append(f"{service};dur={seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+async def record_request_metrics(request: Request, call_next):
+    """
+    HTTP middleware: time the request, attach Server-Timing and record the
+    latency under the route template (not the raw path, to bound cardinality).
+    """
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    started = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+    finally:
+        elapsed = time.perf_counter() - started
+        current_timings.reset(token)
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        REQUEST_LATENCY.observe((request.method, route_path, status), elapsed)
+
+    response.headers["Server-Timing"] = server_timing_header(elapsed, timings)
+    return response
+
+
+def render_metrics(gauges: Optional[Dict[str, float]] = None) -> str:
+    """
+    Render all histograms, plus any extra gauges, in Prometheus text format.
+    """
+    lines = []
+    for histogram in (REQUEST_LATENCY, MONGO_COMMAND_LATENCY, EXTERNAL_CALL_LATENCY,
+                      ASSISTANT_JOB_QUEUE_LATENCY):
+        lines.extend(histogram.render())
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
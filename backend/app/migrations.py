@@ -0,0 +1,194 @@
+# app/migrations.py
+"""
+One-off data migrations, run at startup and recorded in the migrations
+collection so each runs to completion once per database.
+
+They can also be run ahead of a deploy:
+
+    python -m app.migrations
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from app.database import mongo
+from app.money import legacy_cents
+
+# (collection property, float field, integer cents field)
+AMOUNT_FIELDS = [
+    ("records", "amount", "amount_cents"),
+    ("recurring_records", "amount", "amount_cents"),
+    ("budgets", "limit", "limit_cents"),
+    ("budget_spend", "spent", "spent_cents"),
+]
+
+
+async def migrate_float_field_to_cents(collection, float_field: str, cents_field: str,
+                                       batch_size: int = 1000) -> int:
+    """
+    Replace a float amount with integer cents on every document still
+    carrying it, batch_size documents per bulk_write.
+
+    Each update only applies if the float is unchanged, so the migration can
+    run while the app serves traffic and from several workers at once.
+
+    Returns:
+        int: The number of documents migrated.
+    """
+    migrated = 0
+    while True:
+        batch = await collection.find(
+            {float_field: {"$exists": True}}, {float_field: 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return migrated
+        result = await collection.bulk_write([
+            UpdateOne(
+                {"_id": doc["_id"], float_field: doc[float_field]},
+                {"$set": {cents_field: legacy_cents(doc[float_field])},
+                 "$unset": {float_field: ""}},
+            )
+            for doc in batch
+        ], ordered=False)
+        migrated += result.modified_count
+
+
+async def migrate_amounts_to_cents(batch_size: int = 1000) -> int:
+    migrated = 0
+    for collection_name, float_field, cents_field in AMOUNT_FIELDS:
+        migrated += await migrate_float_field_to_cents(
+            getattr(mongo, collection_name), float_field, cents_field, batch_size)
+    try:
+        # Superseded by user_id_amount_cents_id.
+        await mongo.records.drop_index("user_id_amount_id")
+    except OperationFailure:
+        pass
+    return migrated
+
+
+async def backfill_record_updated_at(batch_size: int = 1000) -> int:
+    """
+    Give records written before updated_at existed their creation date, so
+    delta sync pages through them like any other record.
+    """
+    migrated = 0
+    while True:
+        batch = await mongo.records.find(
+            {"updated_at": {"$exists": False}}, {"date": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return migrated
+        result = await mongo.records.bulk_write([
+            UpdateOne({"_id": doc["_id"], "updated_at": {"$exists": False}},
+                      {"$set": {"updated_at": doc["date"]}})
+            for doc in batch
+        ], ordered=False)
+        migrated += result.modified_count
+
+
+async def backfill_user_emails(batch_size: int = 1000) -> int:
+    """
+    Map the email of every user signed up before user_emails existed to
+    their id, so sign-in finds them. Emails already mapped are kept.
+    """
+    migrated = 0
+    batch = []
+    async for user in mongo.users.find({}, {"email": 1}):
+        batch.append(UpdateOne({"_id": user["email"]},
+                               {"$setOnInsert": {"user_id": user["_id"]}}, upsert=True))
+        if len(batch) >= batch_size:
+            migrated += (await mongo.user_emails.bulk_write(batch, ordered=False)).upserted_count
+            batch = []
+    if batch:
+        migrated += (await mongo.user_emails.bulk_write(batch, ordered=False)).upserted_count
+    return migrated
+
+
+async def drop_unsharded_recurring_index() -> int:
+    """
+    Drop the (recurring_id, date) unique index, superseded by
+    user_id_recurring_id_date: a unique index not prefixed by the shard key
+    prevents sharding the records collection.
+    """
+    try:
+        await mongo.records.drop_index("recurring_id_date")
+    except OperationFailure:
+        pass
+    return 0
+
+
+async def drop_uncovered_date_index() -> int:
+    """
+    Drop user_id_date_id, superseded by the date index that also carries
+    the compact listing fields (see COVERED_LISTING_FIELDS).
+    """
+    try:
+        await mongo.records.drop_index("user_id_date_id")
+    except OperationFailure:
+        pass
+    return 0
+
+
+async def key_spend_by_category(batch_size: int = 1000) -> int:
+    """
+    Fold spend totals kept under a category's spelling (e.g. "Groceries")
+    into the total under its key ("groceries"), which budgets now read.
+    """
+    from app.budgets import category_key
+
+    migrated = 0
+    async for spend in mongo.budget_spend.find({}, {"user_id": 1, "category": 1, "month": 1}).batch_size(batch_size):
+        key = category_key(spend["category"])
+        if key == spend["category"]:
+            continue
+        spend = await mongo.budget_spend.find_one_and_delete({"_id": spend["_id"], "user_id": spend["user_id"]})
+        if spend is None:
+            continue
+        await mongo.budget_spend.update_one(
+            {"user_id": spend["user_id"], "category": key, "month": spend["month"]},
+            {"$inc": {"spent_cents": spend.get("spent_cents", 0), "version": 1},
+             "$addToSet": {"alerted": {"$each": spend.get("alerted", [])}}},
+            upsert=True)
+        migrated += 1
+    return migrated
+
+
+MIGRATIONS = [
+    ("amounts_to_cents", migrate_amounts_to_cents),
+    ("record_updated_at", backfill_record_updated_at),
+    ("user_emails", backfill_user_emails),
+    ("recurring_index_by_user", drop_unsharded_recurring_index),
+    ("covered_date_index", drop_uncovered_date_index),
+    ("spend_category_keys", key_spend_by_category),
+]
+
+
+async def run_migrations():
+    """
+    Run every migration not yet recorded as done.
+    """
+    for name, migration in MIGRATIONS:
+        if await mongo.migrations.find_one({"_id": name}):
+            continue
+        migrated = await migration()
+        print(f"Migration {name}: {migrated} documents updated.")
+        try:
+            await mongo.migrations.insert_one(
+                {"_id": name, "completed_at": datetime.now(timezone.utc)})
+        except DuplicateKeyError:
+            # Another worker finished it at the same time.
+            pass
+
+
+if __name__ == "__main__":
+    async def main():
+        mongo.connect()
+        try:
+            await run_migrations()
+        finally:
+            mongo.close()
+
+    asyncio.run(main())
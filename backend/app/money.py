@@ -0,0 +1,89 @@
+# app/money.py
+
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+from typing import Union
+
+import numpy as np
+
+# Amounts are stored as integer hundredths of a currency unit ("cents"),
+# whatever the currency, so sums are exact and every stored amount sorts
+# and filters on the same scale.
+CENTS_PER_UNIT = 100
+
+# Currencies without fractional units; amounts in them must be whole.
+ZERO_DECIMAL_CURRENCIES = frozenset({"JPY", "KRW", "VND", "CLP", "ISK", "HUF", "TWD", "UGX"})
+
+Number = Union[Decimal, float, int]
+
+
+def as_decimal(amount: Number) -> Decimal:
+    """
+    Decimal value of an amount. Floats go through their shortest repr, so
+    12.34 becomes Decimal("12.34") rather than its binary expansion.
+    """
+    if isinstance(amount, Decimal):
+        return amount
+    return Decimal(str(amount))
+
+
+def to_cents(amount: Number) -> int:
+    """
+    Convert an amount to integer cents.
+
+    Raises:
+        ValueError: If the amount has more than two decimal places.
+    """
+    cents = as_decimal(amount) * CENTS_PER_UNIT
+    if cents != cents.to_integral_value():
+        raise ValueError("Amounts may have at most two decimal places")
+    return int(cents)
+
+
+def bound_to_cents(amount: Number, lower: bool) -> int:
+    """
+    Convert a range bound to cents, rounding inwards: a lower bound of
+    10.005 matches from 10.01, an upper bound of 10.005 up to 10.00.
+    """
+    rounding = ROUND_CEILING if lower else ROUND_FLOOR
+    return int((as_decimal(amount) * CENTS_PER_UNIT).to_integral_value(rounding=rounding))
+
+
+def from_cents(cents: int) -> float:
+    """
+    The amount as a float for API responses. Integer division by 100 is
+    correctly rounded, so 1234 gives exactly the float 12.34.
+    """
+    return cents / CENTS_PER_UNIT
+
+
+def legacy_cents(amount: float) -> int:
+    """
+    Cents for an amount stored as a float before amounts were exact.
+    """
+    return to_cents(round(amount, 2))
+
+
+def record_cents(document: dict) -> int:
+    """
+    A record's (or recurring template's) amount in cents, including
+    documents not yet migrated from a float amount.
+    """
+    if "amount_cents" in document:
+        return document["amount_cents"]
+    return legacy_cents(document["amount"])
+
+
+def round_cents(values: np.ndarray) -> np.ndarray:
+    """
+    Round converted (fractional) cents to whole cents, half to even.
+    """
+    return np.rint(values).astype(np.int64)
+
+
+def sum_by_group(cents: np.ndarray, groups: np.ndarray, size: int) -> np.ndarray:
+    """
+    Exact int64 totals of cents per group index (0 <= group < size).
+    """
+    totals = np.zeros(size, dtype=np.int64)
+    np.add.at(totals, groups, cents)
+    return totals
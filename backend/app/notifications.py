@@ -0,0 +1,88 @@
+# app/notifications.py
+
+import asyncio
+from typing import Optional
+
+from app.config import get_settings
+from app.http_client import get_http_session
+from app.metrics import timed
+
+
+def send_email_via_service(recipient: str, subject: str, content: str):
+    """
+    Send one email through the email microservice. Blocking.
+    """
+    settings = get_settings()
+    payload = {
+        "sender_name": "FinanceManager",
+        "sender_email": settings.sender_email,
+        "recipient_email": recipient,
+        "subject": subject,
+        "content": content,
+    }
+    with timed("email"):
+        response = get_http_session().post(
+            f"{settings.email_service_url}/send-email", json=payload)
+    response.raise_for_status()
+
+
+class EmailQueue:
+    """
+    Bounded queue of outgoing emails, sent one at a time by a background task.
+
+    Callers outside a request (the write buffer, the recurring scheduler)
+    can enqueue mail without waiting on the email microservice. Emails are
+    held in memory only; when the queue is full, or the process stops with
+    mail still queued, those emails are dropped and counted.
+    """
+
+    def __init__(self, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "dropped": 0}
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.stats["dropped"] += self._queue.qsize()
+
+    def submit(self, recipient: str, subject: str, content: str) -> bool:
+        """
+        Queue an email. Returns False if the queue is full and it was dropped.
+        """
+        try:
+            self._queue.put_nowait((recipient, subject, content))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    async def _run(self):
+        while True:
+            recipient, subject, content = await self._queue.get()
+            try:
+                await asyncio.to_thread(send_email_via_service, recipient, subject, content)
+                self.stats["sent"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"Error sending email: {e}")
+            finally:
+                self._queue.task_done()
+
+
+email_queue = EmailQueue()
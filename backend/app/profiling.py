@@ -0,0 +1,132 @@
+# app/profiling.py
+
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from fastapi import Request
+
+from app.auth import is_admin_key
+
+# Header a client sends (together with X-Admin-Key) to profile one request.
+PROFILE_HEADER = "X-Profile"
+# How many per-request profiles are kept for download.
+MAX_STORED_PROFILES = 20
+
+
+def sample_stacks(seconds: float, interval: float, thread_id: Optional[int] = None) -> Counter:
+    """
+    Sample the Python stacks of this process for a number of seconds.
+
+    Args:
+        seconds (float): How long to sample for.
+        interval (float): Time between samples, in seconds.
+        thread_id (Optional[int]): Only sample this thread; all threads if None.
+
+    Returns:
+        Counter: Folded stacks ("outer;...;inner") mapped to sample counts.
+    """
+    own_thread = threading.get_ident()
+    samples = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own_thread or (thread_id is not None and ident != thread_id):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            samples[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return samples
+
+
+def format_collapsed(samples: Counter) -> str:
+    """
+    Render folded stacks in the collapsed format read by flamegraph.pl and speedscope.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+class ProfileStore:
+    """
+    Keep the most recent per-request profiles in memory for download.
+    """
+
+    def __init__(self, max_profiles: int = MAX_STORED_PROFILES):
+        self.max_profiles = max_profiles
+        self._profiles: "OrderedDict[str, pstats.Stats]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, stats: pstats.Stats) -> str:
+        profile_id = uuid.uuid4().hex
+        with self._lock:
+            self._profiles[profile_id] = stats
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[pstats.Stats]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+profile_store = ProfileStore()
+
+# Only one cProfile hook can be active on a thread, so overlapping profiled
+# requests run unprofiled.
+_request_profile_lock = threading.Lock()
+
+
+def dump_pstats(stats: pstats.Stats) -> bytes:
+    """
+    Serialize stats in the binary format pstats.Stats(<file>) loads.
+    """
+    return marshal.dumps(stats.stats)
+
+
+def format_pstats(stats: pstats.Stats, limit: int = 50) -> str:
+    """
+    Render the top functions by cumulative time as text.
+    """
+    buffer = io.StringIO()
+    stats.stream = buffer
+    stats.sort_stats("cumulative").print_stats(limit)
+    return buffer.getvalue()
+
+
+async def profile_request(request: Request, call_next):
+    """
+    HTTP middleware: run the request under cProfile when it carries the
+    X-Profile header and a valid X-Admin-Key. The profile id is returned in
+    X-Profile-Id and the stats are fetched from GET /admin/profiles/{id}.
+
+    cProfile hooks the event loop thread, so work from requests running
+    concurrently on the same worker is included in the profile.
+    """
+    if PROFILE_HEADER not in request.headers:
+        return await call_next(request)
+    if not is_admin_key(request.headers.get("X-Admin-Key")):
+        return await call_next(request)
+    if not _request_profile_lock.acquire(blocking=False):
+        return await call_next(request)
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.disable()
+        _request_profile_lock.release()
+    profile_id = profile_store.add(pstats.Stats(profiler))
+    response.headers["X-Profile-Id"] = profile_id
+    return response
@@ -0,0 +1,178 @@
+# app/rate_limit.py
+
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Callable, Tuple
+
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.config import get_settings
+from app.database import mongo
+from app.utils import decode_access_token
+
+# Bound on distinct keys the in-memory backend tracks; the least recently
+# used bucket is forgotten first (it would have refilled anyway).
+MAX_TRACKED_KEYS = 100_000
+
+
+class InMemoryRateLimitBackend:
+    """
+    Token buckets held in this worker's memory. Limits are per worker process.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic,
+                 max_keys: int = MAX_TRACKED_KEYS):
+        self.clock = clock
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, capacity: int, refill_per_second: float,
+                   cost: int = 1) -> Tuple[bool, float]:
+        """
+        Take cost tokens from the bucket for key.
+
+        Returns:
+            Tuple[bool, float]: Whether the request is allowed, and if not,
+            how many seconds until enough tokens have refilled.
+        """
+        now = self.clock()
+        tokens, updated_at = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        retry_after = 0.0 if allowed else (cost - tokens) / refill_per_second
+        return allowed, retry_after
+
+
+class MongoRateLimitBackend:
+    """
+    Token buckets shared by every worker, stored in the rate_limits collection.
+    Each take() is a single atomic find_one_and_update with a pipeline update.
+    """
+
+    async def take(self, key: str, capacity: int, refill_per_second: float,
+                   cost: int = 1) -> Tuple[bool, float]:
+        now = time.time()
+        elapsed = {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}
+        refilled = {"$min": [capacity, {"$add": [
+            {"$ifNull": ["$tokens", capacity]},
+            {"$multiply": [elapsed, refill_per_second]},
+        ]}]}
+        pipeline = [
+            {"$set": {"tokens": refilled, "updated_at": now}},
+            {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                # Once full again the bucket carries no state; let the TTL index drop it.
+                "expires_at": datetime.fromtimestamp(
+                    now + capacity / refill_per_second, tz=timezone.utc),
+            }},
+        ]
+        try:
+            bucket = await mongo.rate_limits.find_one_and_update(
+                {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            # Two workers created the bucket at once; the loser updates the winner's.
+            bucket = await mongo.rate_limits.find_one_and_update(
+                {"_id": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER)
+        if bucket["allowed"]:
+            return True, 0.0
+        return False, (cost - bucket["tokens"]) / refill_per_second
+
+
+@lru_cache
+def get_rate_limit_backend():
+    """
+    The backend selected by RATE_LIMIT_BACKEND ("memory" or "mongo").
+    """
+    if get_settings().rate_limit_backend == "mongo":
+        return MongoRateLimitBackend()
+    return InMemoryRateLimitBackend()
+
+
+def client_key(request: Request, by_user: bool) -> str:
+    """
+    Identify the caller: the user id from the bearer token when by_user is
+    set and the token is valid, otherwise the client IP. The token is only
+    decoded (no database lookup), so this stays cheap.
+    """
+    if by_user:
+        authorization = request.headers.get("Authorization", "")
+        if authorization.lower().startswith("bearer "):
+            try:
+                user_id = decode_access_token(authorization[7:]).get("sub")
+                if user_id:
+                    return f"user:{user_id}"
+            except HTTPException:
+                pass
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+
+def rate_limit(name: str, capacity: int, per_seconds: float, by_user: bool = False):
+    """
+    Build a dependency allowing `capacity` requests per `per_seconds` per
+    caller on the endpoint `name`, rejecting the excess with 429.
+
+    Add it to the route's dependencies so it runs before the body is
+    validated and before any other dependency.
+    """
+    refill_per_second = capacity / per_seconds
+
+    async def dependency(request: Request):
+        if not get_settings().rate_limit_enabled:
+            return
+        key = f"{name}:{client_key(request, by_user)}"
+        allowed, retry_after = await get_rate_limit_backend().take(
+            key, capacity, refill_per_second)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests. Please slow down.",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    return dependency
+
+
+class ConcurrencyLimiter:
+    """
+    Dependency capping how many requests run an expensive section at once
+    in this worker. Requests over the cap are rejected with 503 straight
+    away instead of queueing behind the ones in progress.
+    """
+
+    def __init__(self, name: str, max_concurrent: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+
+    async def __call__(self):
+        if self.in_flight >= self.max_concurrent:
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy. Please retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+
+# bcrypt hashing/verification (signin, signup, password reset).
+password_hashing_limiter = ConcurrencyLimiter(
+    "password_hashing", get_settings().password_hashing_max_concurrency)
+# Calls to the LLM microservice.
+assistant_limiter = ConcurrencyLimiter(
+    "assistant", get_settings().assistant_max_concurrency)
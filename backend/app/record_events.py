@@ -0,0 +1,33 @@
+# app/record_events.py
+"""
+Bookkeeping after records are written. Every write path (the records
+router, the write buffer and recurring materialization) calls these, so
+budget spend, analytics frames and search indexes stay in step with the
+records collection.
+"""
+
+from typing import List
+
+from app.analytics import records_changed
+from app.attachments import release_record_attachments
+from app.budgets import track_created_records, track_updated_record, track_deleted_record
+from app.search import index_records, unindex_record
+
+
+async def records_created(records: List[dict]):
+    await track_created_records(records)
+    records_changed(records)
+    index_records(records)
+
+
+async def record_updated(before: dict, after: dict):
+    await track_updated_record(before, after)
+    records_changed([before])
+    index_records([after])
+
+
+async def record_deleted(record: dict):
+    await track_deleted_record(record)
+    records_changed([record])
+    unindex_record(record)
+    await release_record_attachments(record)
@@ -0,0 +1,292 @@
+# app/recurrence.py
+
+import asyncio
+import calendar
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Set
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config import get_settings
+from app.database import mongo
+from app.record_events import records_created
+from app.money import record_cents
+
+# Upper bounds that keep a single template from producing unbounded work.
+MAX_OCCURRENCES_PER_RUN = 1000
+MAX_CRON_SEARCH_DAYS = 5 * 366
+DUPLICATE_KEY_ERROR = 11000
+
+
+def as_utc(value: datetime) -> datetime:
+    """
+    Treat naive datetimes (as returned by Mongo) as UTC.
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def add_months(value: datetime, months: int, anchor_day: int) -> datetime:
+    """
+    Move value by a number of months, keeping anchor_day where the month has
+    it and clamping to the month's last day otherwise (Jan 31 -> Feb 28).
+    """
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(anchor_day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+# -------- Cron expressions --------
+
+CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 6),
+)
+
+
+def parse_cron_field(field: str, low: int, high: int) -> Set[int]:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid cron step: {step_text}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = end = int(part)
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron value out of range {low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """
+    A standard five-field cron expression: minute hour day-of-month month
+    day-of-week (0 = Sunday). Supports *, lists, ranges and steps.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError("Cron expressions need five fields: minute hour day month weekday.")
+        self.expression = expression
+        parsed = [parse_cron_field(field, low, high)
+                  for field, (_, low, high) in zip(fields, CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        # Like cron, restricting both day fields matches either of them.
+        self.day_restricted = fields[2] != "*"
+        self.weekday_restricted = fields[4] != "*"
+
+    @property
+    def times_per_day(self) -> int:
+        """
+        How many times the schedule fires on a matching day.
+        """
+        return len(self.hours) * len(self.minutes)
+
+    def _day_matches(self, value: datetime) -> bool:
+        if value.month not in self.months:
+            return False
+        day_match = value.day in self.days
+        # Python: Monday = 0; cron: Sunday = 0.
+        weekday_match = (value.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        """
+        The first matching minute at or after `after`.
+        """
+        after = as_utc(after)
+        if after.second or after.microsecond:
+            after = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = after.replace(hour=0, minute=0)
+        for _ in range(MAX_CRON_SEARCH_DAYS):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= after:
+                            return candidate
+            day += timedelta(days=1)
+        return None
+
+
+# -------- Template schedules --------
+
+def next_occurrence(template: dict, after: datetime) -> Optional[datetime]:
+    """
+    The first occurrence of a recurring template at or after `after`, or
+    None once the template has ended.
+
+    Daily, weekly and monthly schedules step `interval` units from the
+    template's start_date; cron schedules follow their expression.
+    """
+    start = as_utc(template["start_date"])
+    after = max(as_utc(after), start)
+    frequency = template["frequency"]
+    interval = template.get("interval", 1)
+
+    if frequency == "cron":
+        occurrence = CronSchedule(template["cron"]).next_after(after)
+    elif frequency in ("daily", "weekly"):
+        step = timedelta(days=interval * (7 if frequency == "weekly" else 1))
+        steps = -(-(after - start) // step)  # ceiling division
+        occurrence = start + steps * step
+    elif frequency == "monthly":
+        months = (after.year - start.year) * 12 + after.month - start.month
+        steps = max(0, months // interval)
+        occurrence = add_months(start, steps * interval, start.day)
+        while occurrence < after:
+            steps += 1
+            occurrence = add_months(start, steps * interval, start.day)
+    else:
+        raise ValueError(f"Unknown frequency: {frequency}")
+
+    end = template.get("end_date")
+    if occurrence is None or (end is not None and occurrence > as_utc(end)):
+        return None
+    return occurrence
+
+
+def occurrences_between(template: dict, start: datetime, end: datetime,
+                        limit: int = MAX_OCCURRENCES_PER_RUN) -> Iterator[datetime]:
+    """
+    Yield the template's occurrences in [start, end], at most `limit` of them.
+    """
+    current = next_occurrence(template, start)
+    count = 0
+    while current is not None and current <= as_utc(end) and count < limit:
+        yield current
+        count += 1
+        current = next_occurrence(template, current + timedelta(seconds=1))
+
+
+# -------- Materialization --------
+
+def build_occurrence_record(template: dict, occurrence: datetime) -> dict:
+    return {
+        "user_id": template["user_id"],
+        "amount_cents": record_cents(template),
+        "category": template["category"],
+        "description": template.get("description"),
+        "type": template["type"],
+        "currency": template.get("currency") or get_settings().base_currency,
+        "date": occurrence,
+        "recurring_id": template["_id"],
+        # When it was written, not when it occurs, so syncing clients see it.
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+async def insert_occurrences(records: List[dict]) -> int:
+    """
+    Insert materialized records, ignoring occurrences that already exist
+    (another worker, or an earlier interrupted run, wrote them).
+    """
+    if not records:
+        return 0
+    try:
+        await mongo.records.insert_many(records, ordered=False)
+        inserted = records
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        duplicates = {error["index"] for error in errors}
+        inserted = [record for index, record in enumerate(records) if index not in duplicates]
+    await records_created(inserted)
+    return len(inserted)
+
+
+async def materialize_due(now: Optional[datetime] = None, batch_size: int = 500) -> int:
+    """
+    Create the records of every occurrence that is due, across all users.
+
+    Due templates are read through the (active, next_run) index. Their
+    occurrences are inserted with insert_many in batches of batch_size, and
+    next_run is advanced with one bulk_write per batch. A unique
+    (recurring_id, date) index makes re-running safe.
+
+    Returns:
+        int: The number of records created.
+    """
+    now = as_utc(now or datetime.now(timezone.utc))
+    created = 0
+    pending_records: List[dict] = []
+    pending_updates: List[UpdateOne] = []
+
+    async def flush():
+        nonlocal created, pending_records, pending_updates
+        created += await insert_occurrences(pending_records)
+        if pending_updates:
+            await mongo.recurring_records.bulk_write(pending_updates, ordered=False)
+        pending_records, pending_updates = [], []
+
+    cursor = mongo.recurring_records.find({"active": True, "next_run": {"$lte": now}})
+    async for template in cursor:
+        next_run = None
+        for occurrence in occurrences_between(template, template["next_run"], now):
+            pending_records.append(build_occurrence_record(template, occurrence))
+            next_run = occurrence
+        following = next_occurrence(template, (next_run or now) + timedelta(seconds=1))
+        update = {"next_run": following} if following else {"next_run": None, "active": False}
+        # Only advance from the value we read, so a concurrent run cannot move it backwards.
+        pending_updates.append(UpdateOne(
+            {"_id": template["_id"], "user_id": template["user_id"], "next_run": template["next_run"]},
+            {"$set": update}))
+        if len(pending_records) >= batch_size:
+            await flush()
+    await flush()
+    return created
+
+
+class RecurringScheduler:
+    """
+    Background task calling materialize_due() every `interval` seconds.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                created = await materialize_due()
+                if created:
+                    print(f"Materialized {created} recurring records.")
+            except Exception as e:
+                print(f"Error materializing recurring records: {e}")
+            await asyncio.sleep(self.interval)
+
+
+recurring_scheduler = RecurringScheduler(get_settings().recurring_scheduler_interval_seconds)
@@ -0,0 +1,219 @@
+# app/responses.py
+"""
+How responses are encoded on the wire.
+
+JSON bodies are rendered with orjson (FastJSONResponse, the app's default
+response class), several times faster than the standard library encoder
+on large listings. FastAPI first converts whatever a route returns to
+plain JSON types with jsonable_encoder, which costs far more than the
+encoding itself for thousands of models; routes returning large listings
+return a FastJSONResponse instead, which dumps the models directly.
+
+CompressionMiddleware then compresses bodies of at least
+compression_min_size bytes with the best encoding the client accepts:
+zstd, brotli or gzip. zstd and brotli need the zstandard and Brotli
+packages; without them only gzip is offered.
+"""
+
+import asyncio
+import zlib
+from typing import Callable, Optional, Tuple
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Encodings the server can produce, best first; used to break ties
+# between encodings the client accepts equally.
+SUPPORTED_ENCODINGS = tuple(
+    encoding for encoding, available in (("zstd", zstandard), ("br", brotli), ("gzip", zlib))
+    if available is not None
+)
+
+# Bodies at least this large are compressed on a worker thread (zlib,
+# brotli and zstd release the GIL), so the event loop keeps serving.
+THREAD_COMPRESSION_MIN_SIZE = 256 * 1024
+
+# Responses compressed since startup, and their bytes before and after.
+compression_stats = {"responses": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    JSON rendered with orjson. Non-string dict keys (e.g. years in
+    analytics summaries) are written as strings, as json.dumps does, and
+    numpy values and Pydantic models are accepted.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=dump_model,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def dump_model(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the content encoding for a response from an Accept-Encoding header.
+
+    Args:
+        accept_encoding (str): The header value, e.g. "gzip, br;q=0.9, *;q=0".
+
+    Returns:
+        Optional[str]: The supported encoding with the highest q-value
+            (the server's preference on ties), or None to send the body as is.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    best, best_weight = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type == "text/event-stream":
+        # Each event must reach the client as soon as it is sent.
+        return False
+    return (content_type.startswith("text/") or content_type.endswith("json")
+            or content_type.endswith("xml") or content_type == "application/javascript")
+
+
+def new_compressor(encoding: str, level: int) -> Tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+    """
+    Start a compressed stream.
+
+    Returns:
+        Tuple: A function compressing the next chunk, and one ending the stream.
+    """
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        return compressor.compress, compressor.flush
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        return compressor.process, compressor.finish
+    if encoding == "gzip":
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress, compressor.flush
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def compress(encoding: str, level: int, body: bytes) -> bytes:
+    compress_chunk, finish = new_compressor(encoding, level)
+    return compress_chunk(body) + finish()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies with the encoding
+    negotiated from the request's Accept-Encoding header.
+
+    A response sent in one piece is compressed only if it has at least
+    minimum_size bytes; a streamed response (several body messages) is
+    compressed chunk by chunk as it goes out. Responses that are already
+    encoded, or whose content type does not compress (images, event
+    streams, ...), are passed through.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6,
+                 brotli_quality: int = 4, zstd_level: int = 3):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality, "zstd": zstd_level}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        level = self.levels[encoding]
+        start_message = None
+        # None until the first body message decides; then False to pass
+        # the response through, or the (compress, finish) pair.
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if ("content-encoding" in headers
+                        or not is_compressible(headers.get("content-type", ""))
+                        or (not more_body and len(body) < self.minimum_size)):
+                    compressor = False
+                    await send(start_message)
+                    await send(message)
+                    return
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                compression_stats["responses"] += 1
+                if not more_body:
+                    if len(body) >= THREAD_COMPRESSION_MIN_SIZE:
+                        compressed = await asyncio.to_thread(compress, encoding, level, body)
+                    else:
+                        compressed = compress(encoding, level, body)
+                    compression_stats["bytes_in"] += len(body)
+                    compression_stats["bytes_out"] += len(compressed)
+                    headers["Content-Length"] = str(len(compressed))
+                    compressor = False
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                del headers["Content-Length"]
+                compressor = new_compressor(encoding, level)
+                await send(start_message)
+            elif compressor is False:
+                await send(message)
+                return
+
+            compress_chunk, finish = compressor
+            compressed = compress_chunk(body)
+            if not more_body:
+                compressed += finish()
+            compression_stats["bytes_in"] += len(body)
+            compression_stats["bytes_out"] += len(compressed)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
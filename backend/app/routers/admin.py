@@ -0,0 +1,56 @@
+# app/routers/admin.py
+
+import asyncio
+import threading
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import PlainTextResponse
+from app.auth import require_admin
+from app.profiling import sample_stacks, format_collapsed, profile_store, dump_pstats, format_pstats
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(require_admin)]
+)
+
+
+@router.get("/profile", response_class=PlainTextResponse, status_code=200)
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=60, description="How long to sample for"),
+    interval_ms: float = Query(
+        5, ge=1, le=1000, description="Milliseconds between samples"),
+    all_threads: bool = Query(
+        False, description="Sample every thread, not just the event loop")
+):
+    """
+    Sample this worker's stacks for a number of seconds and return them in
+    collapsed (flamegraph) format. Only the worker that serves this request
+    is profiled.
+    """
+    # This handler runs on the event loop thread, which is where request
+    # handling (bcrypt, JWT decode, validation, serialization) happens.
+    thread_id = None if all_threads else threading.get_ident()
+    samples = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000, thread_id)
+    return PlainTextResponse(format_collapsed(samples))
+
+
+@router.get("/profiles/{profile_id}", status_code=200)
+async def get_request_profile(
+    profile_id: str,
+    format: str = Query(
+        "pstats", pattern="^(pstats|text)$", description="pstats (binary) or text")
+):
+    """
+    Download a profile captured with the X-Profile request header.
+    """
+    stats = profile_store.get(profile_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+
+    if format == "text":
+        return PlainTextResponse(format_pstats(stats))
+    return Response(
+        content=dump_pstats(stats),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.pstats"'},
+    )
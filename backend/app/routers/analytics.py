@@ -0,0 +1,119 @@
+# app/routers/analytics.py
+
+from fastapi import APIRouter, Depends, Query
+from typing import List
+from datetime import date
+import numpy as np
+
+from app.schemas import DailySpending, SpendingTrend, MonthlyTotals, CategoryShare, SpendingOutlier
+from app.archive import find_records_by_ids
+from app.serializers import serialize_record
+from app.auth import get_current_user
+from app.config import get_settings
+from app.money import from_cents
+from app.analytics import (
+    frame_cache, today_number, daily_expenses, rolling_mean, monthly_totals,
+    month_over_month, category_shares, find_outliers, format_month,
+)
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["Analytics"]
+)
+
+# Amounts are reported in the base currency, converted at each record's date.
+
+
+@router.get("/trends", response_model=SpendingTrend)
+async def get_spending_trend(
+    days: int = Query(90, ge=1, le=3660, description="Number of days up to today"),
+    window: int = Query(7, ge=1, le=365, description="Rolling average window in days"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Daily expenses with a trailing rolling average.
+    """
+    frame = await frame_cache.get(str(current_user["_id"]))
+    today = today_number()
+    first_day = today - days + 1
+    # Start the series early enough that the first point has a full window.
+    expenses = daily_expenses(frame, first_day - window + 1, today)
+    averages = rolling_mean(expenses, window)[window - 1:]
+    expenses = expenses[window - 1:]
+
+    return SpendingTrend(
+        currency=get_settings().base_currency,
+        window=window,
+        points=[
+            DailySpending(date=date.fromordinal(first_day + offset),
+                          expense=from_cents(int(expense)), rolling_average=round(average / 100, 2))
+            for offset, (expense, average) in enumerate(zip(expenses.tolist(), averages.tolist()))
+        ],
+    )
+
+
+@router.get("/monthly", response_model=List[MonthlyTotals])
+async def get_monthly_totals(
+    months: int = Query(12, ge=1, le=120, description="Number of months up to the current one"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Income, expense and net per calendar month, with the month-over-month
+    change in expenses.
+    """
+    frame = await frame_cache.get(str(current_user["_id"]))
+    month_numbers, income, expense = monthly_totals(frame, months, today_number())
+    change, fraction = month_over_month(expense)
+
+    totals = []
+    for index, month in enumerate(month_numbers.tolist()):
+        totals.append(MonthlyTotals(
+            month=format_month(month),
+            income=from_cents(int(income[index])),
+            expense=from_cents(int(expense[index])),
+            net=from_cents(int(income[index] - expense[index])),
+            expense_change=from_cents(int(change[index])) if index else None,
+            expense_change_pct=None if np.isnan(fraction[index]) else round(float(fraction[index]) * 100, 2),
+        ))
+    return totals
+
+
+@router.get("/categories", response_model=List[CategoryShare])
+async def get_category_shares(
+    days: int = Query(30, ge=1, le=3660, description="Number of days up to today"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Expenses per category and their share of the total, largest first.
+    """
+    frame = await frame_cache.get(str(current_user["_id"]))
+    return [
+        CategoryShare(category=category, amount=from_cents(cents), share=round(share, 4))
+        for category, cents, share in category_shares(frame, today_number() - days + 1)
+    ]
+
+
+@router.get("/outliers", response_model=List[SpendingOutlier])
+async def get_outliers(
+    days: int = Query(90, ge=1, le=3660, description="Look for outliers in this many days up to today"),
+    threshold: float = Query(3.0, gt=0, le=20, description="Standard deviations above the category mean"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Unusually large expenses: those far above the mean of their category
+    over the user's whole history.
+    """
+    user_id = str(current_user["_id"])
+    frame = await frame_cache.get(user_id)
+    outliers = find_outliers(frame, today_number() - days + 1, threshold)[:limit]
+    if not outliers:
+        return []
+
+    ids = [frame.record_id(index) for index, _ in outliers]
+    records = await find_records_by_ids(user_id, ids)
+    # Skip records deleted since the frame was built.
+    return [
+        SpendingOutlier(record=serialize_record(records[record_id]), z_score=round(z_score, 2))
+        for record_id, (_, z_score) in zip(ids, outliers) if record_id in records
+    ]
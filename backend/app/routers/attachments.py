@@ -0,0 +1,213 @@
+# app/routers/attachments.py
+
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import quote
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+
+from app.attachments import (
+    AttachmentTooLarge, THUMBNAIL_CONTENT_TYPES, get_attachment_storage, get_thumbnail_location,
+    release_blob, store_blob,
+)
+from app.archive import reads_archive, restore_record
+from app.auth import get_current_user
+from app.config import get_settings
+from app.database import mongo
+from app.schemas import AttachmentRead
+
+router = APIRouter(
+    prefix="/records",
+    tags=["Attachments"]
+)
+
+# Shown in the browser; anything else is downloaded, so uploaded HTML or
+# SVG never runs on the API's origin.
+INLINE_CONTENT_TYPES = THUMBNAIL_CONTENT_TYPES | {"application/pdf"}
+
+
+def parse_object_id(value: str, name: str) -> ObjectId:
+    if not ObjectId.is_valid(value):
+        raise HTTPException(status_code=400, detail=f"Invalid {name} ID format.")
+    return ObjectId(value)
+
+
+def attachment_summary(attachment: dict) -> dict:
+    """
+    The metadata of an attachment kept on its record, as in AttachmentRead.
+    """
+    return {
+        "id": str(attachment["_id"]),
+        "filename": attachment["filename"],
+        "content_type": attachment["content_type"],
+        "size": attachment["size"],
+    }
+
+
+async def find_attachment(user_id: str, record_id: str, attachment_id: str) -> dict:
+    attachment = await mongo.attachments.find_one({
+        "_id": parse_object_id(attachment_id, "attachment"),
+        "user_id": user_id,
+        "record_id": str(parse_object_id(record_id, "record")),
+    })
+    if attachment is None:
+        raise HTTPException(status_code=404, detail="Attachment not found.")
+    return attachment
+
+
+async def find_blob(attachment: dict) -> dict:
+    blob = await mongo.attachment_blobs.find_one({"_id": attachment["sha256"]})
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Attachment not found.")
+    return blob
+
+
+def content_disposition(disposition: str, filename: str) -> str:
+    fallback = filename.encode("ascii", "replace").decode("ascii").replace('"', "_").replace("\\", "_")
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def stream_blob(location: str, etag: str, content_type: str, size: Optional[int],
+                headers: dict, if_none_match: Optional[str]) -> Response:
+    """
+    Stream stored content. Blobs never change (they are addressed by their
+    hash), so clients may cache them for good.
+    """
+    headers = {**headers, "ETag": etag, "Cache-Control": "private, max-age=31536000, immutable",
+               "X-Content-Type-Options": "nosniff"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    return StreamingResponse(get_attachment_storage().open(location),
+                             media_type=content_type, headers=headers)
+
+
+@router.post("/{record_id}/attachments", response_model=AttachmentRead, status_code=201)
+async def upload_attachment(
+    record_id: str,
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255, description="Name of the uploaded file"),
+    content_type: str = Header("application/octet-stream"),
+    content_length: Optional[int] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Attach a file to a record. The request body is the file itself (not a
+    multipart form), streamed to storage as it arrives.
+    """
+    user_id = str(current_user["_id"])
+    record_oid = parse_object_id(record_id, "record")
+    settings = get_settings()
+    if content_length is not None and content_length > settings.attachment_max_bytes:
+        raise HTTPException(status_code=413, detail="The file is too large.")
+
+    record_filter = {"_id": record_oid, "user_id": user_id}
+    record = await mongo.records.find_one(record_filter, {"attachments": 1})
+    if not record and reads_archive(current_user):
+        # Records being changed are hot again.
+        record = await restore_record(user_id, record_oid)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found.")
+    if len(record.get("attachments", [])) >= settings.attachment_max_per_record:
+        raise HTTPException(status_code=400, detail="The record has too many attachments.")
+
+    try:
+        blob = await store_blob(request.stream(), settings.attachment_max_bytes)
+    except AttachmentTooLarge:
+        raise HTTPException(status_code=413, detail="The file is too large.")
+    if blob["size"] == 0:
+        await release_blob(blob["_id"])
+        raise HTTPException(status_code=400, detail="The file is empty.")
+
+    attachment = {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "record_id": str(record_oid),
+        "filename": filename,
+        "content_type": content_type.split(";")[0].strip().lower() or "application/octet-stream",
+        "size": blob["size"],
+        "sha256": blob["_id"],
+        "created_at": datetime.now(timezone.utc),
+    }
+    await mongo.attachments.insert_one(attachment)
+    # The limit is checked again here: uploads to a record may race.
+    result = await mongo.records.update_one(
+        {**record_filter, f"attachments.{settings.attachment_max_per_record - 1}": {"$exists": False}},
+        {"$push": {"attachments": attachment_summary(attachment)},
+         "$set": {"updated_at": datetime.now(timezone.utc)}},
+    )
+    if result.matched_count == 0:
+        await mongo.attachments.delete_one({"_id": attachment["_id"], "user_id": user_id})
+        await release_blob(blob["_id"])
+        raise HTTPException(status_code=409, detail="The record was changed or deleted. Please try again.")
+
+    return AttachmentRead(**attachment_summary(attachment))
+
+
+@router.get("/{record_id}/attachments/{attachment_id}", status_code=200)
+async def download_attachment(
+    record_id: str,
+    attachment_id: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Download an attachment, streamed from storage.
+    """
+    attachment = await find_attachment(str(current_user["_id"]), record_id, attachment_id)
+    blob = await find_blob(attachment)
+    disposition = "inline" if attachment["content_type"] in INLINE_CONTENT_TYPES else "attachment"
+    return stream_blob(
+        blob["location"], f'"{blob["_id"]}"', attachment["content_type"], blob["size"],
+        {"Content-Disposition": content_disposition(disposition, attachment["filename"])},
+        if_none_match)
+
+
+@router.get("/{record_id}/attachments/{attachment_id}/thumbnail", status_code=200)
+async def download_thumbnail(
+    record_id: str,
+    attachment_id: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    A small JPEG preview of an image attachment, made on first request and
+    shared by every attachment with the same content.
+    """
+    attachment = await find_attachment(str(current_user["_id"]), record_id, attachment_id)
+    if attachment["content_type"] not in THUMBNAIL_CONTENT_TYPES:
+        raise HTTPException(status_code=404, detail="No thumbnail for this attachment.")
+    blob = await find_blob(attachment)
+    location = await get_thumbnail_location(blob)
+    if location is None:
+        # Not an image Pillow can read (or Pillow is not installed).
+        raise HTTPException(status_code=404, detail="No thumbnail for this attachment.")
+    return stream_blob(location, f'"{blob["_id"]}-thumbnail"', "image/jpeg", None, {}, if_none_match)
+
+
+@router.delete("/{record_id}/attachments/{attachment_id}", status_code=200)
+async def delete_attachment(
+    record_id: str,
+    attachment_id: str,
+    current_user: dict = Depends(get_current_user),
+):
+    user_id = str(current_user["_id"])
+    attachment = await mongo.attachments.find_one_and_delete({
+        "_id": parse_object_id(attachment_id, "attachment"),
+        "user_id": user_id,
+        "record_id": str(parse_object_id(record_id, "record")),
+    })
+    if attachment is None:
+        raise HTTPException(status_code=404, detail="Attachment not found.")
+    pull = {"$pull": {"attachments": {"id": attachment_id}},
+            "$set": {"updated_at": datetime.now(timezone.utc)}}
+    record_filter = {"_id": ObjectId(record_id), "user_id": user_id}
+    result = await mongo.records.update_one(record_filter, pull)
+    if result.matched_count == 0:
+        await mongo.archived_records.update_one(record_filter, pull)
+    await release_blob(attachment["sha256"])
+
+    return {"message": "Attachment deleted successfully."}
@@ -0,0 +1,136 @@
+# app/routers/batch.py
+
+import asyncio
+from typing import Any, Optional, Tuple
+from urllib.parse import unquote
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.datastructures import Headers
+
+from app.auth import get_current_user, RESOLVED_USER_SCOPE_KEY
+from app.responses import FastJSONResponse
+from app.schemas import BatchOperation, BatchRequest, BatchResponse
+
+router = APIRouter(
+    prefix="/batch",
+    tags=["Batch"]
+)
+
+# Set by the batch request itself; a sub-request cannot override them.
+RESERVED_HEADERS = {"authorization", "content-length", "content-type", "host"}
+
+
+def build_scope(request: Request, operation: BatchOperation, body: bytes, current_user: dict) -> dict:
+    """
+    The ASGI scope of a sub-request: the operation's method, path and
+    headers, and the batch request's client, credentials and resolved user.
+    """
+    path, _, query_string = operation.path.partition("?")
+    headers = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+               for name, value in operation.headers.items()
+               if name.lower() not in RESERVED_HEADERS]
+    headers.append((b"host", request.headers.get("host", "").encode("latin-1")))
+    authorization = request.headers.get("authorization")
+    if authorization:
+        headers.append((b"authorization", authorization.encode("latin-1")))
+    if body:
+        headers.append((b"content-type", b"application/json"))
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": operation.method,
+        "scheme": request.scope.get("scheme", "http"),
+        "path": unquote(path),
+        "raw_path": path.encode("latin-1"),
+        "root_path": request.scope.get("root_path", ""),
+        "query_string": query_string.encode("latin-1"),
+        "headers": headers,
+        "client": request.scope.get("client"),
+        "server": request.scope.get("server"),
+        RESOLVED_USER_SCOPE_KEY: current_user,
+    }
+    if "state" in request.scope:
+        scope["state"] = dict(request.scope["state"])
+    return scope
+
+
+async def call_app(app, scope: dict, body: bytes) -> Tuple[int, Headers, bytes]:
+    """
+    Run one request through an ASGI app in this process.
+
+    Returns:
+        Tuple[int, Headers, bytes]: The response status, headers and body.
+    """
+    status = 500
+    raw_headers = []
+    chunks = []
+    request_sent = False
+    response_complete = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, raw_headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            raw_headers = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    await app(scope, receive, send)
+    return status, Headers(raw=raw_headers), b"".join(chunks)
+
+
+def decode_body(headers: Headers, body: bytes) -> Optional[Any]:
+    if not body:
+        return None
+    if "json" in headers.get("content-type", ""):
+        return orjson.loads(body)
+    return body.decode("utf-8", errors="replace")
+
+
+async def run_operation(request: Request, operation: BatchOperation, current_user: dict) -> dict:
+    body = b"" if operation.body is None else orjson.dumps(operation.body)
+    try:
+        status, headers, content = await call_app(
+            request.app, build_scope(request, operation, body, current_user), body)
+        result_body = decode_body(headers, content)
+    except Exception as e:
+        print(f"Error running batch operation {operation.method} {operation.path}: {e}")
+        status, result_body = 500, {"detail": "Internal Server Error"}
+    return {"id": operation.id, "status": status, "body": result_body}
+
+
+@router.post("/", response_model=BatchResponse, status_code=200)
+async def run_batch(
+    batch: BatchRequest,
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Run several API requests in one round trip.
+
+    The caller is authenticated once, for the whole batch; every operation
+    then runs as that user through the regular routes (validation, rate
+    limits, errors), concurrently, so operations must not depend on one
+    another. Each result carries the operation's id, status and body, in
+    the order of the operations; one failing does not fail the batch.
+    """
+    # However the path was spelled, a batch never runs inside another.
+    if RESOLVED_USER_SCOPE_KEY in request.scope:
+        raise HTTPException(status_code=400, detail="Batches cannot be nested.")
+    results = await asyncio.gather(
+        *(run_operation(request, operation, current_user) for operation in batch.requests))
+    # Bodies are already plain JSON; skip revalidating them.
+    return FastJSONResponse({"responses": list(results)})
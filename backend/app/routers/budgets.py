@@ -0,0 +1,145 @@
+# app/routers/budgets.py
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timezone
+
+from app.schemas import BudgetCreate, BudgetRead, BudgetUpdate, BudgetUtilization
+from app.database import mongo
+from app.serializers import serialize_budget
+from app.auth import get_current_user
+from app.budgets import category_key, month_key, recompute_spend, check_budget_alerts
+from app.money import to_cents, from_cents
+
+router = APIRouter(
+    prefix="/budgets",
+    tags=["Budgets"]
+)
+
+
+@router.post("/", response_model=BudgetRead, status_code=201)
+async def create_budget(budget: BudgetCreate, current_user: dict = Depends(get_current_user)):
+    """
+    Create a monthly budget for one category.
+    """
+    user_id = str(current_user["_id"])
+    budget_dict = budget.model_dump(exclude={"limit"})
+    budget_dict["limit_cents"] = to_cents(budget.limit)
+    budget_dict["user_id"] = user_id
+    budget_dict["created_at"] = datetime.now(timezone.utc)
+
+    # Categories match case-insensitively, so "groceries" would share the
+    # spend total of an existing "Groceries" budget.
+    async for existing in mongo.budgets.find({"user_id": user_id}, {"category": 1}):
+        if category_key(existing["category"]) == category_key(budget.category):
+            raise HTTPException(
+                status_code=409, detail="A budget for this category already exists.")
+    try:
+        result = await mongo.budgets.insert_one(budget_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=409, detail="A budget for this category already exists.")
+    budget_dict["_id"] = result.inserted_id
+
+    # Count this month's existing expenses once; later writes $inc the total.
+    await recompute_spend(user_id, budget.category)
+    return serialize_budget(budget_dict)
+
+
+@router.get("/", response_model=List[BudgetRead])
+async def get_budgets(current_user: dict = Depends(get_current_user)):
+    user_id = str(current_user["_id"])
+    budgets = []
+    async for budget in mongo.budgets.find({"user_id": user_id}).sort("category", 1):
+        budgets.append(serialize_budget(budget))
+    return budgets
+
+
+@router.get("/utilization", response_model=List[BudgetUtilization])
+async def get_budget_utilization(
+    month: Optional[str] = Query(
+        None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$", description="YYYY-MM; defaults to the current month"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Spend against every budget for a month.
+
+    Reads one precomputed spend total per budget, so the cost grows with the
+    number of budgets, not the number of records.
+    """
+    user_id = str(current_user["_id"])
+    month = month or month_key(datetime.now(timezone.utc))
+
+    budgets = [budget async for budget in mongo.budgets.find({"user_id": user_id}).sort("category", 1)]
+    spent_by_category = {}
+    async for spend in mongo.budget_spend.find({
+        "user_id": user_id,
+        "month": month,
+        "category": {"$in": [category_key(budget["category"]) for budget in budgets]},
+    }):
+        spent_by_category[spend["category"]] = spend["spent_cents"]
+
+    utilization = []
+    for budget in budgets:
+        spent = spent_by_category.get(category_key(budget["category"]), 0)
+        utilization.append(BudgetUtilization(
+            budget_id=str(budget["_id"]),
+            category=budget["category"],
+            month=month,
+            limit=from_cents(budget["limit_cents"]),
+            spent=from_cents(spent),
+            remaining=from_cents(budget["limit_cents"] - spent),
+            utilization=round(spent / budget["limit_cents"], 4),
+        ))
+    return utilization
+
+
+@router.patch("/{budget_id}", response_model=BudgetRead, status_code=200)
+async def update_budget(budget_id: str, updated_budget: BudgetUpdate, current_user: dict = Depends(get_current_user)):
+    """
+    Change a budget's limit or alert thresholds. This month's alerts are
+    re-evaluated against the new values.
+    """
+    user_id = str(current_user["_id"])
+
+    if not ObjectId.is_valid(budget_id):
+        raise HTTPException(status_code=400, detail="Invalid budget ID format.")
+
+    budget = await mongo.budgets.find_one({"_id": ObjectId(budget_id), "user_id": user_id})
+    if not budget:
+        raise HTTPException(status_code=404, detail="Budget not found.")
+
+    update_data = updated_budget.model_dump(exclude_unset=True, exclude_none=True)
+    if "limit" in update_data:
+        update_data["limit_cents"] = to_cents(update_data.pop("limit"))
+    if update_data:
+        await mongo.budgets.update_one({"_id": budget["_id"], "user_id": user_id}, {"$set": update_data})
+        budget.update(update_data)
+
+        # Thresholds the spend no longer reaches under the new limit may alert again.
+        month = month_key(datetime.now(timezone.utc))
+        spend = await mongo.budget_spend.find_one(
+            {"user_id": user_id, "category": category_key(budget["category"]), "month": month})
+        if spend:
+            utilization = spend["spent_cents"] / budget["limit_cents"]
+            await mongo.budget_spend.update_one(
+                {"_id": spend["_id"], "user_id": user_id}, {"$pull": {"alerted": {"$gt": utilization}}})
+            await check_budget_alerts([(user_id, category_key(budget["category"]), month)])
+
+    return serialize_budget(budget)
+
+
+@router.delete("/{budget_id}", status_code=200)
+async def delete_budget(budget_id: str, current_user: dict = Depends(get_current_user)):
+    user_id = str(current_user["_id"])
+
+    if not ObjectId.is_valid(budget_id):
+        raise HTTPException(status_code=400, detail="Invalid budget ID format.")
+
+    result = await mongo.budgets.delete_one({"_id": ObjectId(budget_id), "user_id": user_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Budget not found.")
+
+    return {"message": "Budget deleted successfully."}
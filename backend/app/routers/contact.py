@@ -1,18 +1,17 @@
-import os
-import requests
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Body
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Body, Depends
 from app.schemas import ContactRequest
-from dotenv import load_dotenv
-
-load_dotenv()
+from app.config import get_settings
+from app.http_client import get_http_session
+from app.metrics import timed
+from app.rate_limit import rate_limit
 
 router = APIRouter(prefix="/contact", tags=["Contact"])
 
 
 def send_contact_email_via_service(recipient: str, subject: str, content: str):
-    email_service_url = os.getenv(
-        "EMAIL_SERVICE_URL", "http://email_microservice:9002").strip()
-    sender_email = os.getenv("SENDER_EMAIL", "default@example.com")
+    settings = get_settings()
+    email_service_url = settings.email_service_url
+    sender_email = settings.sender_email
     payload = {
         "sender_name": "FinanceManager",
         "sender_email": sender_email,
@@ -21,8 +20,9 @@ def send_contact_email_via_service(recipient: str, subject: str, content: str):
         "content": content,
     }
     try:
-        response = requests.post(
-            f"{email_service_url}/send-email", json=payload)
+        with timed("email"):
+            response = get_http_session().post(
+                f"{email_service_url}/send-email", json=payload)
         response.raise_for_status()
         print(f"Email sent: {response.json()}")
     except Exception as e:
@@ -30,9 +30,9 @@ def send_contact_email_via_service(recipient: str, subject: str, content: str):
         raise HTTPException(status_code=500, detail="Failed to send message.")
 
 
-@router.post("/", status_code=200)
+@router.post("/", status_code=200, dependencies=[Depends(rate_limit("contact", 3, 60))])
 async def contact_us(contact: ContactRequest, background_tasks: BackgroundTasks):
-    recipient = os.getenv("CONTACT_RECIPIENT_EMAIL")
+    recipient = get_settings().contact_recipient_email
     subject = f"New Contact Message from {contact.name}"
     content = f"Name: {contact.name}\nEmail: {contact.email}\n\nMessage:\n{contact.message}"
     background_tasks.add_task(
@@ -1,10 +1,15 @@
+import asyncio
 from datetime import datetime, timedelta, timezone
-from fastapi import APIRouter, Depends, HTTPException
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query
 from app.auth import get_current_user
-from app.database import records_collection
-from app.schemas import QuestionRequest
-import os
-import requests
+from app.database import mongo
+from app.schemas import QuestionRequest, AssistantJob
+from app.config import get_settings
+from app.money import from_cents, record_cents
+from app.analytics import frame_cache, assistant_context
+from app.assistant_jobs import assistant_jobs, generate_answer, AssistantQueueFull
+from app.rate_limit import rate_limit, assistant_limiter
 
 router = APIRouter(
     prefix="/personal_assistant",
@@ -12,43 +17,108 @@ router = APIRouter(
 )
 
 
-@router.post("/")
-async def personal_assistant(
-    request: QuestionRequest,
-    current_user: dict = Depends(get_current_user)
-):
-    question = request.question
+async def build_prompt(current_user: dict, question: str) -> str:
+    """
+    The LLM prompt for a user's question: their last month of records and
+    their spending trends, then the question.
+    """
     user_id = str(current_user["_id"])
     username = current_user.get("username", "User")
 
     one_month_ago = datetime.now(timezone.utc) - timedelta(days=30)
-    records_cursor = records_collection.find({
+    records_cursor = mongo.records_reader.find({
         "user_id": user_id,
         "date": {"$gte": one_month_ago}
     })
     records = await records_cursor.to_list(length=100)
+    base_currency = get_settings().base_currency
     records_summary = "\n".join([
-        f"{record['date'].strftime('%Y-%m-%d')}: Spent ${record['amount']} on {record.get('category', 'various')}."
+        f"{record['date'].strftime('%Y-%m-%d')}: Spent {from_cents(record_cents(record)):.2f} {record.get('currency') or base_currency} on {record.get('category', 'various')}."
         for record in records
     ])
 
+    # Computed from the cached frame of all the user's records, not just the last month.
+    trends = assistant_context(await frame_cache.get(user_id))
+
     system_message = (
         f"You are a highly knowledgeable personal finance assistant. The user, {username}, has the following recent transaction history:\n"
         f"{records_summary}\n\n"
+        f"Spending trends:\n{trends}\n\n"
         "Provide personalized financial advice, budgeting tips, and recommendations. Limit the response to 100 words."
     )
+    return f"{system_message}\nUser question: {question}"
+
+
+def serialize_job(job: dict) -> AssistantJob:
+    return AssistantJob(
+        id=str(job["_id"]),
+        status=job["status"],
+        response=job.get("response"),
+        error=job.get("error"),
+        created_at=job["created_at"],
+        finished_at=job.get("finished_at"),
+    )
 
-    llm_service_url = os.getenv("LLM_SERVICE_URL", "default_value").strip()
-    payload = {"prompt": f"{system_message}\nUser question: {question}"}
 
+@router.post("/", dependencies=[
+    Depends(rate_limit("assistant", 10, 60, by_user=True)),
+    Depends(assistant_limiter),
+])
+async def personal_assistant(
+    request: QuestionRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Answer a question, holding the request open until the LLM is done.
+    Prefer POST /personal_assistant/jobs, which does not.
+    """
+    prompt = await build_prompt(current_user, request.question)
     try:
-        llm_response = requests.post(
-            f"{llm_service_url}/generate", json=payload)
-        llm_response.raise_for_status()
-        data = llm_response.json()
-        ai_response = data.get("response", "No response from AI.")
+        ai_response = await asyncio.to_thread(generate_answer, prompt)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error calling LLM microservice: {str(e)}")
 
     return {"response": ai_response}
+
+
+@router.post("/jobs", response_model=AssistantJob, status_code=202, dependencies=[
+    Depends(rate_limit("assistant", 10, 60, by_user=True)),
+])
+async def submit_question(
+    request: QuestionRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue a question and return its job straight away. Fetch the answer with
+    GET /personal_assistant/jobs/{job_id}.
+    """
+    prompt = await build_prompt(current_user, request.question)
+    try:
+        job = await assistant_jobs.submit(str(current_user["_id"]), prompt)
+    except AssistantQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many questions waiting. Please retry shortly.",
+            headers={"Retry-After": "5"},
+        )
+    return serialize_job(job)
+
+
+@router.get("/jobs/{job_id}", response_model=AssistantJob)
+async def get_question_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=30, description="Seconds to wait for the answer before returning"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    A question job and, once done, its answer. With wait, the request is
+    held until the job finishes or wait seconds pass (long polling).
+    """
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID format.")
+
+    job = await assistant_jobs.get(str(current_user["_id"]), ObjectId(job_id), wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return serialize_job(job)
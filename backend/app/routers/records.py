@@ -1,16 +1,30 @@
 # app/routers/records.py
 
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, Header
 from typing import List, Optional
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
+import numpy as np
 
 
-from app.schemas import RecordCreate, RecordRead, RecordUpdate
-from app.database import records_collection
-from app.serializers import serialize_record
+from app.schemas import RecordCreate, RecordRead, RecordUpdate, RecordType, RecordSummary, RecordSyncPage, check_amount_precision
+from app.database import mongo, SORTABLE_RECORD_FIELDS, stored_record_field
+from app.serializers import serialize_record, serialize_record_fields
+from app.responses import FastJSONResponse
 from app.auth import get_current_user
+from app.ingestion import record_write_buffer, BufferFullError
+from app.config import get_settings
+from app.currency import convert_record_cents, get_exchange_rates
+from app.money import to_cents, from_cents, bound_to_cents, sum_by_group
+from app.record_events import records_created, record_updated, record_deleted
+from app.search import search_records
+from app.sync import changes_since, write_tombstone, SyncTokenError, SyncTokenExpired
+from app.archive import (
+    as_utc, record_tiers, reads_archive, find_across_tiers, count_across_tiers, find_records_by_ids,
+    day_groups, archived_day_groups, restore_record, delete_archived_record,
+)
 
 router = APIRouter(
     prefix="/records",
@@ -18,29 +32,248 @@ router = APIRouter(
 )
 
 
+async def claim_idempotency_key(user_id: str, key: str, record_id: ObjectId) -> Optional[dict]:
+    """
+    Reserve an Idempotency-Key for a new record.
+
+    Args:
+        user_id (str): The user creating the record.
+        key (str): The client-supplied Idempotency-Key.
+        record_id (ObjectId): The id the new record will be inserted with.
+
+    Returns:
+        Optional[dict]: None if the key was free and is now reserved for
+        record_id, otherwise the record created by the original request.
+    """
+    try:
+        await mongo.idempotency_keys.insert_one({
+            "user_id": user_id,
+            "key": key,
+            "record_id": record_id,
+            "created_at": datetime.now(timezone.utc),
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+
+    claimed = await mongo.idempotency_keys.find_one({"user_id": user_id, "key": key})
+    original = None
+    if claimed:
+        original = await mongo.records.find_one({"_id": claimed["record_id"], "user_id": user_id})
+    if original is None:
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress.")
+    return original
+
+
+async def release_idempotency_key(user_id: str, key: Optional[str], record_id: ObjectId):
+    """
+    Free a reserved Idempotency-Key after the create failed, so the client's
+    retry performs the insert instead of waiting on a record that never lands.
+    The key is kept if the record was written despite the error.
+    """
+    if not key:
+        return
+    try:
+        if await mongo.records.find_one({"_id": record_id, "user_id": user_id}, {"_id": 1}) is None:
+            await mongo.idempotency_keys.delete_one(
+                {"user_id": user_id, "key": key, "record_id": record_id})
+    except Exception:
+        # Leave the key in place; it expires with its TTL.
+        pass
+
+
 @router.post("/", response_model=RecordRead, status_code=201)
-async def create_record(record: RecordCreate, current_user: dict = Depends(get_current_user)):
+async def create_record(
+    record: RecordCreate,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    buffered: bool = Query(
+        False, description="Queue the insert in the write buffer and acknowledge immediately"),
+    idempotency_key: Optional[str] = Header(
+        None, alias="Idempotency-Key", max_length=255,
+        description="Retries with the same key return the original record")
+):
     """
     Create a new record for the authenticated user.
+
+    With buffered=true (and the write buffer enabled on the server) the record
+    is assigned its id here, queued for a batched insert and acknowledged with
+    202 before it reaches the database. Otherwise it is inserted directly.
+
+    With an Idempotency-Key header, a retry of an already completed create
+    returns the original record instead of inserting a duplicate.
     """
     user_id = str(current_user["_id"])
 
-    record_dict = record.model_dump()
+    record_dict = record.model_dump(exclude={"amount"})
+    record_dict["amount_cents"] = to_cents(record.amount)
     record_dict["user_id"] = user_id
     record_dict["date"] = datetime.now(timezone.utc)
+    record_dict["updated_at"] = record_dict["date"]
+    record_dict["currency"] = record.currency or get_settings().base_currency
+
+    if idempotency_key:
+        record_dict["_id"] = ObjectId()
+        original = await claim_idempotency_key(user_id, idempotency_key, record_dict["_id"])
+        if original is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return serialize_record(original)
+
+    if buffered and record_write_buffer.running:
+        record_dict.setdefault("_id", ObjectId())
+        try:
+            record_write_buffer.submit(record_dict)
+        except BufferFullError:
+            await release_idempotency_key(user_id, idempotency_key, record_dict["_id"])
+            raise HTTPException(
+                status_code=503,
+                detail="Too many pending records. Retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+        response.status_code = 202
+        return serialize_record(record_dict)
 
     try:
-        result = await records_collection.insert_one(record_dict)
-        inserted_record = await records_collection.find_one({"_id": result.inserted_id})
+        result = await mongo.records.insert_one(record_dict)
+        inserted_record = await mongo.records.find_one({"_id": result.inserted_id, "user_id": user_id})
     except Exception:
+        await release_idempotency_key(user_id, idempotency_key, record_dict.get("_id"))
         raise HTTPException(
             status_code=500,
             detail="Internal server error."
         )
 
+    await records_created([inserted_record])
     return serialize_record(inserted_record)
 
 
+def build_records_filter(
+    user_id: str,
+    category: Optional[str] = None,
+    record_type: Optional[RecordType] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+) -> dict:
+    """
+    Build the MongoDB filter for a user's record listing.
+
+    Args:
+        user_id (str): The owner of the records.
+        category (Optional[str]): Case-insensitive category keyword.
+        record_type (Optional[RecordType]): Only income or only expense records.
+        date_from (Optional[datetime]): Inclusive lower bound on the record date.
+        date_to (Optional[datetime]): Exclusive upper bound on the record date.
+        min_amount (Optional[float]): Inclusive lower bound on the amount.
+        max_amount (Optional[float]): Inclusive upper bound on the amount.
+
+    Returns:
+        dict: The query filter, always scoped to user_id.
+    """
+    # Dates without an offset are UTC, as stored; an aware and a naive
+    # bound cannot be compared otherwise.
+    date_from = as_utc(date_from) if date_from else None
+    date_to = as_utc(date_to) if date_to else None
+    if date_from and date_to and date_from >= date_to:
+        raise HTTPException(
+            status_code=400, detail="date_from must be earlier than date_to.")
+    if min_amount is not None and max_amount is not None and min_amount > max_amount:
+        raise HTTPException(
+            status_code=400, detail="min_amount must not exceed max_amount.")
+
+    query_filter = {"user_id": user_id}
+    if category:
+        query_filter["category"] = {"$regex": category, "$options": "i"}
+    if record_type:
+        query_filter["type"] = record_type.value
+
+    date_range = {}
+    if date_from:
+        date_range["$gte"] = date_from
+    if date_to:
+        date_range["$lt"] = date_to
+    if date_range:
+        query_filter["date"] = date_range
+
+    amount_range = {}
+    if min_amount is not None:
+        amount_range["$gte"] = bound_to_cents(min_amount, lower=True)
+    if max_amount is not None:
+        amount_range["$lte"] = bound_to_cents(max_amount, lower=False)
+    if amount_range:
+        query_filter["amount_cents"] = amount_range
+
+    return query_filter
+
+
+def build_records_sort(sort_field: str, sort_order: int) -> list:
+    """
+    Build the sort specification for a user's record listing.
+
+    Args:
+        sort_field (str): One of SORTABLE_RECORD_FIELDS.
+        sort_order (int): 1 for ascending, -1 for descending.
+
+    Returns:
+        list: The sort keys on the stored fields, with _id as a stable tiebreak.
+    """
+    if sort_field not in SORTABLE_RECORD_FIELDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported sort field. Use one of: {', '.join(SORTABLE_RECORD_FIELDS)}.")
+    if sort_order not in (1, -1):
+        raise HTTPException(
+            status_code=400, detail="Sort order must be 1 or -1.")
+    return [(stored_record_field(sort_field), sort_order), ("_id", sort_order)]
+
+
+# Fields a listing can be trimmed to with fields=.
+RECORD_FIELDS = tuple(RecordRead.model_fields)
+
+
+def parse_record_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a comma-separated fields= list into RecordRead field names.
+
+    Returns:
+        Optional[List[str]]: The fields in the order given, or None for all fields.
+    """
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in RECORD_FIELDS]
+    if not names or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported fields. Use any of: {', '.join(RECORD_FIELDS)}.")
+    return names
+
+
+def build_records_projection(fields: List[str], sort: list) -> dict:
+    """
+    Build the MongoDB projection for a listing trimmed to some fields.
+
+    Args:
+        fields (List[str]): RecordRead field names (see parse_record_fields).
+        sort (list): The listing's sort (see build_records_sort); its fields
+            are read too, to merge record tiers.
+
+    Returns:
+        dict: The stored fields to read. _id is always read; it is in every
+        listing index, so a projection within an index stays covered.
+    """
+    projection = {"_id": 1}
+    for field in fields:
+        if field != "id":
+            projection[stored_record_field(field)] = 1
+    for stored, _ in sort:
+        projection[stored] = 1
+    return projection
+
+
 @router.get("/", status_code=200)
 async def get_records(
     current_user: dict = Depends(get_current_user),
@@ -49,31 +282,164 @@ async def get_records(
         10, ge=1, le=100, description="Maximum number of records to return"),
     category: Optional[str] = Query(
         None, description="Filter records by category keyword"),
-    sortField: Optional[str] = Query("date", description="Field to sort by"),
-    sortOrder: Optional[int] = Query(
+    type: Optional[RecordType] = Query(
+        None, description="Filter records by type (income or expense)"),
+    date_from: Optional[datetime] = Query(
+        None, description="Only records dated on or after this timestamp"),
+    date_to: Optional[datetime] = Query(
+        None, description="Only records dated before this timestamp"),
+    min_amount: Optional[float] = Query(
+        None, ge=0, description="Only records with at least this amount"),
+    max_amount: Optional[float] = Query(
+        None, ge=0, description="Only records with at most this amount"),
+    sortField: str = Query(
+        "date", description=f"Field to sort by: {', '.join(SORTABLE_RECORD_FIELDS)}"),
+    sortOrder: int = Query(
         -1, description="Sort order: 1 for ascending, -1 for descending"),
     all: bool = Query(
-        False, description="If true, return all records without pagination")
+        False, description="If true, return all records without pagination"),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated fields to return, e.g. id,amount,category,date; default all")
 ):
+    """
+    List the user's records, filtered, sorted and paginated.
+
+    With fields=, each record carries only those fields and only they are
+    read from the database. id,date,amount,category,type sorted by date is
+    served from an index without reading the records.
+    """
     user_id = str(current_user["_id"])
-    query_filter = {"user_id": user_id}
-    if category:
-        query_filter["category"] = {"$regex": category, "$options": "i"}
+    field_names = parse_record_fields(fields)
+    query_filter = build_records_filter(
+        user_id,
+        category=category,
+        record_type=type,
+        date_from=date_from,
+        date_to=date_to,
+        min_amount=min_amount,
+        max_amount=max_amount,
+    )
+    sort = build_records_sort(sortField, sortOrder)
+    projection = None if field_names is None else build_records_projection(field_names, sort)
+
+    def serialize(record: dict):
+        if field_names is None:
+            return serialize_record(record)
+        return serialize_record_fields(record, field_names)
 
+    # Archived records are only read when the range reaches back to them.
+    tiers = record_tiers(current_user, date_from)
     if all:
-        records = []
-        async for record in records_collection.find(query_filter).sort(sortField, sortOrder):
-            records.append(serialize_record(record))
+        records = [serialize(record)
+                   for record in await find_across_tiers(tiers, query_filter, sort, projection=projection)]
         total = len(records)
     else:
-        total = await records_collection.count_documents(query_filter)
-        records = []
-        async for record in records_collection.find(query_filter).sort(sortField, sortOrder).skip(skip).limit(limit):
-            records.append(serialize_record(record))
+        total = await count_across_tiers(tiers, query_filter)
+        records = [serialize(record)
+                   for record in await find_across_tiers(tiers, query_filter, sort, skip, limit, projection)]
+
+    # Skips FastAPI's jsonable_encoder pass, slow on all=true listings.
+    return FastJSONResponse({"records": records, "total": total})
 
+
+@router.get("/search", status_code=200)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to find in descriptions and categories"),
+    skip: int = Query(0, ge=0, description="Number of results to skip"),
+    limit: int = Query(10, ge=1, le=100, description="Maximum number of results to return"),
+    prefix: bool = Query(True, description="Match the last word as a prefix (append * to any word for the same)"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Find records containing every word of the query, best matches first.
+
+    Matching and ranking run against an in-memory index of the user's
+    records; only the returned page is read from the database.
+    """
+    user_id = str(current_user["_id"])
+    ids, total = await search_records(user_id, q, skip=skip, limit=limit, prefix_last=prefix)
+    found = await find_records_by_ids(user_id, ids)
+    records = [serialize_record(found[record_id]) for record_id in ids if record_id in found]
     return {"records": records, "total": total}
 
 
+@router.get("/sync", response_model=RecordSyncPage)
+async def sync_records(
+    since: Optional[str] = Query(
+        None, description="next_token from the previous sync; omit to fetch every record"),
+    limit: int = Query(500, ge=1, le=5000, description="Maximum number of changes to return"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Records created or updated, and ids of records deleted, since a sync token.
+
+    Pass next_token back as since until has_more is false, then keep it for
+    the next sync. Changes may be sent more than once. A token older than the
+    tombstone retention gets 410; the client then syncs from scratch.
+    """
+    try:
+        changed, deleted, next_token, has_more = await changes_since(
+            str(current_user["_id"]), since, limit)
+    except SyncTokenError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SyncTokenExpired:
+        raise HTTPException(
+            status_code=410, detail="Sync token expired. Sync again without since.")
+
+    return RecordSyncPage(
+        records=[serialize_record(record) for record in changed],
+        deleted=[str(record_id) for record_id in deleted],
+        next_token=next_token,
+        has_more=has_more,
+    )
+
+
+@router.get("/summary", response_model=RecordSummary)
+async def get_records_summary(
+    current_user: dict = Depends(get_current_user),
+    date_from: Optional[datetime] = Query(
+        None, description="Only records dated on or after this timestamp"),
+    date_to: Optional[datetime] = Query(
+        None, description="Only records dated before this timestamp"),
+    currency: Optional[str] = Query(
+        None, min_length=3, max_length=3, description="Report totals in this currency"),
+):
+    """
+    Income, expense and per-category totals over a date range, converted to
+    one currency at each day's rate. Totals are exact to the cent.
+    """
+    table = get_exchange_rates()
+    target = (currency or get_settings().base_currency).upper()
+    if not table.supports(target):
+        raise HTTPException(status_code=400, detail=f"Unsupported currency: {target}")
+
+    user_id = str(current_user["_id"])
+    query_filter = build_records_filter(user_id, date_from=date_from, date_to=date_to)
+    # Sum exactly in the database per currency, day, type and category, so
+    # only the group totals are converted and returned, not every record.
+    # Archived days come from their rollups.
+    groups = await day_groups(mongo.records_reader, query_filter)
+    if reads_archive(current_user, date_from):
+        groups += await archived_day_groups(user_id, date_from, date_to)
+
+    cents = convert_record_cents(groups, target, table)
+    is_expense = np.array([group["type"] == "expense" for group in groups], dtype=bool)
+    categories = np.array([group["category"] for group in groups], dtype=object)
+    expense_categories, category_index = np.unique(categories[is_expense], return_inverse=True)
+    by_category = sum_by_group(cents[is_expense], category_index, len(expense_categories))
+
+    total_income = int(cents[~is_expense].sum())
+    total_expense = int(cents[is_expense].sum())
+    return RecordSummary(
+        currency=target,
+        total_income=from_cents(total_income),
+        total_expense=from_cents(total_expense),
+        net=from_cents(total_income - total_expense),
+        by_category={str(name): from_cents(int(total))
+                     for name, total in zip(expense_categories, by_category)},
+    )
+
+
 @router.patch("/{record_id}", response_model=RecordRead, status_code=200)
 async def update_record(record_id: str, updated_record: RecordUpdate, current_user: dict = Depends(get_current_user)):
     """
@@ -85,23 +451,38 @@ async def update_record(record_id: str, updated_record: RecordUpdate, current_us
         raise HTTPException(
             status_code=400, detail="Invalid record ID format.")
 
-    record = await records_collection.find_one({"_id": ObjectId(record_id), "user_id": user_id})
+    record = await mongo.records.find_one({"_id": ObjectId(record_id), "user_id": user_id})
+    if not record and reads_archive(current_user):
+        # Updated records are hot again.
+        record = await restore_record(user_id, ObjectId(record_id))
     if not record:
         raise HTTPException(
             status_code=404, detail="Record not found."
         )
 
     update_data = updated_record.model_dump(exclude_unset=True)
+    if "amount" in update_data:
+        try:
+            check_amount_precision(update_data["amount"], update_data.get("currency") or record.get("currency"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        update_data["amount_cents"] = to_cents(update_data.pop("amount"))
     if update_data:
+        update_data["updated_at"] = datetime.now(timezone.utc)
         try:
-            await records_collection.update_one(
-                {"_id": ObjectId(record_id)},
-                {"$set": update_data}
+            # Return the document as it was, so budget spend moves by exactly
+            # this update's difference even if another update raced it.
+            previous = await mongo.records.find_one_and_update(
+                {"_id": ObjectId(record_id), "user_id": user_id},
+                {"$set": update_data, "$unset": {"amount": ""}}
             )
-            record = await records_collection.find_one({"_id": ObjectId(record_id)})
+            record = await mongo.records.find_one({"_id": ObjectId(record_id), "user_id": user_id})
         except Exception:
             raise HTTPException(
                 status_code=500, detail="Internal server error.")
+        if previous is None or record is None:
+            raise HTTPException(status_code=404, detail="Record not found.")
+        await record_updated(previous, {**previous, **update_data})
 
     return serialize_record(record)
 
@@ -114,11 +495,15 @@ async def delete_record(record_id: str, current_user: dict = Depends(get_current
         raise HTTPException(status_code=400, detail="Invalid record ID format.")
 
     # Attempt to delete the record without a try/except that swallows HTTPExceptions.
-    result = await records_collection.delete_one(
+    deleted = await mongo.records.find_one_and_delete(
         {"_id": ObjectId(record_id), "user_id": user_id}
     )
-    if result.deleted_count == 0:
+    if deleted is None and reads_archive(current_user):
+        deleted = await delete_archived_record(user_id, ObjectId(record_id))
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Record not found.")
-    
+    await write_tombstone(deleted)
+    await record_deleted(deleted)
+
     return {"message": "Record deleted successfully."}
 
@@ -0,0 +1,204 @@
+# app/routers/recurring.py
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import numpy as np
+
+from app.schemas import (
+    RecurringRecordCreate, RecurringRecordRead, RecurringRecordUpdate,
+    BalanceProjection, ProjectionPoint, check_amount_precision,
+)
+from app.database import mongo
+from app.serializers import serialize_recurring_record
+from app.auth import get_current_user
+from app.config import get_settings
+from app.currency import convert_record_cents, get_exchange_rates
+from app.money import to_cents, from_cents, record_cents
+from app.recurrence import next_occurrence, occurrences_between, as_utc
+
+router = APIRouter(
+    prefix="/recurring",
+    tags=["Recurring Records"]
+)
+
+# Projections look at most this far ahead and return at most this many points.
+MAX_PROJECTION_DAYS = 5 * 366
+MAX_PROJECTION_POINTS = 10000
+
+
+@router.post("/", response_model=RecurringRecordRead, status_code=201)
+async def create_recurring_record(template: RecurringRecordCreate, current_user: dict = Depends(get_current_user)):
+    """
+    Create a recurring record template. Occurrences become regular records
+    when the scheduler materializes them.
+    """
+    user_id = str(current_user["_id"])
+    max_templates = get_settings().recurring_max_templates_per_user
+    if await mongo.recurring_records.count_documents({"user_id": user_id}, limit=max_templates) >= max_templates:
+        raise HTTPException(
+            status_code=400,
+            detail=f"You can have at most {max_templates} recurring records.")
+
+    template_dict = template.model_dump(exclude={"amount"})
+    template_dict["amount_cents"] = to_cents(template.amount)
+    template_dict["user_id"] = user_id
+    template_dict["currency"] = template.currency or get_settings().base_currency
+    template_dict["start_date"] = as_utc(template.start_date)
+    if template.end_date:
+        template_dict["end_date"] = as_utc(template.end_date)
+    template_dict["next_run"] = next_occurrence(template_dict, template_dict["start_date"])
+    template_dict["active"] = template_dict["next_run"] is not None
+    template_dict["created_at"] = datetime.now(timezone.utc)
+
+    result = await mongo.recurring_records.insert_one(template_dict)
+    template_dict["_id"] = result.inserted_id
+    return serialize_recurring_record(template_dict)
+
+
+@router.get("/", response_model=List[RecurringRecordRead])
+async def get_recurring_records(current_user: dict = Depends(get_current_user)):
+    """
+    List the authenticated user's recurring record templates.
+    """
+    user_id = str(current_user["_id"])
+    templates = []
+    async for template in mongo.recurring_records.find({"user_id": user_id}).sort("_id", 1):
+        templates.append(serialize_recurring_record(template))
+    return templates
+
+
+@router.get("/projection", response_model=BalanceProjection)
+async def project_balance(
+    until: datetime = Query(..., description="Project occurrences up to this date (inclusive)."),
+    starting_balance: Decimal = Query(
+        Decimal("0"), max_digits=15, decimal_places=2, description="Balance to project from."),
+    currency: Optional[str] = Query(
+        None, min_length=3, max_length=3, description="Project balances in this currency"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Project future balances from the user's active recurring templates.
+
+    Only the templates are read; historical records are not scanned, so the
+    cost depends on the number of templates and projected occurrences.
+    """
+    now = datetime.now(timezone.utc)
+    until = as_utc(until)
+    if until < now:
+        raise HTTPException(status_code=400, detail="until must be in the future.")
+    if until > now + timedelta(days=MAX_PROJECTION_DAYS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Projections are limited to {MAX_PROJECTION_DAYS} days ahead.")
+
+    table = get_exchange_rates()
+    target = (currency or get_settings().base_currency).upper()
+    if not table.supports(target):
+        raise HTTPException(status_code=400, detail=f"Unsupported currency: {target}")
+
+    user_id = str(current_user["_id"])
+    upcoming = []
+    async for template in mongo.recurring_records.find({"user_id": user_id, "active": True}):
+        # Occurrences that are due but not yet materialized still count.
+        start = as_utc(template["next_run"]) if template.get("next_run") else now
+        for occurrence in occurrences_between(template, start, until, limit=MAX_PROJECTION_POINTS):
+            upcoming.append((occurrence, template))
+    upcoming.sort(key=lambda item: (item[0], str(item[1]["_id"])))
+    upcoming = upcoming[:MAX_PROJECTION_POINTS]
+
+    # Convert every occurrence at its own date's rate in one pass.
+    cents = convert_record_cents(
+        [{**template, "date": occurrence} for occurrence, template in upcoming], target, table)
+    signed = np.where([template["type"] == "income" for _, template in upcoming], cents, -cents)
+    balances = to_cents(starting_balance) + np.cumsum(signed, dtype=np.int64)
+
+    points = []
+    for (occurrence, template), balance in zip(upcoming, balances.tolist()):
+        points.append(ProjectionPoint(
+            date=occurrence,
+            recurring_id=str(template["_id"]),
+            category=template["category"],
+            type=template["type"],
+            amount=from_cents(record_cents(template)),
+            currency=template.get("currency") or table.base_currency,
+            balance=from_cents(balance),
+        ))
+
+    total_income = int(cents[signed > 0].sum())
+    total_expense = int(cents[signed < 0].sum())
+    return BalanceProjection(
+        currency=target,
+        starting_balance=starting_balance,
+        ending_balance=from_cents(to_cents(starting_balance) + total_income - total_expense),
+        total_income=from_cents(total_income),
+        total_expense=from_cents(total_expense),
+        points=points,
+    )
+
+
+@router.patch("/{recurring_id}", response_model=RecurringRecordRead, status_code=200)
+async def update_recurring_record(recurring_id: str, updated_template: RecurringRecordUpdate, current_user: dict = Depends(get_current_user)):
+    """
+    Update a template. Changes apply to occurrences materialized afterwards;
+    records already created are left as they are.
+    """
+    user_id = str(current_user["_id"])
+
+    if not ObjectId.is_valid(recurring_id):
+        raise HTTPException(status_code=400, detail="Invalid recurring record ID format.")
+
+    template = await mongo.recurring_records.find_one({"_id": ObjectId(recurring_id), "user_id": user_id})
+    if not template:
+        raise HTTPException(status_code=404, detail="Recurring record not found.")
+
+    update_data = updated_template.model_dump(exclude_unset=True)
+    if update_data.get("amount") is not None:
+        try:
+            check_amount_precision(update_data["amount"], template.get("currency"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        update_data["amount_cents"] = to_cents(update_data.pop("amount"))
+    update_data.pop("amount", None)
+    if update_data.get("end_date"):
+        update_data["end_date"] = as_utc(update_data["end_date"])
+        if update_data["end_date"] < as_utc(template["start_date"]):
+            raise HTTPException(status_code=400, detail="end_date must not be before start_date.")
+    if "end_date" in update_data or update_data.get("active"):
+        # Recompute the next occurrence against the new end date, or from now on reactivation.
+        candidate = {**template, **update_data}
+        if template.get("active", True) and template.get("next_run"):
+            after = as_utc(template["next_run"])
+        else:
+            after = datetime.now(timezone.utc)
+        update_data["next_run"] = next_occurrence(candidate, after)
+        if update_data["next_run"] is None:
+            update_data["active"] = False
+
+    if update_data:
+        await mongo.recurring_records.update_one(
+            {"_id": ObjectId(recurring_id), "user_id": user_id}, {"$set": update_data, "$unset": {"amount": ""}})
+        template = await mongo.recurring_records.find_one({"_id": ObjectId(recurring_id), "user_id": user_id})
+
+    return serialize_recurring_record(template)
+
+
+@router.delete("/{recurring_id}", status_code=200)
+async def delete_recurring_record(recurring_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Delete a template. Records it already created are kept.
+    """
+    user_id = str(current_user["_id"])
+
+    if not ObjectId.is_valid(recurring_id):
+        raise HTTPException(status_code=400, detail="Invalid recurring record ID format.")
+
+    result = await mongo.recurring_records.delete_one(
+        {"_id": ObjectId(recurring_id), "user_id": user_id}
+    )
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Recurring record not found.")
+
+    return {"message": "Recurring record deleted successfully."}
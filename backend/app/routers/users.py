@@ -1,73 +1,110 @@
 # app/routers/users.py
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Body
-from typing import List
+import asyncio
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Body, Query
+from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
 from app.schemas import UserCreate, UserSignin, UserRead, UserUpdate, ForgotPasswordRequest, TokenPair, TokenRefresh
-from app.database import users_collection
+from app.database import mongo
 from app.utils import hash_password, verify_password, create_token, decode_access_token
 from app.serializers import serialize_user
-from app.auth import get_current_user
-import os
-from dotenv import load_dotenv
-import requests
-load_dotenv()
-
-
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
-RESET_TOKEN_EXPIRE_MINUTES = int(os.getenv("RESET_TOKEN_EXPIRE_MINUTES", 30))
-REFRESH_TOKEN_EXPIRE_MINUTES = int(
-    os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES", 1440))
+from app.auth import get_current_user, require_admin
+from app.config import get_settings
+from app.http_client import get_http_session
+from app.metrics import timed
+from app.rate_limit import rate_limit, password_hashing_limiter
 
 router = APIRouter(
     prefix="/users",
     tags=["Users"]
 )
 
+
+async def claim_email(email: str, user_id: ObjectId):
+    """
+    Map an email to a user. user_emails is keyed (and sharded) by email, so
+    the lookup at sign-in is routed to one shard, and its unique _id keeps
+    two accounts from sharing an email.
+
+    Raises:
+        DuplicateKeyError: If the email belongs to another user.
+    """
+    await mongo.user_emails.insert_one({"_id": email, "user_id": user_id})
+
+
+async def release_email(email: str, user_id: ObjectId):
+    """
+    Unmap an email from a user, once the user is deleted or has another
+    email. The caller's change is already made, so a failure is logged
+    rather than raised; the stale mapping is left behind.
+    """
+    try:
+        await mongo.user_emails.delete_one({"_id": email, "user_id": user_id})
+    except Exception as e:
+        print(f"Error releasing email mapping of user {user_id}: {e}")
+
+
+async def find_user_by_email(email: str) -> Optional[dict]:
+    """
+    Look a user up by email through user_emails, then by id.
+    """
+    mapping = await mongo.user_emails.find_one({"_id": email})
+    if mapping is None:
+        return None
+    return await mongo.users.find_one({"_id": mapping["user_id"]})
+
+
 # ------------------------------------
 # User Endpoints
 # ------------------------------------
 
 
-@router.post("/signup", response_model=TokenPair, status_code=201)
+@router.post("/signup", response_model=TokenPair, status_code=201,
+             dependencies=[Depends(rate_limit("signup", 5, 60)), Depends(password_hashing_limiter)])
 async def create_user(user: UserCreate):
     """
     Register a new user. All fields are required except id.
     """
-    # Fetch user by email
-    existing_users = await users_collection.find_one({"email": user.email})
-    if existing_users:
+    # Reserve the email for the new user's id
+    user_dict = user.model_dump()
+    user_dict["_id"] = ObjectId()
+    try:
+        await claim_email(user.email, user_dict["_id"])
+    except DuplicateKeyError:
         raise HTTPException(status_code=400, detail="Email already in use.")
 
     # Insert new user into MongoDB
-    user_dict = user.model_dump()
     user_dict["created_at"] = datetime.now(timezone.utc)
     user_dict["updated_at"] = datetime.now(timezone.utc)
 
-    # Hash the password before storing
-    user_dict["password"] = hash_password(user.password)
+    # Hash the password before storing; bcrypt runs on a worker thread,
+    # within password_hashing_limiter, so the event loop keeps serving.
+    user_dict["password"] = await asyncio.to_thread(hash_password, user.password)
 
     try:
-        result = await users_collection.insert_one(user_dict)
-        inserted_user = await users_collection.find_one({"_id": result.inserted_id})
+        result = await mongo.users.insert_one(user_dict)
+        inserted_user = await mongo.users.find_one({"_id": result.inserted_id})
     except Exception:
+        await release_email(user.email, user_dict["_id"])
         raise HTTPException(status_code=500, detail="Internal server error.")
 
     # Generate JWT token
     access_token = create_token(
         data={"sub": str(inserted_user["_id"])},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expires_delta=timedelta(minutes=get_settings().access_token_expire_minutes)
     )
     refresh_token = create_token(
         data={"sub": str(inserted_user["_id"])},
-        expires_delta=timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+        expires_delta=timedelta(minutes=get_settings().refresh_token_expire_minutes)
     )
 
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
-@router.post("/signin", response_model=TokenPair, status_code=200)
+@router.post("/signin", response_model=TokenPair, status_code=200,
+             dependencies=[Depends(rate_limit("signin", 10, 60)), Depends(password_hashing_limiter)])
 async def signin(credentials: UserSignin):
     """
     Sign-in a user by verifying their email and password.
@@ -80,12 +117,12 @@ async def signin(credentials: UserSignin):
             status_code=400, detail="Email and password are required."
         )
     # Fetch user by email
-    user = await users_collection.find_one({"email": email})
+    user = await find_user_by_email(email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found.")
 
     # Verify password
-    if not verify_password(password, user.get("password", "")):
+    if not await asyncio.to_thread(verify_password, password, user.get("password", "")):
         raise HTTPException(
             status_code=400,
             detail="Invalid credentials."
@@ -94,11 +131,11 @@ async def signin(credentials: UserSignin):
     # Generate JWT token
     access_token = create_token(
         data={"sub": str(user["_id"])},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expires_delta=timedelta(minutes=get_settings().access_token_expire_minutes)
     )
     refresh_token = create_token(
         data={"sub": str(user["_id"])},
-        expires_delta=timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+        expires_delta=timedelta(minutes=get_settings().refresh_token_expire_minutes)
     )
 
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
@@ -114,7 +151,7 @@ async def refresh_token(token_refresh: TokenRefresh):
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token.")
 
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+    user = await mongo.users.find_one({"_id": ObjectId(user_id)})
     if user is None:
         raise HTTPException(
             status_code=401,
@@ -123,11 +160,11 @@ async def refresh_token(token_refresh: TokenRefresh):
         )
     access_token = create_token(
         data={"sub": str(user["_id"])},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expires_delta=timedelta(minutes=get_settings().access_token_expire_minutes)
     )
     new_refresh_token = create_token(
         data={"sub": str(user["_id"])},
-        expires_delta=timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+        expires_delta=timedelta(minutes=get_settings().refresh_token_expire_minutes)
     )
 
     return {"access_token": access_token, "refresh_token": new_refresh_token, "token_type": "bearer"}
@@ -152,20 +189,29 @@ async def get_user(user_id: str, current_user: dict = Depends(get_current_user))
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID format.")
 
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+    user = await mongo.users.find_one({"_id": ObjectId(user_id)})
     if not user:
         raise HTTPException(status_code=404, detail="User not found.")
 
     return serialize_user(user)
 
 
-@router.get("/", response_model=List[UserRead], status_code=200)
-async def get_all_users():
+@router.get("/", response_model=List[UserRead], status_code=200, dependencies=[Depends(require_admin)])
+async def get_all_users(
+    after: Optional[str] = Query(None, description="Return users after this user_id"),
+    limit: int = Query(100, ge=1, le=1000)
+):
     """
-    Retrieve a list of all users.
+    Retrieve a page of users in id order. An operational endpoint (it reads
+    every shard), so it requires the admin key.
     """
+    query_filter = {}
+    if after is not None:
+        if not ObjectId.is_valid(after):
+            raise HTTPException(status_code=400, detail="Invalid user ID format.")
+        query_filter["_id"] = {"$gt": ObjectId(after)}
     all_users = []
-    async for user in users_collection.find():
+    async for user in mongo.users.find(query_filter).sort("_id", 1).limit(limit):
         all_users.append(serialize_user(user))
     return all_users
 
@@ -183,23 +229,36 @@ async def update_user(user_id: str, updated_fields: UserUpdate, current_user: di
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID format.")
 
-    user = await users_collection.find_one({"_id": ObjectId(user_id)})
+    user = await mongo.users.find_one({"_id": ObjectId(user_id)})
     if not user:
         raise HTTPException(status_code=404, detail="User not found.")
 
     update_data = updated_fields.model_dump(exclude_unset=True)
+    new_email = update_data.get("email")
+    previous_email = user["email"]
+    email_changed = new_email is not None and new_email != previous_email
+    if email_changed:
+        try:
+            await claim_email(new_email, user["_id"])
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Email already in use.")
     if update_data:
         update_data["updated_at"] = datetime.now(timezone.utc)
         try:
-            await users_collection.update_one(
+            await mongo.users.update_one(
                 {"_id": ObjectId(user_id)},
                 {"$set": update_data}
             )
-            user = await users_collection.find_one({"_id": ObjectId(user_id)})
+            user = await mongo.users.find_one({"_id": ObjectId(user_id)})
         except Exception:
+            if email_changed:
+                await release_email(new_email, user["_id"])
             raise HTTPException(
                 status_code=500, detail="Internal server error."
             )
+        if email_changed:
+            # The target user's stored email, not the caller's.
+            await release_email(previous_email, user["_id"])
 
     return serialize_user(user)
 
@@ -218,11 +277,12 @@ async def delete_user(user_id: str, current_user: dict = Depends(get_current_use
         raise HTTPException(status_code=400, detail="Invalid user ID format.")
 
     try:
-        result = await users_collection.delete_one({"_id": ObjectId(user_id)})
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="User not found.")
+        user = await mongo.users.find_one_and_delete({"_id": ObjectId(user_id)})
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error.")
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found.")
+    await release_email(user["email"], user["_id"])
 
     return {"message": f"User {user_id} has been deleted successfully."}
 
@@ -232,8 +292,9 @@ def send_reset_email_via_service(email: str, reset_link: str):
     Sends a password reset email via the email microservice.
     """
     # Get the email service URL from environment variables
-    email_service_url = os.getenv("EMAIL_SERVICE_URL", "http://email_microservice:9002").strip()
-    sender_email = os.getenv("SENDER_EMAIL", "default@example.com")
+    settings = get_settings()
+    email_service_url = settings.email_service_url
+    sender_email = settings.sender_email
     subject = "Password Reset Request"
     content = f"Please click the following link to reset your password:\n\n{reset_link}"
     payload = {
@@ -244,13 +305,14 @@ def send_reset_email_via_service(email: str, reset_link: str):
         "content": content,
     }
     try:
-        response = requests.post(f"{email_service_url}/send-email", json=payload)
+        with timed("email"):
+            response = get_http_session().post(f"{email_service_url}/send-email", json=payload)
         response.raise_for_status()
         print(f"Email sent: {response.json()}")
     except Exception as e:
         print(f"Error sending email: {e}")
 
-@router.post("/forgot-password")
+@router.post("/forgot-password", dependencies=[Depends(rate_limit("forgot_password", 3, 60))])
 async def forgot_password(
     request: ForgotPasswordRequest,
     background_tasks: BackgroundTasks
@@ -265,7 +327,7 @@ async def forgot_password(
     print(f"Received forgot-password request for email: {email}")
     
     # Look up the user by email
-    user = await users_collection.find_one({"email": email})
+    user = await find_user_by_email(email)
     if not user:
         print("No user found for that email.")
         return {"msg": "If that email is registered, a reset link has been sent."}
@@ -273,7 +335,7 @@ async def forgot_password(
     # Generate a temporary reset token for password reset
     reset_token = create_token(
         data={"sub": str(user["_id"])},
-        expires_delta=timedelta(minutes=int(os.getenv("RESET_TOKEN_EXPIRE_MINUTES", "30"))),
+        expires_delta=timedelta(minutes=get_settings().reset_token_expire_minutes),
         token_type="reset"
     )
     print(f"Generated reset token: {reset_token}")
@@ -287,7 +349,8 @@ async def forgot_password(
     
     return {"msg": "If that email is registered, a reset link has been sent."}
 
-@router.post("/reset-password")
+@router.post("/reset-password",
+             dependencies=[Depends(rate_limit("reset_password", 5, 60)), Depends(password_hashing_limiter)])
 async def reset_password(
     token: str = Body(...),
     new_password: str = Body(...)
@@ -305,8 +368,8 @@ async def reset_password(
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token payload.")
 
-    new_hashed_password = hash_password(new_password)
-    result = await users_collection.update_one(
+    new_hashed_password = await asyncio.to_thread(hash_password, new_password)
+    result = await mongo.users.update_one(
         {"_id": ObjectId(user_id)},
         {"$set": {"password": new_hashed_password}}
     )
@@ -316,11 +379,11 @@ async def reset_password(
     # Generate new tokens for automatic sign-in
     access_token = create_token(
         data={"sub": user_id},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expires_delta=timedelta(minutes=get_settings().access_token_expire_minutes)
     )
     refresh_token = create_token(
         data={"sub": user_id},
-        expires_delta=timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+        expires_delta=timedelta(minutes=get_settings().refresh_token_expire_minutes)
     )
 
     return {
@@ -1,9 +1,29 @@
 # app/schemas.py
 
-from pydantic import BaseModel, EmailStr, Field, field_validator
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+from typing import Any, Dict, List, Literal, Optional
+from datetime import date, datetime
+from decimal import Decimal
 from enum import Enum
+from urllib.parse import unquote
+
+from app.recurrence import CronSchedule
+from app.currency import get_exchange_rates
+from app.money import ZERO_DECIMAL_CURRENCIES
+
+
+def check_currency(v: Optional[str]) -> Optional[str]:
+    if v is None:
+        return v
+    v = v.strip().upper()
+    if not get_exchange_rates().supports(v):
+        raise ValueError(f'Unsupported currency: {v}')
+    return v
+
+
+def check_amount_precision(amount: Optional[Decimal], currency: Optional[str]):
+    if amount is not None and currency in ZERO_DECIMAL_CURRENCIES and amount != amount.to_integral_value():
+        raise ValueError(f'{currency} amounts must be whole numbers')
 
 
 # -------- User Schemas --------
@@ -55,10 +75,12 @@ class RecordType(str, Enum):
     expense = "expense"
 
 class RecordCreate(BaseModel):
-    amount: float = Field(..., gt=0)
+    amount: Decimal = Field(..., gt=0, max_digits=15, decimal_places=2)
     category: str = Field(..., min_length=3, max_length=50)
     description: Optional[str] = Field(None, max_length=255)
     type: RecordType
+    # ISO 4217 code; the base currency when omitted.
+    currency: Optional[str] = Field(None, min_length=3, max_length=3)
 
     @field_validator('category')
     def validate_category(cls, v):
@@ -66,6 +88,22 @@ class RecordCreate(BaseModel):
             raise ValueError('Category must not be empty or just whitespace')
         return v
 
+    @field_validator('currency')
+    def validate_currency(cls, v):
+        return check_currency(v)
+
+    @model_validator(mode='after')
+    def validate_amount_precision(self):
+        check_amount_precision(self.amount, self.currency)
+        return self
+
+
+class AttachmentRead(BaseModel):
+    id: str
+    filename: str
+    content_type: str
+    size: int
+
 
 class RecordRead(BaseModel):
     id: str
@@ -75,16 +113,21 @@ class RecordRead(BaseModel):
     description: Optional[str]
     date: datetime
     type: RecordType
+    currency: str
+    updated_at: Optional[datetime] = None
+    # Metadata only; contents are downloaded from /records/{id}/attachments/.
+    attachments: List[AttachmentRead] = Field(default_factory=list)
 
     # Enables compatibility with ORM objects
     model_config = {"from_attributes": True}
 
 
 class RecordUpdate(BaseModel):
-    amount: float = Field(..., gt=0)
+    amount: Decimal = Field(..., gt=0, max_digits=15, decimal_places=2)
     category: Optional[str] = Field(None, min_length=3, max_length=50)
     description: Optional[str] = Field(None, max_length=255)
     type: Optional[RecordType] = Field(None)
+    currency: Optional[str] = Field(None, min_length=3, max_length=3)
 
     @field_validator('category')
     def validate_category(cls, v):
@@ -92,6 +135,223 @@ class RecordUpdate(BaseModel):
             raise ValueError('Category must not be empty or just whitespace')
         return v
 
+    @field_validator('currency')
+    def validate_currency(cls, v):
+        return check_currency(v)
+
+    @model_validator(mode='after')
+    def validate_amount_precision(self):
+        check_amount_precision(self.amount, self.currency)
+        return self
+
+
+class RecordSyncPage(BaseModel):
+    records: List[RecordRead]
+    # Ids of records deleted since the token.
+    deleted: List[str]
+    next_token: str
+    has_more: bool
+
+
+class RecordSummary(BaseModel):
+    currency: str
+    total_income: float
+    total_expense: float
+    net: float
+    # Expenses per category.
+    by_category: Dict[str, float]
+
+
+# -------- Recurring Record Schemas --------
+
+class RecurrenceFrequency(str, Enum):
+    daily = "daily"
+    weekly = "weekly"
+    monthly = "monthly"
+    cron = "cron"
+
+
+class RecurringRecordCreate(BaseModel):
+    amount: Decimal = Field(..., gt=0, max_digits=15, decimal_places=2)
+    category: str = Field(..., min_length=3, max_length=50)
+    description: Optional[str] = Field(None, max_length=255)
+    type: RecordType
+    currency: Optional[str] = Field(None, min_length=3, max_length=3)
+    frequency: RecurrenceFrequency
+    # Every `interval` days/weeks/months; ignored for cron schedules.
+    interval: int = Field(1, ge=1, le=366)
+    # Five-field cron expression (minute hour day month weekday), in UTC.
+    cron: Optional[str] = Field(None, max_length=100)
+    start_date: datetime
+    end_date: Optional[datetime] = None
+
+    @field_validator('category')
+    def validate_category(cls, v):
+        if not v.strip():
+            raise ValueError('Category must not be empty or just whitespace')
+        return v
+
+    @field_validator('currency')
+    def validate_currency(cls, v):
+        return check_currency(v)
+
+    @model_validator(mode='after')
+    def validate_schedule(self):
+        if self.frequency == RecurrenceFrequency.cron:
+            if not self.cron:
+                raise ValueError('A cron expression is required for cron schedules')
+            # Each run materializes a record; "* * * * *" would make 1440 a day.
+            if CronSchedule(self.cron).times_per_day > 1:
+                raise ValueError('Cron schedules may run at most once a day')
+        elif self.cron:
+            raise ValueError('A cron expression is only allowed for cron schedules')
+        if self.end_date and self.end_date < self.start_date:
+            raise ValueError('end_date must not be before start_date')
+        check_amount_precision(self.amount, self.currency)
+        return self
+
+
+class RecurringRecordRead(BaseModel):
+    id: str
+    user_id: str
+    amount: float
+    category: str
+    description: Optional[str]
+    type: RecordType
+    currency: str
+    frequency: RecurrenceFrequency
+    interval: int
+    cron: Optional[str]
+    start_date: datetime
+    end_date: Optional[datetime]
+    next_run: Optional[datetime]
+    active: bool
+
+    # Enables compatibility with ORM objects
+    model_config = {"from_attributes": True}
+
+
+class RecurringRecordUpdate(BaseModel):
+    amount: Optional[Decimal] = Field(None, gt=0, max_digits=15, decimal_places=2)
+    category: Optional[str] = Field(None, min_length=3, max_length=50)
+    description: Optional[str] = Field(None, max_length=255)
+    end_date: Optional[datetime] = None
+    active: Optional[bool] = None
+
+    @field_validator('category')
+    def validate_category(cls, v):
+        if v and not v.strip():
+            raise ValueError('Category must not be empty or just whitespace')
+        return v
+
+
+class ProjectionPoint(BaseModel):
+    date: datetime
+    recurring_id: str
+    category: str
+    type: RecordType
+    # In the template's currency.
+    amount: float
+    currency: str
+    # In the projection's currency.
+    balance: float
+
+
+class BalanceProjection(BaseModel):
+    currency: str
+    starting_balance: float
+    ending_balance: float
+    total_income: float
+    total_expense: float
+    points: List[ProjectionPoint]
+
+
+# -------- Budget Schemas --------
+
+class BudgetCreate(BaseModel):
+    category: str = Field(..., min_length=3, max_length=50)
+    limit: Decimal = Field(..., gt=0, max_digits=15, decimal_places=2)
+    # Fractions of the limit that trigger an email, e.g. 0.8 for 80%.
+    alert_thresholds: List[float] = Field(default_factory=lambda: [0.8, 1.0], max_length=10)
+
+    @field_validator('category')
+    def validate_category(cls, v):
+        if not v.strip():
+            raise ValueError('Category must not be empty or just whitespace')
+        return v
+
+    @field_validator('alert_thresholds')
+    def validate_alert_thresholds(cls, v):
+        if any(t <= 0 or t > 10 for t in v):
+            raise ValueError('Alert thresholds must be between 0 and 10')
+        return sorted(set(v))
+
+
+class BudgetRead(BaseModel):
+    id: str
+    user_id: str
+    category: str
+    limit: float
+    alert_thresholds: List[float]
+
+    # Enables compatibility with ORM objects
+    model_config = {"from_attributes": True}
+
+
+class BudgetUpdate(BaseModel):
+    limit: Optional[Decimal] = Field(None, gt=0, max_digits=15, decimal_places=2)
+    alert_thresholds: Optional[List[float]] = Field(None, max_length=10)
+
+    @field_validator('alert_thresholds')
+    def validate_alert_thresholds(cls, v):
+        if v is not None and any(t <= 0 or t > 10 for t in v):
+            raise ValueError('Alert thresholds must be between 0 and 10')
+        return sorted(set(v)) if v is not None else v
+
+
+class BudgetUtilization(BaseModel):
+    budget_id: str
+    category: str
+    month: str
+    limit: float
+    spent: float
+    remaining: float
+    utilization: float
+
+
+# -------- Analytics Schemas --------
+
+class DailySpending(BaseModel):
+    date: date
+    expense: float
+    rolling_average: float
+
+
+class SpendingTrend(BaseModel):
+    currency: str
+    window: int
+    points: List[DailySpending]
+
+
+class MonthlyTotals(BaseModel):
+    month: str
+    income: float
+    expense: float
+    net: float
+    expense_change: Optional[float] = None
+    expense_change_pct: Optional[float] = None
+
+
+class CategoryShare(BaseModel):
+    category: str
+    amount: float
+    share: float
+
+
+class SpendingOutlier(BaseModel):
+    record: RecordRead
+    z_score: float
+
 
 # -------- Token Schema --------
 
@@ -115,6 +375,60 @@ class TokenRefresh(BaseModel):
 class QuestionRequest(BaseModel):
     question: str
 
+
+class AssistantJobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class AssistantJob(BaseModel):
+    id: str
+    status: AssistantJobStatus
+    response: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+# -------- Batch Schemas --------
+
+# Operations accepted in one POST /batch/.
+MAX_BATCH_OPERATIONS = 20
+
+
+class BatchOperation(BaseModel):
+    id: Optional[str] = Field(None, max_length=100)
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"] = "GET"
+    # Path and query string, e.g. "/records/?limit=10".
+    path: str = Field(..., min_length=1, max_length=2000)
+    body: Optional[Any] = None
+    headers: Dict[str, str] = Field(default_factory=dict)
+
+    @field_validator('path')
+    def check_path(cls, v):
+        # The path is routed percent-decoded; check what will be routed.
+        path = unquote(v.split('?')[0])
+        if not path.startswith('/') or path.startswith('//'):
+            raise ValueError('path must start with a single /')
+        if path.rstrip('/') == '/batch':
+            raise ValueError('Batches cannot be nested')
+        return v
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchOperation] = Field(..., min_length=1, max_length=MAX_BATCH_OPERATIONS)
+
+
+class BatchResult(BaseModel):
+    id: Optional[str] = None
+    status: int
+    body: Any = None
+
+
+class BatchResponse(BaseModel):
+    responses: List[BatchResult]
+
 # -------- ForgotPasswordRequest Schema --------
 
 class ForgotPasswordRequest(BaseModel):
@@ -0,0 +1,291 @@
+# app/search.py
+
+import bisect
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from app.config import get_settings
+from app.archive import load_user_records
+from app.user_cache import UserCache
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Query terms: a word, optionally followed by * to match it as a prefix.
+QUERY_TERM_PATTERN = re.compile(r"(\w+)(\*?)")
+
+# BM25 parameters.
+K1 = 1.2
+B = 0.75
+# Category words count this many times towards a record's term frequencies.
+CATEGORY_WEIGHT = 2
+# A prefix matches at most this many index terms, the most frequent first.
+MAX_PREFIX_EXPANSIONS = 100
+
+
+def as_utc(value: datetime) -> datetime:
+    # Dates read back from MongoDB are naive UTC.
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+def record_terms(record: dict) -> Counter:
+    terms = Counter(tokenize(record.get("description")))
+    for term in tokenize(record.get("category")):
+        terms[term] += CATEGORY_WEIGHT
+    return terms
+
+
+def parse_query(query: str, prefix_last: bool = True) -> List[Tuple[str, bool]]:
+    """
+    Split a query into (term, is_prefix) pairs. Terms ending in * match as
+    prefixes, and so does the last term when prefix_last is set, so results
+    follow the user as they type.
+    """
+    terms = [(term.lower(), bool(star)) for term, star in QUERY_TERM_PATTERN.findall(query)]
+    if terms and prefix_last:
+        terms[-1] = (terms[-1][0], True)
+    return terms
+
+
+class SearchIndex:
+    """
+    Inverted index over one user's record descriptions and categories.
+
+    Each record gets a slot. Postings (slot, term frequency) of all terms
+    are packed into two NumPy arrays, ordered by term and addressed through
+    per-term offsets. Records written after the last pack go into a small
+    dict segment that is packed in once it holds MERGE_FRACTION of the
+    records (and at least MERGE_THRESHOLD), so repacking stays linear in
+    the number of writes.
+    Updating or deleting a record marks its old slot dead; dead slots are
+    skipped at query time and their postings dropped when packing.
+    """
+
+    MERGE_THRESHOLD = 2000
+    MERGE_FRACTION = 0.25
+
+    def __init__(self):
+        self.ids: List[ObjectId] = []
+        self.slots: Dict[ObjectId, int] = {}
+        self._timestamps = np.zeros(0)
+        self._lengths = np.zeros(0)
+        self._alive = np.zeros(0, dtype=bool)
+        self._total_length = 0
+        # Packed segment.
+        self._term_ids: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._posting_slots = np.zeros(0, dtype=np.int64)
+        self._posting_frequencies = np.zeros(0, dtype=np.float64)
+        # Recent segment: term -> {slot: frequency}.
+        self._recent: Dict[str, Dict[int, int]] = {}
+        self._recent_count = 0
+        self._sorted_terms: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    @classmethod
+    def build(cls, records: List[dict]) -> "SearchIndex":
+        """
+        Index many records at once, straight into the packed segment.
+        """
+        index = cls()
+        term_ids, slots, frequencies, timestamps, lengths = [], [], [], [], []
+        for slot, record in enumerate(records):
+            terms = record_terms(record)
+            index.ids.append(record["_id"])
+            timestamps.append(as_utc(record["date"]).timestamp())
+            lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                term_ids.append(index._term_ids.setdefault(term, len(index._term_ids)))
+                slots.append(slot)
+                frequencies.append(frequency)
+        index.slots = {record_id: slot for slot, record_id in enumerate(index.ids)}
+        index._timestamps = np.array(timestamps, dtype=np.float64)
+        index._lengths = np.array(lengths, dtype=np.float64)
+        index._alive = np.ones(len(records), dtype=bool)
+        index._total_length = index._lengths.sum()
+        index._pack_postings(np.array(term_ids, dtype=np.int64), np.array(slots, dtype=np.int64),
+                             np.array(frequencies, dtype=np.float64))
+        return index
+
+    def _grow(self, size: int):
+        if size <= len(self._alive):
+            return
+        capacity = max(size, 2 * len(self._alive), 64)
+        self._timestamps = np.resize(self._timestamps, capacity)
+        self._lengths = np.resize(self._lengths, capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+
+    def add(self, record: dict):
+        """
+        Index a new record, or re-index an updated one.
+        """
+        self.remove(record["_id"])
+        terms = record_terms(record)
+        slot = len(self.ids)
+        self._grow(slot + 1)
+        self.ids.append(record["_id"])
+        self.slots[record["_id"]] = slot
+        self._timestamps[slot] = as_utc(record["date"]).timestamp()
+        self._lengths[slot] = sum(terms.values())
+        self._alive[slot] = True
+        self._total_length += self._lengths[slot]
+        for term, frequency in terms.items():
+            if term not in self._recent:
+                self._recent[term] = {}
+                if term not in self._term_ids:
+                    self._sorted_terms = None
+            self._recent[term][slot] = frequency
+        self._recent_count += 1
+        if self._recent_count >= max(self.MERGE_THRESHOLD, self.MERGE_FRACTION * len(self.slots)):
+            self.pack()
+
+    def remove(self, record_id: ObjectId):
+        slot = self.slots.pop(record_id, None)
+        if slot is not None:
+            self._alive[slot] = False
+            self._total_length -= self._lengths[slot]
+
+    def pack(self):
+        """
+        Merge the recent segment into the packed one, dropping dead postings.
+        """
+        for term in self._recent:
+            self._term_ids.setdefault(term, len(self._term_ids))
+        recent_terms = [self._term_ids[term] for term, postings in self._recent.items()
+                        for _ in range(len(postings))]
+        term_ids = np.concatenate([
+            np.repeat(np.arange(len(self._offsets) - 1), np.diff(self._offsets)),
+            np.array(recent_terms, dtype=np.int64),
+        ])
+        slots = np.concatenate([self._posting_slots, np.array(
+            [slot for postings in self._recent.values() for slot in postings], dtype=np.int64)])
+        frequencies = np.concatenate([self._posting_frequencies, np.array(
+            [f for postings in self._recent.values() for f in postings.values()], dtype=np.float64)])
+
+        keep = self._alive[slots]
+        self._pack_postings(term_ids[keep], slots[keep], frequencies[keep])
+        self._recent = {}
+        self._recent_count = 0
+
+    def _pack_postings(self, term_ids: np.ndarray, slots: np.ndarray, frequencies: np.ndarray):
+        order = np.argsort(term_ids, kind="stable")
+        self._posting_slots = slots[order]
+        self._posting_frequencies = frequencies[order]
+        self._offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(term_ids, minlength=len(self._term_ids)))])
+        self._sorted_terms = None
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Slots containing a term and its frequency in each, dead slots included.
+        """
+        slots = frequencies = None
+        term_id = self._term_ids.get(term)
+        if term_id is not None:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            slots, frequencies = self._posting_slots[start:end], self._posting_frequencies[start:end]
+        recent = self._recent.get(term)
+        if recent:
+            recent_slots = np.fromiter(recent.keys(), dtype=np.int64, count=len(recent))
+            recent_frequencies = np.fromiter(recent.values(), dtype=np.float64, count=len(recent))
+            if slots is None:
+                return recent_slots, recent_frequencies
+            return np.concatenate([slots, recent_slots]), np.concatenate([frequencies, recent_frequencies])
+        if slots is None:
+            return np.zeros(0, np.int64), np.zeros(0)
+        return slots, frequencies
+
+    def expand(self, term: str, is_prefix: bool) -> List[str]:
+        """
+        Index terms a query term matches.
+        """
+        if not is_prefix:
+            return [term] if term in self._term_ids or term in self._recent else []
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._term_ids.keys() | self._recent.keys())
+        start = bisect.bisect_left(self._sorted_terms, term)
+        end = bisect.bisect_left(self._sorted_terms, term + "\U0010ffff")
+        matches = self._sorted_terms[start:end]
+        if len(matches) > MAX_PREFIX_EXPANSIONS:
+            matches = sorted(matches, key=lambda t: len(self.postings(t)[0]), reverse=True)
+            matches = matches[:MAX_PREFIX_EXPANSIONS]
+        return matches
+
+    def search(self, query: List[Tuple[str, bool]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Live records matching every query term, ranked by BM25 score and
+        then newest first. A prefix term scores as its best-matching expansion.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Slots and scores, best first.
+        """
+        if not query or not self.slots:
+            return np.zeros(0, np.int64), np.zeros(0)
+        size = len(self.ids)
+        count = len(self.slots)
+        average_length = max(self._total_length / count, 1)
+
+        scores = np.zeros(size)
+        matched = np.ones(size, dtype=bool)
+        for term, is_prefix in query:
+            term_scores = np.zeros(size)
+            for expansion in self.expand(term, is_prefix):
+                slots, frequencies = self.postings(expansion)
+                live = self._alive[slots]
+                slots, frequencies = slots[live], frequencies[live]
+                frequency_norms = K1 * (1 - B + B * self._lengths[slots] / average_length)
+                idf = np.log(1 + (count - len(slots) + 0.5) / (len(slots) + 0.5))
+                contribution = idf * frequencies * (K1 + 1) / (frequencies + frequency_norms)
+                term_scores[slots] = np.maximum(term_scores[slots], contribution)
+            matched &= term_scores > 0
+            scores += term_scores
+
+        slots = np.flatnonzero(matched)
+        order = np.lexsort((-self._timestamps[slots], -scores[slots]))
+        return slots[order], scores[slots][order]
+
+
+async def load_search_index(user_id: str) -> SearchIndex:
+    projection = {"_id": 1, "description": 1, "category": 1, "date": 1}
+    return SearchIndex.build(await load_user_records(user_id, projection))
+
+
+search_indexes = UserCache(
+    load_search_index, get_settings().search_index_max_users, get_settings().search_index_ttl_seconds)
+
+
+def index_records(records: List[dict]):
+    """
+    Add new or updated records to their users' cached indexes.
+    """
+    for record in records:
+        search_indexes.update(record["user_id"], lambda index, record=record: index.add(record))
+
+
+def unindex_record(record: dict):
+    search_indexes.update(record["user_id"], lambda index: index.remove(record["_id"]))
+
+
+async def search_records(user_id: str, query: str, skip: int = 0, limit: int = 10,
+                         prefix_last: bool = True) -> Tuple[List[ObjectId], int]:
+    """
+    Rank the user's records against a query.
+
+    Returns:
+        Tuple[List[ObjectId], int]: The ids of the requested page, best
+        first, and the total number of matches.
+    """
+    index = await search_indexes.get(user_id)
+    slots, _ = index.search(parse_query(query, prefix_last))
+    return [index.ids[slot] for slot in slots[skip:skip + limit].tolist()], len(slots)
@@ -1,6 +1,9 @@
 # app/serializers.py
 
-from app.schemas import UserRead, RecordRead
+from typing import Sequence
+from app.config import get_settings
+from app.money import from_cents, record_cents
+from app.schemas import UserRead, RecordRead, RecurringRecordRead, BudgetRead
 
 
 def serialize_user(user: dict) -> UserRead:
@@ -35,9 +38,86 @@ def serialize_record(record: dict) -> RecordRead:
     return RecordRead(
         id=str(record["_id"]),
         user_id=record["user_id"],
-        amount=record["amount"],
+        amount=from_cents(record_cents(record)),
         category=record["category"],
         description=record.get("description"),
         date=record["date"],
-        type=record.get("type")
+        type=record.get("type"),
+        currency=record.get("currency") or get_settings().base_currency,
+        updated_at=record.get("updated_at"),
+        attachments=record.get("attachments", []),
+    )
+
+
+def serialize_record_fields(record: dict, fields: Sequence[str]) -> dict:
+    """
+    Convert a (projected) MongoDB record document to a dict of the
+    requested RecordRead fields, for listings with fields=.
+
+    Args:
+        record (dict): The record document, holding at least those fields.
+        fields (Sequence[str]): RecordRead field names.
+
+    Returns:
+        dict: The fields' values, formatted as in RecordRead.
+    """
+    values = {}
+    for field in fields:
+        if field == "id":
+            values["id"] = str(record["_id"])
+        elif field == "amount":
+            values["amount"] = from_cents(record_cents(record))
+        elif field == "currency":
+            values["currency"] = record.get("currency") or get_settings().base_currency
+        elif field == "attachments":
+            values["attachments"] = record.get("attachments", [])
+        else:
+            values[field] = record.get(field)
+    return values
+
+
+def serialize_recurring_record(template: dict) -> RecurringRecordRead:
+    """
+    Convert a MongoDB recurring record template to a RecurringRecordRead model.
+
+    Args:
+        template (dict): The recurring record document from MongoDB.
+
+    Returns:
+        RecurringRecordRead: The serialized template.
+    """
+    return RecurringRecordRead(
+        id=str(template["_id"]),
+        user_id=template["user_id"],
+        amount=from_cents(record_cents(template)),
+        category=template["category"],
+        description=template.get("description"),
+        type=template["type"],
+        currency=template.get("currency") or get_settings().base_currency,
+        frequency=template["frequency"],
+        interval=template.get("interval", 1),
+        cron=template.get("cron"),
+        start_date=template["start_date"],
+        end_date=template.get("end_date"),
+        next_run=template.get("next_run"),
+        active=template.get("active", True)
+    )
+
+
+def serialize_budget(budget: dict) -> BudgetRead:
+    """
+    Convert a MongoDB budget document to a BudgetRead Pydantic model.
+
+    Args:
+        budget (dict): The budget document from MongoDB.
+
+    Returns:
+        BudgetRead: The serialized budget.
+    """
+    return BudgetRead(
+        id=str(budget["_id"]),
+        user_id=budget["user_id"],
+        category=budget["category"],
+        limit=from_cents(budget["limit_cents"]),
+        alert_thresholds=budget.get("alert_thresholds", [])
     )
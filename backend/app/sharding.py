@@ -0,0 +1,175 @@
+# app/sharding.py
+"""
+Shard keys and query targeting.
+
+Every per-user collection is sharded on hashed user_id, and users on
+hashed _id (the user id), so users spread evenly across shards whatever
+their signup order and all of a user's documents live together. Sign-in
+looks users up by email, so user_emails maps each email (its _id, also
+hashed) to the user id. A query is routed to a single shard only if its
+filter pins the shard key: the routers carry the user id in every query
+on these collections, and ShardTargetingMonitor checks that they do.
+
+The collections not listed in SHARD_KEYS stay unsharded on the primary
+shard: migrations (a handful of documents) and rate_limits (keyed by
+client, and expired once the bucket refills).
+
+To shard the collections of MONGO_DATABASE on a sharded cluster:
+
+    python -m app.sharding
+"""
+
+import asyncio
+import threading
+from typing import Iterator, List, Tuple
+
+from pymongo import HASHED, monitoring
+from pymongo.errors import OperationFailure
+
+from app.config import get_settings
+from app.database import ensure_indexes, mongo
+from app.migrations import run_migrations
+
+# Collection name -> the field hashed for its shard key.
+SHARD_KEYS = {
+    "users": "_id",
+    "user_emails": "_id",
+    "records": "user_id",
+    "archived_records": "user_id",
+    "archived_rollups": "user_id",
+    "record_tombstones": "user_id",
+    "recurring_records": "user_id",
+    "budgets": "user_id",
+    "budget_spend": "user_id",
+    "idempotency_keys": "user_id",
+    "assistant_jobs": "user_id",
+    "attachments": "user_id",
+    # Shared by every user holding the same content.
+    "attachment_blobs": "_id",
+    # The GridFS bucket of attachment contents.
+    "attachment_files.files": "_id",
+    "attachment_files.chunks": "files_id",
+}
+
+
+def is_targeted(query_filter: dict, field: str) -> bool:
+    """
+    Whether a query filter pins a hashed shard key to one value (or a
+    list of values), so the router sends it only to the shards owning them.
+    Ranges on a hashed key are scattered to every shard.
+
+    Args:
+        query_filter (dict): A query filter, or an inserted document.
+        field (str): The shard key field.
+
+    Returns:
+        bool: True if the query is routed to specific shards.
+    """
+    if field in query_filter:
+        value = query_filter[field]
+        if not isinstance(value, dict) or not any(key.startswith("$") for key in value):
+            return True
+        if "$eq" in value:
+            return True
+        return isinstance(value.get("$in"), list)
+    if any(is_targeted(clause, field) for clause in query_filter.get("$and", [])):
+        return True
+    clauses = query_filter.get("$or")
+    return bool(clauses) and all(is_targeted(clause, field) for clause in clauses)
+
+
+def command_filters(command: dict) -> Iterator[Tuple[str, dict]]:
+    """
+    The collection and filters of a database command that reads or writes
+    documents: one per statement of a bulk update or delete, and the
+    documents themselves for an insert (they are routed by their shard
+    key). Other commands (getMore, createIndexes, ...) yield nothing.
+    """
+    name = next(iter(command))
+    collection = command[name]
+    if name == "find":
+        yield collection, command.get("filter", {})
+    elif name in ("count", "distinct", "findAndModify"):
+        yield collection, command.get("query", {})
+    elif name == "aggregate" and isinstance(collection, str):
+        pipeline = command.get("pipeline", [])
+        yield collection, pipeline[0].get("$match", {}) if pipeline else {}
+    elif name == "update":
+        for statement in command.get("updates", []):
+            yield collection, statement["q"]
+    elif name == "delete":
+        for statement in command.get("deletes", []):
+            yield collection, statement["q"]
+    elif name == "insert":
+        for document in command.get("documents", []):
+            yield collection, document
+
+
+class ShardTargetingMonitor(monitoring.CommandListener):
+    """
+    Record every command on a sharded collection that a sharded cluster
+    would have to scatter to all shards.
+
+    Register it on a client (event_listeners=[monitor]) to check a
+    workload against SHARD_KEYS without running a sharded cluster: the
+    targeting decision only depends on the commands' filters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands = 0
+        self.scattered: List[Tuple[str, str, dict]] = []
+
+    def reset(self):
+        with self._lock:
+            self.commands = 0
+            self.scattered = []
+
+    def started(self, event):
+        for collection, query_filter in command_filters(event.command):
+            field = SHARD_KEYS.get(collection)
+            if field is None:
+                continue
+            with self._lock:
+                self.commands += 1
+                if not is_targeted(query_filter, field):
+                    self.scattered.append((event.command_name, collection, query_filter))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def shard_collections():
+    """
+    Shard every collection in SHARD_KEYS on its hashed key. Safe to call
+    repeatedly; collections already sharded are left as they are.
+    """
+    # Migrations drop unique indexes not prefixed by the shard key, which
+    # would make shardCollection fail.
+    await ensure_indexes()
+    await run_migrations()
+    database = get_settings().mongo_database
+    admin = mongo.connect().admin
+    try:
+        # Implicit since MongoDB 6.0.
+        await admin.command("enableSharding", database)
+    except OperationFailure:
+        pass
+    for name, field in SHARD_KEYS.items():
+        # A non-empty collection needs the shard key index to exist first.
+        await mongo.db.get_collection(name).create_index([(field, HASHED)], name=f"{field}_hashed")
+        await admin.command("shardCollection", f"{database}.{name}", key={field: "hashed"})
+
+
+if __name__ == "__main__":
+    async def main():
+        mongo.connect()
+        try:
+            await shard_collections()
+        finally:
+            mongo.close()
+
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+# app/sync.py
+"""
+Delta sync for offline clients.
+
+Every record write stamps updated_at, and deletions leave a tombstone
+carrying the deletion time. A client keeps the opaque token from its last
+sync and asks for what changed after it: records and tombstones are both
+read in (updated_at, record id) order from (user_id, updated_at, id)
+indexes (in both record tiers), so the cost depends on the number of
+changes, not of records.
+"""
+
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.config import get_settings
+from app.database import mongo
+
+# Changes stamped less than this long ago may still be committing (or be
+# sitting in the write buffer), so tokens never point past now minus this
+# and those changes are sent again on the next sync. Clients apply changes
+# idempotently.
+SYNC_SETTLE_SECONDS = 5
+
+MIN_OBJECT_ID = ObjectId("0" * 24)
+
+
+class SyncTokenError(ValueError):
+    """
+    Raised for a malformed sync token.
+    """
+
+
+class SyncTokenExpired(Exception):
+    """
+    Raised for a token older than the tombstone retention: deletions since
+    then may have been purged, so the client must resync in full.
+    """
+
+
+class SyncPosition(NamedTuple):
+    updated_at: datetime
+    record_id: ObjectId
+
+
+def as_utc(value: datetime) -> datetime:
+    # Dates read back from MongoDB are naive UTC.
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def encode_sync_token(position: SyncPosition) -> str:
+    # MongoDB stores datetimes to the millisecond.
+    millis = int(as_utc(position.updated_at).timestamp() * 1000)
+    raw = f"{millis}.{position.record_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> SyncPosition:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        millis, record_id = raw.split(".")
+        updated_at = datetime.fromtimestamp(int(millis) / 1000, tz=timezone.utc)
+        return SyncPosition(updated_at, ObjectId(record_id))
+    except (binascii.Error, UnicodeDecodeError, ValueError, InvalidId, OverflowError, OSError):
+        raise SyncTokenError("Invalid sync token.")
+
+
+def after_position(position: Optional[SyncPosition], id_field: str) -> dict:
+    """
+    Filter for documents after a position in (updated_at, id) order.
+    """
+    if position is None:
+        return {}
+    return {"$or": [
+        {"updated_at": {"$gt": position.updated_at}},
+        {"updated_at": position.updated_at, id_field: {"$gt": position.record_id}},
+    ]}
+
+
+async def write_tombstone(record: dict):
+    await mongo.record_tombstones.insert_one({
+        "user_id": record["user_id"],
+        "record_id": record["_id"],
+        "updated_at": datetime.now(timezone.utc),
+    })
+
+
+async def changes_since(user_id: str, token: Optional[str], limit: int) -> Tuple[List[dict], List[ObjectId], str, bool]:
+    """
+    The user's record changes after a sync token, oldest first. Without a
+    token every record is returned (and no deletions), page by page.
+
+    Args:
+        user_id (str): The user whose records to sync.
+        token (Optional[str]): The next_token of the previous page, if any.
+        limit (int): Maximum number of changes (records plus deletions) to return.
+
+    Returns:
+        Tuple[List[dict], List[ObjectId], str, bool]: Changed records, ids of
+        deleted records, the token to continue from and whether more
+        changes are waiting.
+
+    Raises:
+        SyncTokenError: If the token is malformed.
+        SyncTokenExpired: If the token predates the tombstone retention.
+    """
+    now = datetime.now(timezone.utc)
+    position = decode_sync_token(token) if token else None
+    if position and position.updated_at < now - timedelta(seconds=get_settings().record_tombstone_ttl_seconds):
+        raise SyncTokenExpired()
+
+    changes = []
+    # Archival keeps updated_at, so archived records sync like hot ones.
+    for collection in (mongo.records, mongo.archived_records):
+        records = await collection.find(
+            {"user_id": user_id, **after_position(position, "_id")}
+        ).sort([("updated_at", 1), ("_id", 1)]).limit(limit + 1).to_list(length=limit + 1)
+        changes += [(SyncPosition(as_utc(r["updated_at"]), r["_id"]), r) for r in records]
+    if position is not None:
+        tombstones = await mongo.record_tombstones.find(
+            {"user_id": user_id, **after_position(position, "record_id")}
+        ).sort([("updated_at", 1), ("record_id", 1)]).limit(limit + 1).to_list(length=limit + 1)
+        changes += [(SyncPosition(as_utc(t["updated_at"]), t["record_id"]), None) for t in tombstones]
+    changes.sort(key=lambda change: change[0])
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    next_position = changes[-1][0] if changes else position
+    settled = SyncPosition(now - timedelta(seconds=SYNC_SETTLE_SECONDS), MIN_OBJECT_ID)
+    if not has_more and (next_position is None or next_position > settled):
+        next_position = settled
+
+    changed = [record for _, record in changes if record is not None]
+    deleted = [change.record_id for change, record in changes if record is None]
+    return changed, deleted, encode_sync_token(next_position), has_more
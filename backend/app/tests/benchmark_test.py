@@ -0,0 +1,37 @@
+# benchmark_test.py
+
+import pytest
+from benchmarks.api_benchmark import run_benchmark, format_report, percentile
+from benchmarks import response_benchmark
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.95) == 95.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_benchmark_smoke_run():
+    # Enough records per user for seeded dates to collide.
+    report = await run_benchmark(
+        users=2, records_per_user=1000, requests=10, concurrency=4, llm_latency=0)
+
+    assert set(report["results"]) == {"signin", "list", "paginate", "create", "search", "assistant"}
+    for stats in report["results"].values():
+        assert stats["requests"] == 10
+        assert stats["errors"] == 0
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+    assert report["meta"]["seed"] == 42
+    assert "signin" in format_report(report, baseline=report)
+
+
+def test_response_benchmark_smoke_run():
+    report = response_benchmark.run_benchmark(sizes=[200], repeat=1)
+
+    assert set(report["results"]) == {"200", "200_compact"}
+    for stats in report["results"].values():
+        assert stats["wire"]["gzip"]["bytes"] < stats["wire"]["identity"]["bytes"]
+    assert "200_compact" in response_benchmark.format_report(report)
@@ -0,0 +1,194 @@
+# ingestion_test.py
+
+import asyncio
+import time
+import pytest
+from bson import ObjectId
+from app.ingestion import RecordWriteBuffer, BufferFullError
+
+# Simulated network round trip for every call to the fake collection, and the
+# number of calls that may be in flight at once (the driver's connection pool).
+ROUND_TRIP_SECONDS = 0.002
+POOL_SIZE = 10
+
+
+class FakeCollection:
+    """
+    Stands in for a Motor collection, charging one round trip per call.
+    """
+
+    def __init__(self):
+        self.documents = []
+        self.calls = 0
+        self.pool = asyncio.Semaphore(POOL_SIZE)
+
+    async def round_trip(self):
+        async with self.pool:
+            self.calls += 1
+            await asyncio.sleep(ROUND_TRIP_SECONDS)
+
+    async def insert_one(self, document):
+        await self.round_trip()
+        self.documents.append(document)
+
+    async def find_one(self, query):
+        await self.round_trip()
+        return next(doc for doc in self.documents if doc["_id"] == query["_id"])
+
+    async def insert_many(self, documents, ordered=True):
+        await self.round_trip()
+        self.documents.extend(documents)
+
+
+class FlakyCollection(FakeCollection):
+    """
+    A FakeCollection whose first `failures` inserts fail, as during an outage.
+    """
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def insert_many(self, documents, ordered=True):
+        await self.round_trip()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("No primary available")
+        self.documents.extend(documents)
+
+
+def make_record(i: int) -> dict:
+    return {"_id": ObjectId(), "user_id": "load-user", "amount": float(i + 1),
+            "category": "Load", "type": "expense"}
+
+
+@pytest.mark.asyncio
+async def test_buffer_flushes_on_batch_size():
+    collection = FakeCollection()
+    buffer = RecordWriteBuffer(lambda: collection, max_batch_size=10, flush_interval=60)
+    await buffer.start()
+    for i in range(10):
+        buffer.submit(make_record(i))
+    await asyncio.sleep(ROUND_TRIP_SECONDS * 5)
+    assert len(collection.documents) == 10
+    assert collection.calls == 1
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_buffer_flushes_on_interval():
+    collection = FakeCollection()
+    buffer = RecordWriteBuffer(lambda: collection, max_batch_size=100, flush_interval=0.01)
+    await buffer.start()
+    buffer.submit(make_record(0))
+    await asyncio.sleep(0.05)
+    assert len(collection.documents) == 1
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_buffer_rejects_when_full_and_drains_on_stop():
+    collection = FakeCollection()
+    buffer = RecordWriteBuffer(lambda: collection, max_batch_size=100, flush_interval=60, max_pending=3)
+    for i in range(3):
+        buffer.submit(make_record(i))
+    with pytest.raises(BufferFullError):
+        buffer.submit(make_record(3))
+
+    await buffer.stop()
+    assert len(collection.documents) == 3
+    assert buffer.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_buffer_retries_with_backoff():
+    collection = FlakyCollection(failures=2)
+    buffer = RecordWriteBuffer(lambda: collection, max_batch_size=100, flush_interval=60,
+                               max_retries=3, retry_backoff=0.02)
+    for i in range(5):
+        buffer.submit(make_record(i))
+
+    started = time.perf_counter()
+    await buffer.flush()
+    # Waited 0.02s, then 0.04s, before the insert went through.
+    assert time.perf_counter() - started >= 0.06
+    assert collection.calls == 3
+    assert len(collection.documents) == 5
+    assert buffer.stats["flushed"] == 5
+    assert buffer.stats["dropped"] == 0
+
+
+@pytest.mark.asyncio
+async def test_buffer_reports_dropped_records():
+    dropped = []
+
+    async def on_dropped(documents):
+        dropped.extend(documents)
+
+    collection = FlakyCollection(failures=3)
+    buffer = RecordWriteBuffer(lambda: collection, max_batch_size=100, flush_interval=60,
+                               max_retries=2, retry_backoff=0, on_dropped=on_dropped)
+    records = [make_record(i) for i in range(3)]
+    for record in records:
+        buffer.submit(record)
+
+    await buffer.flush()
+    assert dropped == records
+    assert buffer.stats["dropped"] == 3
+    assert buffer.stats["batches"] == 0
+    assert collection.documents == []
+
+
+@pytest.mark.asyncio
+async def test_buffer_keeps_flushing_when_a_hook_fails():
+    stored = []
+
+    async def on_stored(documents):
+        stored.extend(documents)
+        if len(stored) == 1:
+            raise RuntimeError("Search index unavailable")
+
+    collection = FakeCollection()
+    buffer = RecordWriteBuffer(lambda: collection, max_batch_size=1, flush_interval=0.01,
+                               on_stored=on_stored)
+    await buffer.start()
+    buffer.submit(make_record(0))
+    await asyncio.sleep(0.05)
+    buffer.submit(make_record(1))
+    await asyncio.sleep(0.05)
+    assert buffer.running
+    await buffer.stop()
+
+    assert len(collection.documents) == 2
+    assert len(stored) == 2
+    assert buffer.stats["batches"] == 2
+
+
+@pytest.mark.asyncio
+async def test_buffered_ingestion_throughput():
+    total = 1000
+
+    direct = FakeCollection()
+
+    async def create_direct(record):
+        await direct.insert_one(record)
+        await direct.find_one({"_id": record["_id"]})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(create_direct(make_record(i)) for i in range(total)))
+    direct_seconds = time.perf_counter() - started
+
+    buffered = FakeCollection()
+    buffer = RecordWriteBuffer(lambda: buffered, max_batch_size=200, flush_interval=0.01)
+    await buffer.start()
+    started = time.perf_counter()
+    for i in range(total):
+        buffer.submit(make_record(i))
+    await buffer.stop()
+    buffered_seconds = time.perf_counter() - started
+
+    print(f"\ndirect: {total / direct_seconds:.0f} rec/s over {direct.calls} round trips, "
+          f"buffered: {total / buffered_seconds:.0f} rec/s over {buffered.calls} round trips")
+    assert len(buffered.documents) == total
+    assert buffered.calls <= total // 200 + 1
+    assert buffered.calls * 100 <= direct.calls
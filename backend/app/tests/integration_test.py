@@ -1,9 +1,10 @@
 # integration_test.py
 
 import pytest
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 import time
 from app.conftest import created_test_emails  # for cleanup
+from app.utils import decode_access_token
 
 
 def unique_email(base="inttestuser"):
@@ -19,6 +20,56 @@ async def test_root_endpoint(async_client):
     }
 
 
+@pytest.mark.asyncio
+async def test_request_metrics(async_client):
+    response = await async_client.get("/")
+    assert response.status_code == 200
+    assert response.headers["Server-Timing"].startswith("app;dur=")
+
+    metrics_resp = await async_client.get("/metrics")
+    assert metrics_resp.status_code == 200
+    assert metrics_resp.headers["content-type"].startswith("text/plain")
+    body = metrics_resp.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in body
+    assert "mongo_pool_connections_in_use" in body
+
+
+@pytest.mark.asyncio
+async def test_admin_profiling(async_client):
+    from app.config import get_settings
+
+    settings = get_settings()
+    previous_key = settings.admin_api_key
+    settings.admin_api_key = None
+    try:
+        response = await async_client.get("/admin/profile?seconds=0.05")
+        assert response.status_code == 404, response.text
+
+        settings.admin_api_key = "test-admin-key"
+        response = await async_client.get(
+            "/admin/profile?seconds=0.05", headers={"X-Admin-Key": "wrong"})
+        assert response.status_code == 403, response.text
+
+        admin_headers = {"X-Admin-Key": "test-admin-key"}
+        response = await async_client.get("/admin/profile?seconds=0.05", headers=admin_headers)
+        assert response.status_code == 200, response.text
+
+        response = await async_client.get("/", headers={**admin_headers, "X-Profile": "1"})
+        assert response.status_code == 200
+        profile_id = response.headers["X-Profile-Id"]
+
+        response = await async_client.get(
+            f"/admin/profiles/{profile_id}?format=text", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        assert "function calls" in response.text
+
+        response = await async_client.get(f"/admin/profiles/{profile_id}", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/octet-stream"
+    finally:
+        settings.admin_api_key = previous_key
+
+
 @pytest.mark.asyncio
 async def test_user_signup_and_signin_flow(async_client):
     email = unique_email()
@@ -96,6 +147,110 @@ async def test_records_crud_flow(async_client):
     assert all(rec["id"] != record_id for rec in records_after_delete)
 
 
+@pytest.mark.asyncio
+async def test_buffered_record_creation(async_client):
+    from app.ingestion import record_write_buffer
+
+    email = unique_email("buffered")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "buffereduser",
+        "email": email,
+        "password": "bufferedpass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    await record_write_buffer.start()
+    try:
+        create_resp = await async_client.post("/records/?buffered=true", json={
+            "amount": 42.0,
+            "category": "Buffered",
+            "type": "expense"
+        }, headers=headers)
+        assert create_resp.status_code == 202, create_resp.text
+        record_id = create_resp.json()["id"]
+    finally:
+        await record_write_buffer.stop()
+
+    get_resp = await async_client.get("/records/", headers=headers)
+    assert get_resp.status_code == 200, get_resp.text
+    assert any(rec["id"] == record_id for rec in get_resp.json()["records"])
+
+
+@pytest.mark.asyncio
+async def test_idempotent_record_creation(async_client):
+    email = unique_email("idempotent")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "idempotentuser",
+        "email": email,
+        "password": "idempotentpass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {
+        "Authorization": f"Bearer {signup_resp.json()['access_token']}",
+        "Idempotency-Key": "create-rent-2025-03"
+    }
+    record_payload = {
+        "amount": 1200.0,
+        "category": "Rent",
+        "type": "expense"
+    }
+
+    first_resp = await async_client.post("/records/", json=record_payload, headers=headers)
+    assert first_resp.status_code == 201, first_resp.text
+    retry_resp = await async_client.post("/records/", json=record_payload, headers=headers)
+    assert retry_resp.status_code == 201, retry_resp.text
+    assert retry_resp.headers.get("Idempotent-Replayed") == "true"
+    assert retry_resp.json() == first_resp.json()
+
+    get_resp = await async_client.get("/records/", headers=headers)
+    assert get_resp.status_code == 200, get_resp.text
+    assert get_resp.json()["total"] == 1
+
+    headers["Idempotency-Key"] = "create-rent-2025-04"
+    other_resp = await async_client.post("/records/", json=record_payload, headers=headers)
+    assert other_resp.status_code == 201, other_resp.text
+    assert other_resp.json()["id"] != first_resp.json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_dropped_buffered_record_releases_idempotency_key(async_client, monkeypatch):
+    from app.ingestion import record_write_buffer
+
+    class UnavailableCollection:
+        async def insert_many(self, documents, ordered=True):
+            raise ConnectionError("No primary available")
+
+    email = unique_email("dropped")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "droppeduser",
+        "email": email,
+        "password": "droppedpass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {
+        "Authorization": f"Bearer {signup_resp.json()['access_token']}",
+        "Idempotency-Key": "create-dropped-2025-03"
+    }
+    record_payload = {"amount": 15.0, "category": "Dropped", "type": "expense"}
+
+    monkeypatch.setattr(record_write_buffer, "get_collection", lambda: UnavailableCollection())
+    monkeypatch.setattr(record_write_buffer, "retry_backoff", 0)
+    await record_write_buffer.start()
+    try:
+        create_resp = await async_client.post("/records/?buffered=true", json=record_payload, headers=headers)
+        assert create_resp.status_code == 202, create_resp.text
+    finally:
+        await record_write_buffer.stop()
+
+    retry_resp = await async_client.post("/records/", json=record_payload, headers=headers)
+    assert retry_resp.status_code == 201, retry_resp.text
+    assert retry_resp.headers.get("Idempotent-Replayed") is None
+
+
 @pytest.mark.asyncio
 async def test_protected_routes_without_auth(async_client):
     response_get = await async_client.get("/records/")
@@ -218,6 +373,686 @@ async def test_pagination_and_filtering(async_client):
     for record in records:
         assert "testcategory" in record["category"].lower()
 
+    response = await async_client.get("/records/?sortField=amount&sortOrder=1&limit=3", headers=headers)
+    assert response.status_code == 200, response.text
+    amounts = [record["amount"] for record in response.json()["records"]]
+    assert amounts == sorted(amounts)
+
+    response = await async_client.get("/records/?sortField=user_id", headers=headers)
+    assert response.status_code == 400, response.text
+
+
+@pytest.mark.asyncio
+async def test_range_filters(async_client):
+    email = unique_email("rangefilter")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "rangefilteruser",
+        "email": email,
+        "password": "testpassword"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    for amount, record_type in [(20.0, "expense"), (600.0, "expense"), (900.0, "income")]:
+        create_resp = await async_client.post("/records/", json={
+            "amount": amount,
+            "category": "RangeCategory",
+            "type": record_type
+        }, headers=headers)
+        assert create_resp.status_code == 201, create_resp.text
+
+    response = await async_client.get(
+        "/records/", params={"type": "expense", "min_amount": 500}, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["total"] == 1
+    assert data["records"][0]["amount"] == 600.0
+
+    response = await async_client.get(
+        "/records/", params={"min_amount": 10, "max_amount": 700}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["total"] == 2
+
+    now = datetime.now(timezone.utc)
+    response = await async_client.get("/records/", params={
+        "date_from": (now - timedelta(days=1)).isoformat(),
+        "date_to": (now + timedelta(days=1)).isoformat()
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["total"] == 3
+
+    response = await async_client.get(
+        "/records/", params={"date_from": (now + timedelta(days=1)).isoformat()}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["total"] == 0
+
+    response = await async_client.get(
+        "/records/", params={"min_amount": 700, "max_amount": 10}, headers=headers)
+    assert response.status_code == 400, response.text
+
+    # One bound with an offset, one without (UTC).
+    response = await async_client.get("/records/", params={
+        "date_from": (now - timedelta(days=1)).isoformat(),
+        "date_to": (now + timedelta(days=1)).replace(tzinfo=None).isoformat()
+    }, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["total"] == 3
+    response = await async_client.get("/records/", params={
+        "date_from": "2024-01-01T00:00:00Z", "date_to": "2024-01-01T00:00:00"}, headers=headers)
+    assert response.status_code == 400, response.text
+
+
+
+@pytest.mark.asyncio
+async def test_recurring_records(async_client, monkeypatch):
+    from app.config import get_settings
+    from app.recurrence import materialize_due
+
+    email = unique_email("recurring")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "recurringuser",
+        "email": email,
+        "password": "recurringpass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    now = datetime.now(timezone.utc)
+    start = (now - timedelta(days=2, hours=1)).replace(microsecond=0)
+    create_resp = await async_client.post("/recurring/", json={
+        "amount": 10.0,
+        "category": "Coffee",
+        "type": "expense",
+        "frequency": "daily",
+        "start_date": start.isoformat(),
+    }, headers=headers)
+    assert create_resp.status_code == 201, create_resp.text
+    template = create_resp.json()
+    assert template["active"]
+
+    invalid_resp = await async_client.post("/recurring/", json={
+        "amount": 10.0, "category": "Coffee", "type": "expense",
+        "frequency": "cron", "start_date": start.isoformat(),
+    }, headers=headers)
+    assert invalid_resp.status_code == 422, invalid_resp.text
+    every_minute_resp = await async_client.post("/recurring/", json={
+        "amount": 10.0, "category": "Coffee", "type": "expense",
+        "frequency": "cron", "cron": "* * * * *", "start_date": start.isoformat(),
+    }, headers=headers)
+    assert every_minute_resp.status_code == 422, every_minute_resp.text
+
+    monkeypatch.setattr(get_settings(), "recurring_max_templates_per_user", 1)
+    over_cap_resp = await async_client.post("/recurring/", json={
+        "amount": 10.0, "category": "Coffee", "type": "expense",
+        "frequency": "cron", "cron": "0 9 * * 1", "start_date": start.isoformat(),
+    }, headers=headers)
+    assert over_cap_resp.status_code == 400, over_cap_resp.text
+    monkeypatch.undo()
+
+    # Three occurrences are due; running the scheduler twice creates them once.
+    await materialize_due(now)
+    await materialize_due(now)
+    records = (await async_client.get(
+        "/records/", params={"category": "Coffee"}, headers=headers)).json()["records"]
+    assert len(records) == 3
+
+    listed = (await async_client.get("/recurring/", headers=headers)).json()
+    assert len(listed) == 1
+    assert datetime.fromisoformat(listed[0]["next_run"]).replace(tzinfo=timezone.utc) > now
+
+    projection_resp = await async_client.get("/recurring/projection", params={
+        "until": (now + timedelta(days=7)).isoformat(),
+        "starting_balance": 100.0,
+    }, headers=headers)
+    assert projection_resp.status_code == 200, projection_resp.text
+    projection = projection_resp.json()
+    assert len(projection["points"]) == 7
+    assert projection["total_expense"] == 70.0
+    assert projection["ending_balance"] == 30.0
+
+    update_resp = await async_client.patch(
+        f"/recurring/{template['id']}", json={"active": False}, headers=headers)
+    assert update_resp.status_code == 200, update_resp.text
+    assert not update_resp.json()["active"]
+
+    delete_resp = await async_client.delete(f"/recurring/{template['id']}", headers=headers)
+    assert delete_resp.status_code == 200, delete_resp.text
+
+
+@pytest.mark.asyncio
+async def test_budget_spend_tracking(async_client):
+    from app.notifications import email_queue
+
+    email = unique_email("budget")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "budgetuser",
+        "email": email,
+        "password": "budgetpass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    # Spending that predates the budget is counted when it is created.
+    await async_client.post("/records/", json={
+        "amount": 30.0, "category": "Groceries", "type": "expense"}, headers=headers)
+    create_resp = await async_client.post("/budgets/", json={
+        "category": "Groceries", "limit": 100.0}, headers=headers)
+    assert create_resp.status_code == 201, create_resp.text
+    for category in ("Groceries", "groceries"):
+        duplicate_resp = await async_client.post("/budgets/", json={
+            "category": category, "limit": 50.0}, headers=headers)
+        assert duplicate_resp.status_code == 409, duplicate_resp.text
+
+    queued_before = email_queue.stats["queued"]
+    # Categories match case-insensitively, as in record listings.
+    record_resp = await async_client.post("/records/", json={
+        "amount": 40.0, "category": "groceries", "type": "expense"}, headers=headers)
+    record_id = record_resp.json()["id"]
+    await async_client.post("/records/", json={
+        "amount": 500.0, "category": "Groceries", "type": "income"}, headers=headers)
+
+    async def groceries_spent():
+        response = await async_client.get("/budgets/utilization", headers=headers)
+        assert response.status_code == 200, response.text
+        (utilization,) = response.json()
+        return utilization["spent"]
+
+    assert await groceries_spent() == 70.0
+
+    # Crossing 80% queues one alert email.
+    await async_client.patch(f"/records/{record_id}", json={"amount": 55.0}, headers=headers)
+    assert await groceries_spent() == 85.0
+    assert email_queue.stats["queued"] == queued_before + 1
+
+    await async_client.patch(f"/records/{record_id}", json={"amount": 55.0, "type": "income"}, headers=headers)
+    assert await groceries_spent() == 30.0
+
+    await async_client.patch(f"/records/{record_id}", json={"amount": 20.0, "type": "expense"}, headers=headers)
+    await async_client.delete(f"/records/{record_id}", headers=headers)
+    assert await groceries_spent() == 30.0
+
+
+@pytest.mark.asyncio
+async def test_budget_recompute_keeps_concurrent_spend(monkeypatch):
+    from bson import ObjectId
+    from app import budgets
+    from app.database import mongo
+
+    user_id = str(ObjectId())
+    # This month, at distinct times (mongomock ignores the recurrence index's partial filter).
+    day = datetime.now(timezone.utc).replace(day=1, hour=12, minute=0, second=0, microsecond=0)
+    records = [{"_id": ObjectId(), "user_id": user_id, "category": category, "type": "expense",
+                "amount_cents": cents, "date": day + timedelta(minutes=index), "updated_at": day}
+               for index, (category, cents) in enumerate((("Rent", 100000), ("rent", 5000)))]
+    await mongo.records.insert_one(records[0])
+    await budgets.apply_spend_deltas(budgets.spend_deltas(records[:1]))
+
+    sum_month_spend = budgets.sum_month_spend
+    scans = []
+
+    async def scan_racing_a_create(*args):
+        spent = await sum_month_spend(*args)
+        scans.append(spent)
+        if len(scans) == 1:
+            # A record created while the first scan runs; the scan missed it.
+            await mongo.records.insert_one(records[1])
+            await budgets.apply_spend_deltas(budgets.spend_deltas(records[1:]))
+        return spent
+
+    monkeypatch.setattr(budgets, "sum_month_spend", scan_racing_a_create)
+    assert await budgets.recompute_spend(user_id, "RENT") == 105000
+    assert scans == [100000, 105000]
+    spend = await mongo.budget_spend.find_one({"user_id": user_id, "category": "rent"})
+    assert spend["spent_cents"] == 105000
+
+
+@pytest.mark.asyncio
+async def test_spend_totals_migrate_to_category_keys():
+    from bson import ObjectId
+    from app.database import mongo
+    from app.migrations import key_spend_by_category
+
+    user_id = str(ObjectId())
+    await mongo.budget_spend.insert_many([
+        {"user_id": user_id, "category": "Travel", "month": "2024-05", "spent_cents": 1000, "alerted": [0.8]},
+        {"user_id": user_id, "category": "travel", "month": "2024-05", "spent_cents": 500},
+    ])
+    assert await key_spend_by_category() >= 1
+
+    spends = await mongo.budget_spend.find({"user_id": user_id}).to_list(length=None)
+    assert [(spend["category"], spend["spent_cents"], spend["alerted"]) for spend in spends] == [
+        ("travel", 1500, [0.8])]
+
+
+@pytest.mark.asyncio
+async def test_spending_analytics(async_client):
+    from bson import ObjectId
+    from app.database import mongo
+
+    email = unique_email("analytics")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "analyticsuser",
+        "email": email,
+        "password": "analyticspass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    # Records are dated when created; backdate a week of them directly.
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    for days_ago in range(1, 8):
+        response = await async_client.post("/records/", json={
+            "amount": 10.0, "category": "Coffee", "type": "expense"}, headers=headers)
+        await mongo.records.update_one({"_id": ObjectId(response.json()["id"])},
+                                       {"$set": {"date": today - timedelta(days=days_ago)}})
+    categories = (await async_client.get("/analytics/categories", headers=headers)).json()
+    assert categories == [{"category": "Coffee", "amount": 70.0, "share": 1.0}]
+
+    # The cached frame is invalidated by new records.
+    big = await async_client.post("/records/", json={
+        "amount": 500.0, "category": "Coffee", "type": "expense"}, headers=headers)
+    await async_client.post("/records/", json={
+        "amount": 30.0, "category": "Books", "type": "expense"}, headers=headers)
+
+    categories = (await async_client.get("/analytics/categories", headers=headers)).json()
+    assert [(c["category"], c["amount"]) for c in categories] == [("Coffee", 570.0), ("Books", 30.0)]
+
+    trend = (await async_client.get(
+        "/analytics/trends", params={"days": 2, "window": 2}, headers=headers)).json()
+    assert [(p["expense"], p["rolling_average"]) for p in trend["points"]] == [(10.0, 10.0), (530.0, 270.0)]
+
+    monthly = (await async_client.get("/analytics/monthly", params={"months": 3}, headers=headers)).json()
+    assert len(monthly) == 3
+    assert sum(month["expense"] for month in monthly) == 600.0
+    assert monthly[0]["expense_change"] is None
+
+    outliers = (await async_client.get(
+        "/analytics/outliers", params={"threshold": 2}, headers=headers)).json()
+    assert [o["record"]["id"] for o in outliers] == [big.json()["id"]]
+
+    await async_client.delete(f"/records/{big.json()['id']}", headers=headers)
+    outliers = (await async_client.get(
+        "/analytics/outliers", params={"threshold": 2}, headers=headers)).json()
+    assert outliers == []
+
+
+@pytest.mark.asyncio
+async def test_search_records(async_client):
+    email = unique_email("search")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "searchuser",
+        "email": email,
+        "password": "searchpass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    ids = {}
+    for description, category in [
+        ("Flat white at Blue Bottle", "Coffee"),
+        ("Blue Bottle beans", "Groceries"),
+        ("Train ticket", "Transport"),
+    ]:
+        response = await async_client.post("/records/", json={
+            "amount": 5.0, "category": category, "type": "expense",
+            "description": description}, headers=headers)
+        ids[description] = response.json()["id"]
+
+    async def search(**params):
+        response = await async_client.get("/records/search", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    result = await search(q="blue bot")
+    assert result["total"] == 2
+    assert {r["id"] for r in result["records"]} == {ids["Flat white at Blue Bottle"], ids["Blue Bottle beans"]}
+    page = await search(q="blue", skip=1, limit=1)
+    assert page["total"] == 2 and len(page["records"]) == 1
+    assert (await search(q="coffee"))["records"][0]["id"] == ids["Flat white at Blue Bottle"]
+
+    # Writes update the cached index.
+    update_resp = await async_client.patch(f"/records/{ids['Train ticket']}", json={
+        "amount": 5.0, "description": "Blue line train"}, headers=headers)
+    assert update_resp.status_code == 200, update_resp.text
+    await async_client.delete(f"/records/{ids['Blue Bottle beans']}", headers=headers)
+    result = await search(q="blue")
+    assert {r["id"] for r in result["records"]} == {ids["Flat white at Blue Bottle"], ids["Train ticket"]}
+    assert (await search(q="ticket"))["total"] == 0
+
+    missing = await async_client.get("/records/search", headers=headers)
+    assert missing.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_delta_sync(async_client):
+    from app import sync
+
+    email = unique_email("sync")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "syncuser",
+        "email": email,
+        "password": "syncpass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    ids = []
+    for amount in [1.0, 2.0, 3.0]:
+        response = await async_client.post("/records/", json={
+            "amount": amount, "category": "Sync", "type": "expense"}, headers=headers)
+        ids.append(response.json()["id"])
+        assert response.json()["updated_at"] is not None
+
+    async def sync_page(**params):
+        response = await async_client.get("/records/sync", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    # A full sync, two records per page.
+    first = await sync_page(limit=2)
+    assert [r["id"] for r in first["records"]] == ids[:2] and first["has_more"]
+    second = await sync_page(since=first["next_token"], limit=2)
+    assert [r["id"] for r in second["records"]] == ids[2:] and not second["has_more"]
+
+    # Skip the settling window so only later changes come back.
+    settle = sync.SYNC_SETTLE_SECONDS
+    sync.SYNC_SETTLE_SECONDS = 0
+    try:
+        token = (await sync_page())["next_token"]
+        await async_client.patch(f"/records/{ids[0]}", json={"amount": 10.0}, headers=headers)
+        await async_client.delete(f"/records/{ids[1]}", headers=headers)
+        changes = await sync_page(since=token)
+    finally:
+        sync.SYNC_SETTLE_SECONDS = settle
+    assert [(r["id"], r["amount"]) for r in changes["records"]] == [(ids[0], 10.0)]
+    assert changes["deleted"] == [ids[1]]
+
+    # Recent changes are sent again until they have settled.
+    assert (await sync_page(since=token))["deleted"] == [ids[1]]
+
+    invalid = await async_client.get("/records/sync", params={"since": "not-a-token"}, headers=headers)
+    assert invalid.status_code == 400
+    expired = sync.encode_sync_token(sync.SyncPosition(
+        datetime.now(timezone.utc) - timedelta(days=365), sync.MIN_OBJECT_ID))
+    expired_resp = await async_client.get("/records/sync", params={"since": expired}, headers=headers)
+    assert expired_resp.status_code == 410
+
+
+@pytest.mark.asyncio
+async def test_archived_records_read_transparently(async_client):
+    from bson import ObjectId
+    from app.database import mongo
+    from app.archive import archive_records
+
+    email = unique_email("archive")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "archiveuser",
+        "email": email,
+        "password": "archivepass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    # Three records from three years ago (one in EUR), two recent ones.
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(days=3 * 365)
+    ids = []
+    for index, (amount, currency) in enumerate([(10.0, None), (20.0, "EUR"), (30.0, None), (40.0, None), (50.0, None)]):
+        payload = {"amount": amount, "category": "Archive", "type": "expense",
+                   "description": f"Archived item {index}"}
+        if currency:
+            payload["currency"] = currency
+        response = await async_client.post("/records/", json=payload, headers=headers)
+        ids.append(response.json()["id"])
+        if index < 3:
+            dated = old + timedelta(hours=6 * index)
+            await mongo.records.update_one({"_id": ObjectId(ids[-1])},
+                                           {"$set": {"date": dated, "updated_at": dated}})
+
+    async def listing(**params):
+        response = await async_client.get("/records/", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    async def summary(**params):
+        response = await async_client.get("/records/summary", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    summary_range = {"date_from": (old + timedelta(hours=3)).isoformat(), "date_to": now.isoformat()}
+    before = (await summary(), await summary(**summary_range))
+    before_listing = await listing(all=True)
+
+    assert await archive_records() >= 3
+    assert await mongo.archived_records.count_documents({"_id": {"$in": [ObjectId(i) for i in ids]}}) == 3
+
+    assert (await summary(), await summary(**summary_range)) == before
+    assert await listing(all=True) == before_listing
+    for sort in [{"sortField": "date", "sortOrder": -1}, {"sortField": "amount", "sortOrder": 1}]:
+        pages = [await listing(skip=skip, limit=2, **sort) for skip in (0, 2, 4)]
+        assert all(page["total"] == 5 for page in pages)
+        full = await listing(all=True, **sort)
+        assert [r["id"] for page in pages for r in page["records"]] == [r["id"] for r in full["records"]]
+        trimmed = [await listing(skip=skip, limit=2, fields="id,amount", **sort) for skip in (0, 2, 4)]
+        assert [r for page in trimmed for r in page["records"]] == [
+            {"id": r["id"], "amount": r["amount"]} for r in full["records"]]
+    recent = await listing(date_from=(now - timedelta(days=1)).isoformat())
+    assert recent["total"] == 2
+
+    found = await async_client.get("/records/search", params={"q": "item 0"}, headers=headers)
+    assert [r["id"] for r in found.json()["records"]] == [ids[0]]
+
+    # Updating an archived record brings it back to the hot tier.
+    update_resp = await async_client.patch(f"/records/{ids[0]}", json={"amount": 15.0}, headers=headers)
+    assert update_resp.status_code == 200, update_resp.text
+    assert await mongo.records.find_one({"_id": ObjectId(ids[0])}) is not None
+    assert await mongo.archived_records.find_one({"_id": ObjectId(ids[0])}) is None
+    delete_resp = await async_client.delete(f"/records/{ids[1]}", headers=headers)
+    assert delete_resp.status_code == 200, delete_resp.text
+
+    # 15 + 30 + 40 + 50, the EUR record deleted.
+    assert (await summary())["total_expense"] == 135.0
+    assert (await listing())["total"] == 4
+
+
+@pytest.mark.asyncio
+async def test_record_deleted_while_archiving_stays_deleted(async_client, monkeypatch):
+    from bson import ObjectId
+    from app.database import MongoClientManager, mongo
+    from app.archive import archive_user_records
+
+    email = unique_email("archiverace")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "archiveraceuser", "email": email, "password": "archiveracepass"})
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    old = datetime.now(timezone.utc) - timedelta(days=3 * 365)
+    ids = []
+    for index in range(2):
+        response = await async_client.post("/records/", json={
+            "amount": 10.0, "category": "Archive", "type": "expense"}, headers=headers)
+        ids.append(response.json()["id"])
+        dated = old + timedelta(hours=index)
+        await mongo.records.update_one({"_id": ObjectId(ids[-1])}, {"$set": {"date": dated, "updated_at": dated}})
+    user_id = (await mongo.records.find_one({"_id": ObjectId(ids[0])}))["user_id"]
+
+    archived_records = MongoClientManager.archived_records
+
+    class DeleteWhileCopying:
+        """
+        The cold tier, with the user deleting a record while the batch is copied.
+        """
+
+        def __init__(self, collection):
+            self.collection = collection
+
+        def __getattr__(self, name):
+            return getattr(self.collection, name)
+
+        async def insert_many(self, documents, **kwargs):
+            result = await self.collection.insert_many(documents, **kwargs)
+            delete_resp = await async_client.delete(f"/records/{ids[0]}", headers=headers)
+            assert delete_resp.status_code == 200, delete_resp.text
+            return result
+
+    monkeypatch.setattr(MongoClientManager, "archived_records",
+                        property(lambda self: DeleteWhileCopying(archived_records.fget(self))))
+    assert await archive_user_records(user_id, old + timedelta(days=1)) == 1
+    monkeypatch.undo()
+
+    assert await mongo.archived_records.find_one({"_id": ObjectId(ids[0])}) is None
+    assert await mongo.archived_records.find_one({"_id": ObjectId(ids[1])}) is not None
+    listing = (await async_client.get("/records/", params={"all": True}, headers=headers)).json()
+    assert [record["id"] for record in listing["records"]] == [ids[1]]
+
+
+@pytest.mark.asyncio
+async def test_archived_records_sort_on_missing_descriptions(async_client):
+    from bson import ObjectId
+    from app.database import mongo
+    from app.archive import archive_records
+
+    email = unique_email("archivenull")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "archivenulluser", "email": email, "password": "archivepass"})
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    # Hot and archived records, each with and without a description.
+    old = datetime.now(timezone.utc) - timedelta(days=3 * 365)
+    for index, description in enumerate(["Bakery", None, "Cinema", None]):
+        payload = {"amount": 10.0 + index, "category": "Archive", "type": "expense"}
+        if description:
+            payload["description"] = description
+        response = await async_client.post("/records/", json=payload, headers=headers)
+        assert response.status_code == 201, response.text
+        if index < 2:
+            await mongo.records.update_one({"_id": ObjectId(response.json()["id"])},
+                                           {"$set": {"date": old + timedelta(hours=index), "updated_at": old}})
+    assert await archive_records() >= 2
+
+    for order in (1, -1):
+        sort = {"sortField": "description", "sortOrder": order}
+        response = await async_client.get("/records/", params={"all": True, **sort}, headers=headers)
+        assert response.status_code == 200, response.text
+        descriptions = [r["description"] for r in response.json()["records"]]
+        expected = [None, None, "Bakery", "Cinema"]
+        assert descriptions == (expected if order == 1 else expected[::-1])
+        pages = []
+        for skip in (0, 2):
+            response = await async_client.get(
+                "/records/", params={"skip": skip, "limit": 2, **sort}, headers=headers)
+            assert response.status_code == 200, response.text
+            pages += [r["description"] for r in response.json()["records"]]
+        assert pages == descriptions
+
+
+@pytest.mark.asyncio
+async def test_multi_currency_summary(async_client):
+    from app.currency import get_exchange_rates
+
+    email = unique_email("currency")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "currencyuser",
+        "email": email,
+        "password": "currencypass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    for payload in [
+        {"amount": 100.0, "category": "Salary", "type": "income"},
+        {"amount": 20.0, "category": "Dining", "type": "expense", "currency": "eur"},
+        {"amount": 5.0, "category": "Dining", "type": "expense"},
+    ]:
+        response = await async_client.post("/records/", json=payload, headers=headers)
+        assert response.status_code == 201, response.text
+    assert response.json()["currency"] == "USD"
+
+    invalid = await async_client.post("/records/", json={
+        "amount": 1.0, "category": "Dining", "type": "expense", "currency": "XYZ"}, headers=headers)
+    assert invalid.status_code == 422, invalid.text
+
+    eur_in_usd = get_exchange_rates().convert_one(20.0, "EUR", datetime.now(timezone.utc), "USD")
+    summary = (await async_client.get("/records/summary", headers=headers)).json()
+    assert summary["currency"] == "USD"
+    assert summary["total_income"] == 100.0
+    assert summary["by_category"] == {"Dining": round(5.0 + eur_in_usd, 2)}
+
+    summary = (await async_client.get(
+        "/records/summary", params={"currency": "EUR"}, headers=headers)).json()
+    assert summary["total_expense"] == pytest.approx(20.0 + 5.0 * 20.0 / eur_in_usd, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_float_amounts_migrate_to_exact_cents(async_client):
+    from app.database import mongo
+    from app.migrations import migrate_amounts_to_cents
+
+    email = unique_email("cents")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "centsuser",
+        "email": email,
+        "password": "centspass"
+    })
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+    response = await async_client.post("/records/", json={
+        "amount": 0.2, "category": "Snacks", "type": "expense"}, headers=headers)
+    assert response.status_code == 201, response.text
+    user_id = response.json()["user_id"]
+
+    # Nine legacy float amounts that drift when summed as floats.
+    now = datetime.now(timezone.utc)
+    await mongo.records.insert_many([
+        {"user_id": user_id, "amount": amount, "category": "Snacks", "type": "expense",
+         "date": now - timedelta(seconds=i), "currency": "USD"}
+        for i, amount in enumerate([0.1] * 4 + [0.2] * 5)
+    ])
+    listed = (await async_client.get("/records/", params={"all": True}, headers=headers)).json()
+    assert sorted(record["amount"] for record in listed["records"]) == [0.1] * 4 + [0.2] * 6
+
+    await migrate_amounts_to_cents()
+    assert await mongo.records.count_documents({"user_id": user_id, "amount": {"$exists": True}}) == 0
+
+    summary = (await async_client.get("/records/summary", headers=headers)).json()
+    assert summary["total_expense"] == 1.6
+    assert summary["by_category"] == {"Snacks": 1.6}
+
+    too_precise = await async_client.post("/records/", json={
+        "amount": 1.005, "category": "Snacks", "type": "expense"}, headers=headers)
+    assert too_precise.status_code == 422, too_precise.text
+
+@pytest.mark.asyncio
+async def test_rate_limited_endpoint(async_client):
+    from app.config import get_settings
+    from app.rate_limit import get_rate_limit_backend
+
+    get_rate_limit_backend.cache_clear()
+    get_settings().rate_limit_enabled = True
+    try:
+        payload = {"email": unique_email("ratelimit")}
+        for _ in range(3):
+            response = await async_client.post("/users/forgot-password", json=payload)
+            assert response.status_code == 200, response.text
+        response = await async_client.post("/users/forgot-password", json=payload)
+        assert response.status_code == 429, response.text
+        assert int(response.headers["Retry-After"]) >= 1
+    finally:
+        get_settings().rate_limit_enabled = False
+
 
 @pytest.mark.asyncio
 async def test_unauthorized_access(async_client):
@@ -250,3 +1085,426 @@ async def test_non_existent_resource_operations(async_client):
 
     response = await async_client.delete("/records/507f1f77bcf86cd799439099", headers=headers)
     assert response.status_code == 404, response.text
+
+
+@pytest.mark.asyncio
+async def test_delete_user_releases_email(async_client):
+    from bson import ObjectId
+    from fastapi import HTTPException
+    from app.routers.users import delete_user
+
+    email = unique_email("deleteduser")
+    signup_payload = {"username": "deleteduser", "email": email, "password": "deletedpass"}
+    signup_resp = await async_client.post("/users/signup", json=signup_payload)
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    token = signup_resp.json()["access_token"]
+    user_id = decode_access_token(token)["sub"]
+
+    response = await async_client.delete(f"/users/{user_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    # The email is free again.
+    signup_resp = await async_client.post("/users/signup", json=signup_payload)
+    assert signup_resp.status_code == 201, signup_resp.text
+
+    # Deleted meanwhile (e.g. a concurrent request): 404, not 500.
+    with pytest.raises(HTTPException) as error:
+        await delete_user(user_id, current_user={"_id": ObjectId(user_id), "email": email})
+    assert error.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_assistant_jobs(async_client, monkeypatch):
+    from types import SimpleNamespace
+    from app import assistant_jobs as jobs_module
+    from app.assistant_jobs import AssistantJobQueue
+
+    from app.config import get_settings
+
+    prompts = []
+
+    def post(url, json=None, timeout=None, **kwargs):
+        prompts.append(json["prompt"])
+        assert timeout == get_settings().llm_timeout_seconds
+        if "fail" in json["prompt"]:
+            # What requests raises once the timeout passes.
+            raise TimeoutError("Read timed out")
+        return SimpleNamespace(raise_for_status=lambda: None,
+                               json=lambda: {"response": "Cook at home more."})
+
+    monkeypatch.setattr(jobs_module, "get_http_session", lambda: SimpleNamespace(post=post))
+    # ASGITransport does not run the lifespan, so run a queue for this test.
+    queue = AssistantJobQueue(workers=2, max_pending=2, ttl_seconds=60)
+    monkeypatch.setattr("app.routers.personal_assistant.assistant_jobs", queue)
+
+    headers = {}
+    for name in ("jobuser", "otherjobuser"):
+        email = unique_email(name)
+        signup_resp = await async_client.post("/users/signup", json={
+            "username": name, "email": email, "password": "jobpass"})
+        assert signup_resp.status_code == 201, signup_resp.text
+        created_test_emails.append(email)
+        headers[name] = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    # Not started yet: jobs wait in the queue, and the queue is bounded.
+    submitted = []
+    for question in ("How do I save?", "Why did this fail?"):
+        response = await async_client.post("/personal_assistant/jobs", json={"question": question},
+                                           headers=headers["jobuser"])
+        assert response.status_code == 202, response.text
+        assert response.json()["status"] == "queued"
+        submitted.append(response.json()["id"])
+    response = await async_client.post("/personal_assistant/jobs", json={"question": "One more?"},
+                                       headers=headers["jobuser"])
+    assert response.status_code == 503, response.text
+    assert queue.pending == 2
+
+    await queue.start()
+    try:
+        response = await async_client.get(f"/personal_assistant/jobs/{submitted[0]}",
+                                          params={"wait": 5}, headers=headers["jobuser"])
+        assert response.status_code == 200, response.text
+        job = response.json()
+        assert job["status"] == "done"
+        assert job["response"] == "Cook at home more."
+        assert "User question: How do I save?" in prompts[0]
+
+        response = await async_client.get(f"/personal_assistant/jobs/{submitted[1]}",
+                                          params={"wait": 5}, headers=headers["jobuser"])
+        assert response.json()["status"] == "failed"
+        assert "Read timed out" in response.json()["error"]
+
+        # Jobs are only visible to the user who submitted them.
+        response = await async_client.get(f"/personal_assistant/jobs/{submitted[0]}",
+                                          headers=headers["otherjobuser"])
+        assert response.status_code == 404
+        response = await async_client.get("/personal_assistant/jobs/not-an-id", headers=headers["jobuser"])
+        assert response.status_code == 400
+        assert queue.stats == {"submitted": 2, "completed": 1, "failed": 1, "rejected": 1}
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_assistant_job_running_at_shutdown(monkeypatch):
+    import asyncio
+    import threading
+    from types import SimpleNamespace
+    from app import assistant_jobs as jobs_module
+    from app.assistant_jobs import AssistantJobQueue, RESTARTED_ERROR
+
+    started, release = threading.Event(), threading.Event()
+
+    def post(url, json=None, **kwargs):
+        started.set()
+        release.wait(5)
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: {"response": "Too late."})
+
+    monkeypatch.setattr(jobs_module, "get_http_session", lambda: SimpleNamespace(post=post))
+    queue = AssistantJobQueue(workers=1, max_pending=1, ttl_seconds=60)
+    await queue.start()
+    try:
+        job = await queue.submit("shutdownjobuser", "How do I save?")
+        assert await asyncio.to_thread(started.wait, 5)
+    finally:
+        await queue.stop()
+        release.set()
+
+    job = await queue.get("shutdownjobuser", job["_id"])
+    assert job["status"] == "failed"
+    assert job["error"] == RESTARTED_ERROR
+    assert queue.stats["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_record_listing_fields(async_client):
+    email = unique_email("fields")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "fieldsuser", "email": email, "password": "fieldspass"})
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    for amount, category in [(12.5, "Groceries"), (40.0, "Transport")]:
+        response = await async_client.post("/records/", json={
+            "amount": amount, "category": category, "type": "expense",
+            "description": "A long description the table view does not show"}, headers=headers)
+        assert response.status_code == 201, response.text
+
+    full = (await async_client.get("/records/", headers=headers)).json()
+    response = await async_client.get("/records/", params={"fields": "id, amount,category,date"}, headers=headers)
+    assert response.status_code == 200, response.text
+    trimmed = response.json()
+    assert trimmed["total"] == 2
+    assert trimmed["records"] == [
+        {field: record[field] for field in ("id", "amount", "category", "date")}
+        for record in full["records"]
+    ]
+
+    response = await async_client.get(
+        "/records/", params={"fields": "currency,type", "all": True}, headers=headers)
+    assert response.json()["records"] == [{"currency": "USD", "type": "expense"}] * 2
+
+    for fields in ("id,password", ""):
+        response = await async_client.get("/records/", params={"fields": fields}, headers=headers)
+        assert response.status_code == 400, response.text
+
+
+@pytest.mark.asyncio
+async def test_response_compression(async_client):
+    email = unique_email("compression")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "compressionuser", "email": email, "password": "compresspass"})
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    for i in range(20):
+        response = await async_client.post("/records/", json={
+            "amount": 10.0 + i, "category": "Groceries", "type": "expense",
+            "description": f"Weekly shop {i}"}, headers=headers)
+        assert response.status_code == 201, response.text
+
+    response = await async_client.get(
+        "/records/", params={"all": True}, headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json()["total"] == 20
+
+    # Small bodies and clients not asking for compression get plain JSON.
+    response = await async_client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    response = await async_client.get(
+        "/records/", params={"all": True}, headers={**headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()["records"]) == 20
+
+
+@pytest.mark.asyncio
+async def test_batch_requests(async_client, monkeypatch):
+    email = unique_email("batch")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "batchuser", "email": email, "password": "batchpass"})
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    access_token = signup_resp.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = decode_access_token(access_token)["sub"]
+
+    for amount in (12.5, 40.0):
+        response = await async_client.post("/records/", json={
+            "amount": amount, "category": "Groceries", "type": "expense"}, headers=headers)
+        assert response.status_code == 201, response.text
+
+    import app.auth as auth
+    decoded = []
+
+    def counting_decode(token):
+        decoded.append(token)
+        return decode_access_token(token)
+
+    monkeypatch.setattr(auth, "decode_access_token", counting_decode)
+    response = await async_client.post("/batch/", json={"requests": [
+        {"id": "user", "path": f"/users/{user_id}"},
+        {"id": "records", "path": "/records/?limit=1&sortField=amount&sortOrder=1"},
+        {"id": "summary", "path": "/records/summary"},
+        {"id": "create", "method": "POST", "path": "/records/",
+         "body": {"amount": 5, "category": "Transport", "type": "expense"}},
+        {"id": "invalid", "method": "POST", "path": "/records/", "body": {"amount": -1}},
+        {"id": "missing", "path": "/records/000000000000000000000000", "method": "DELETE"},
+    ]}, headers=headers)
+    assert response.status_code == 200, response.text
+    # One token decode (and user lookup) for the whole batch.
+    assert len(decoded) == 1
+
+    results = {result["id"]: result for result in response.json()["responses"]}
+    assert list(results) == ["user", "records", "summary", "create", "invalid", "missing"]
+    assert results["user"]["status"] == 200
+    assert results["user"]["body"]["email"] == email
+    assert results["records"]["status"] == 200
+    assert [r["amount"] for r in results["records"]["body"]["records"]] == [12.5]
+    assert results["summary"]["status"] == 200
+    assert results["create"]["status"] == 201
+    assert results["create"]["body"]["category"] == "Transport"
+    assert results["invalid"]["status"] == 422
+    assert results["missing"]["status"] == 404
+
+    response = await async_client.get("/records/", headers=headers)
+    assert response.json()["total"] == 3
+
+    # Unauthenticated batches, nested batches and oversized batches are refused.
+    response = await async_client.post("/batch/", json={"requests": [{"path": "/records/"}]})
+    assert response.status_code == 401
+    response = await async_client.post(
+        "/batch/", json={"requests": [{"method": "POST", "path": "/batch/"}]}, headers=headers)
+    assert response.status_code == 422
+    response = await async_client.post(
+        "/batch/", json={"requests": [{"path": "/"}] * 21}, headers=headers)
+    assert response.status_code == 422
+    for path in ("/%62atch/", "/batch%2F", "/%2Fbatch"):
+        response = await async_client.post(
+            "/batch/", json={"requests": [{"method": "POST", "path": path}]}, headers=headers)
+        assert response.status_code == 422, (path, response.text)
+
+    # Nesting is refused by the batch route itself, too.
+    from app.auth import RESOLVED_USER_SCOPE_KEY
+    from app.routers.batch import run_batch
+    from app.schemas import BatchRequest
+    from starlette.requests import Request
+    from fastapi import HTTPException
+    nested = Request({"type": "http", RESOLVED_USER_SCOPE_KEY: {"_id": user_id}})
+    with pytest.raises(HTTPException) as exc_info:
+        await run_batch(BatchRequest(requests=[{"path": "/"}]), nested, {"_id": user_id})
+    assert exc_info.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_record_attachments(async_client, monkeypatch, tmp_path):
+    import os
+    from app.config import get_settings
+    from app.database import mongo
+    monkeypatch.setattr(get_settings(), "attachment_storage", "filesystem")
+    monkeypatch.setattr(get_settings(), "attachment_dir", str(tmp_path))
+    monkeypatch.setattr(get_settings(), "attachment_chunk_bytes", 64 * 1024)
+
+    def stored_files():
+        return sorted(name for _, _, names in os.walk(tmp_path) for name in names)
+
+    email = unique_email("attachments")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "attachuser", "email": email, "password": "attachpass"})
+    assert signup_resp.status_code == 201, signup_resp.text
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+
+    record_ids = []
+    for category in ("Groceries", "Dining"):
+        response = await async_client.post("/records/", json={
+            "amount": 20.0, "category": category, "type": "expense"}, headers=headers)
+        assert response.status_code == 201, response.text
+        record_ids.append(response.json()["id"])
+
+    receipt = os.urandom(300 * 1024)
+    response = await async_client.post(
+        f"/records/{record_ids[0]}/attachments", params={"filename": "receipt é.pdf"},
+        content=receipt, headers={**headers, "Content-Type": "application/pdf"})
+    assert response.status_code == 201, response.text
+    attachment = response.json()
+    assert attachment["size"] == len(receipt)
+    assert attachment["content_type"] == "application/pdf"
+
+    # Listings carry the metadata only.
+    response = await async_client.get("/records/", params={"all": True}, headers=headers)
+    listed = {record["id"]: record for record in response.json()["records"]}
+    assert listed[record_ids[0]]["attachments"] == [attachment]
+    assert listed[record_ids[1]]["attachments"] == []
+
+    url = f"/records/{record_ids[0]}/attachments/{attachment['id']}"
+    response = await async_client.get(url, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.content == receipt
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.headers["content-disposition"].startswith("inline;")
+    etag = response.headers["etag"]
+    response = await async_client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    response = await async_client.get(f"{url}/thumbnail", headers=headers)
+    assert response.status_code == 404
+
+    # The same content attached elsewhere is stored once.
+    response = await async_client.post(
+        f"/records/{record_ids[1]}/attachments", params={"filename": "copy.pdf"},
+        content=receipt, headers={**headers, "Content-Type": "application/pdf"})
+    assert response.status_code == 201, response.text
+    copy = response.json()
+    assert len(stored_files()) == 1
+    blob = await mongo.attachment_blobs.find_one({"_id": etag.strip('"')})
+    assert blob["refs"] == 2
+
+    # Too large: refused while streaming (no Content-Length), nothing kept.
+    monkeypatch.setattr(get_settings(), "attachment_max_bytes", 100 * 1024)
+
+    async def chunked_upload():
+        for _ in range(4):
+            yield os.urandom(50 * 1024)
+
+    response = await async_client.post(
+        f"/records/{record_ids[1]}/attachments", params={"filename": "big.bin"},
+        content=chunked_upload(), headers=headers)
+    assert response.status_code == 413, response.text
+    assert len(stored_files()) == 1
+
+    # Another user cannot read it.
+    other_email = unique_email("attachments_other")
+    other_resp = await async_client.post("/users/signup", json={
+        "username": "otheruser", "email": other_email, "password": "otherpass"})
+    created_test_emails.append(other_email)
+    other_headers = {"Authorization": f"Bearer {other_resp.json()['access_token']}"}
+    response = await async_client.get(url, headers=other_headers)
+    assert response.status_code == 404
+
+    # Deleting the attachment and then the other record releases the blob.
+    response = await async_client.delete(url, headers=headers)
+    assert response.status_code == 200, response.text
+    response = await async_client.get("/records/", params={"all": True}, headers=headers)
+    listed = {record["id"]: record for record in response.json()["records"]}
+    assert listed[record_ids[0]]["attachments"] == []
+    assert listed[record_ids[1]]["attachments"] == [copy]
+    assert len(stored_files()) == 1
+
+    response = await async_client.delete(f"/records/{record_ids[1]}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert stored_files() == []
+    assert await mongo.attachment_blobs.find_one({"_id": blob["_id"]}) is None
+    assert await mongo.attachments.count_documents({"record_id": record_ids[1]}) == 0
+
+
+@pytest.mark.asyncio
+async def test_attachment_thumbnails(async_client, monkeypatch, tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    import io
+    from app.config import get_settings
+    monkeypatch.setattr(get_settings(), "attachment_storage", "filesystem")
+    monkeypatch.setattr(get_settings(), "attachment_dir", str(tmp_path))
+
+    email = unique_email("thumbnails")
+    signup_resp = await async_client.post("/users/signup", json={
+        "username": "thumbuser", "email": email, "password": "thumbpass"})
+    created_test_emails.append(email)
+    headers = {"Authorization": f"Bearer {signup_resp.json()['access_token']}"}
+    response = await async_client.post("/records/", json={
+        "amount": 8.0, "category": "Dining", "type": "expense"}, headers=headers)
+    record_id = response.json()["id"]
+
+    photo = io.BytesIO()
+    Image.new("RGB", (1200, 800), (200, 30, 30)).save(photo, format="PNG")
+    response = await async_client.post(
+        f"/records/{record_id}/attachments", params={"filename": "receipt.png"},
+        content=photo.getvalue(), headers={**headers, "Content-Type": "image/png"})
+    assert response.status_code == 201, response.text
+
+    url = f"/records/{record_id}/attachments/{response.json()['id']}/thumbnail"
+    for _ in range(2):
+        response = await async_client.get(url, headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "image/jpeg"
+        with Image.open(io.BytesIO(response.content)) as thumbnail:
+            assert thumbnail.size == (256, 171)
+
+
+
+def test_thumbnail_skips_images_over_the_pixel_cap():
+    Image = pytest.importorskip("PIL.Image")
+    import io
+    from app.attachments import make_thumbnail
+
+    # A few KB of PNG that would decode to 4000 x 4000 pixels.
+    image = io.BytesIO()
+    Image.new("RGB", (4000, 4000)).save(image, format="PNG")
+    assert len(image.getvalue()) < 1024 * 1024
+    image.seek(0)
+    assert make_thumbnail(image, 256, max_pixels=1_000_000) is None
+    image.seek(0)
+    assert make_thumbnail(image, 256, max_pixels=16_000_000) is not None
@@ -0,0 +1,153 @@
+# query_plan_test.py
+
+import os
+import pytest
+import time
+from bson import ObjectId
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.config import get_settings
+from app.conftest import created_test_emails
+from app.database import mongo, ensure_indexes, SORTABLE_RECORD_FIELDS
+from app.routers.records import build_records_filter, build_records_sort, build_records_projection
+from app.sharding import ShardTargetingMonitor
+from app.sync import SyncPosition, MIN_OBJECT_ID, after_position
+
+
+def collect_stages(plan) -> list:
+    """
+    Walk an explain() plan tree and return every stage name in it.
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(collect_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(collect_stages(value))
+    return stages
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sort_order", [1, -1])
+@pytest.mark.parametrize("sort_field", SORTABLE_RECORD_FIELDS)
+async def test_supported_sorts_use_an_index(sort_field, sort_order):
+    await ensure_indexes()
+    query_filter = build_records_filter("query-plan-user")
+    cursor = mongo.records.find(query_filter).sort(
+        build_records_sort(sort_field, sort_order)).limit(10)
+    explain = await cursor.explain()
+
+    stages = collect_stages(explain["queryPlanner"]["winningPlan"])
+    assert "SORT" not in stages, stages
+    assert "IXSCAN" in stages, stages
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("category", [None, "groc"])
+async def test_compact_listing_is_a_covered_query(category):
+    await ensure_indexes()
+    sort = build_records_sort("date", -1)
+    cursor = mongo.records.find(
+        build_records_filter("query-plan-user", category=category),
+        build_records_projection(["id", "date", "amount", "category", "type"], sort),
+    ).sort(sort).limit(10)
+    explain = await cursor.explain()
+
+    stages = collect_stages(explain["queryPlanner"]["winningPlan"])
+    assert "IXSCAN" in stages, stages
+    assert "FETCH" not in stages, stages
+    assert "SORT" not in stages, stages
+
+
+@pytest.mark.asyncio
+async def test_gridfs_attachment_storage():
+    from app.attachments import GridFSStorage, release_blob, single_chunk, store_blob
+    content = os.urandom(600 * 1024)
+    storage = GridFSStorage(chunk_bytes=255 * 1024)
+    first = await store_blob(single_chunk(content), max_bytes=len(content))
+    second = await store_blob(single_chunk(content), max_bytes=len(content))
+    assert first["_id"] == second["_id"] and second["refs"] == first["refs"] + 1
+    chunks = [chunk async for chunk in storage.open(first["location"])]
+    assert len(chunks) == 3 and b"".join(chunks) == content
+
+    await release_blob(first["_id"])
+    await release_blob(first["_id"])
+    assert await mongo.attachment_blobs.find_one({"_id": first["_id"]}) is None
+    assert await mongo.db.get_collection("attachment_files.chunks").count_documents(
+        {"files_id": ObjectId(first["location"])}) == 0
+
+
+@pytest.mark.asyncio
+async def test_delta_sync_uses_an_index():
+    await ensure_indexes()
+    position = SyncPosition(datetime.now(timezone.utc), MIN_OBJECT_ID)
+    for collection, id_field in [(mongo.records, "_id"), (mongo.archived_records, "_id"),
+                                 (mongo.record_tombstones, "record_id")]:
+        cursor = collection.find(
+            {"user_id": "query-plan-user", **after_position(position, id_field)}
+        ).sort([("updated_at", 1), (id_field, 1)]).limit(10)
+        explain = await cursor.explain()
+
+        stages = collect_stages(explain["queryPlanner"]["winningPlan"])
+        assert "SORT" not in stages, stages
+        assert "IXSCAN" in stages, stages
+
+
+@pytest.mark.asyncio
+async def test_hot_endpoints_target_one_shard(async_client):
+    # Run the endpoints clients call all day through a client that checks
+    # every command against the shard keys.
+    monitor = ShardTargetingMonitor()
+    mongo.use_client(AsyncIOMotorClient(get_settings().mongo_uri, event_listeners=[monitor]))
+    try:
+        email = f"shardtest_{int(time.time() * 1000)}@example.com"
+        created_test_emails.append(email)
+        credentials = {"email": email, "password": "shardpass"}
+        resp = await async_client.post("/users/signup", json={**credentials, "username": "sharduser"})
+        assert resp.status_code == 201, resp.text
+        resp = await async_client.post("/users/signin", json=credentials)
+        assert resp.status_code == 200, resp.text
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        resp = await async_client.post("/budgets/", json={"category": "Food", "limit": 100.0}, headers=headers)
+        assert resp.status_code == 201, resp.text
+        resp = await async_client.post("/records/", json={
+            "amount": 90.0, "category": "Food", "type": "expense", "description": "Groceries"},
+            headers={**headers, "Idempotency-Key": "shard-test"})
+        assert resp.status_code == 201, resp.text
+        record_id = resp.json()["id"]
+        resp = await async_client.post("/recurring/", json={
+            "amount": 5.0, "category": "Coffee", "type": "expense", "frequency": "daily",
+            "start_date": datetime.now(timezone.utc).isoformat()}, headers=headers)
+        assert resp.status_code == 201, resp.text
+        recurring_id = resp.json()["id"]
+
+        for path, params in [
+            ("/records/", {"sortField": "amount", "sortOrder": -1, "category": "Food"}),
+            ("/records/summary", {}),
+            ("/records/search", {"q": "groc"}),
+            ("/records/sync", {}),
+            ("/budgets/utilization", {}),
+            ("/recurring/", {}),
+            ("/analytics/monthly", {}),
+            ("/analytics/outliers", {}),
+        ]:
+            resp = await async_client.get(path, params=params, headers=headers)
+            assert resp.status_code == 200, (path, resp.text)
+
+        resp = await async_client.patch(f"/records/{record_id}", json={"amount": 95.0}, headers=headers)
+        assert resp.status_code == 200, resp.text
+        resp = await async_client.patch(f"/recurring/{recurring_id}", json={"amount": 6.0}, headers=headers)
+        assert resp.status_code == 200, resp.text
+        resp = await async_client.delete(f"/recurring/{recurring_id}", headers=headers)
+        assert resp.status_code == 200, resp.text
+        resp = await async_client.delete(f"/records/{record_id}", headers=headers)
+        assert resp.status_code == 200, resp.text
+
+        assert monitor.commands > 0
+        assert monitor.scattered == []
+    finally:
+        mongo.close()
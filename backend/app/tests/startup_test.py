@@ -0,0 +1,63 @@
+# startup_test.py
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+# Cold-import budget for app.main in milliseconds; raise it on slow CI runners
+# with IMPORT_TIME_BUDGET_MS.
+IMPORT_TIME_BUDGET_MS = int(os.getenv("IMPORT_TIME_BUDGET_MS", 2000))
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    """
+    Run a fresh interpreter in the backend directory without a MONGO_URI.
+    """
+    env = {key: value for key, value in os.environ.items() if key != "MONGO_URI"}
+    return subprocess.run(
+        [sys.executable, *args], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    )
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Map module name to cumulative import time (microseconds) from -X importtime output.
+    """
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        timings[module.strip()] = int(cumulative)
+    return timings
+
+
+def test_import_has_no_side_effects():
+    result = run_python("-c", (
+        "import sys\n"
+        "import app.main\n"
+        "from app.database import mongo\n"
+        "assert mongo._client is None, 'Mongo client created at import'\n"
+        "assert 'motor.motor_asyncio' not in sys.modules, 'motor imported eagerly'\n"
+        "assert 'requests' not in sys.modules, 'requests imported eagerly'\n"
+        "print('ok')\n"
+    ))
+    assert result.stdout.strip() == "ok"
+
+
+def test_cold_import_time():
+    # Best of three runs to keep the measurement stable across noisy runners.
+    runs = [parse_importtime(run_python("-X", "importtime", "-c", "import app.main").stderr)
+            for _ in range(3)]
+    best = min(runs, key=lambda timings: timings["app.main"])
+    total_ms = best["app.main"] / 1000
+
+    slowest = sorted(best.items(), key=lambda item: item[1], reverse=True)[:10]
+    print(f"\napp.main cold import: {total_ms:.0f} ms")
+    for module, cumulative in slowest:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+    assert total_ms < IMPORT_TIME_BUDGET_MS
@@ -4,7 +4,33 @@ import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 from app.utils import hash_password, verify_password, create_token, decode_access_token
-from datetime import timedelta
+from app.routers.records import build_records_filter, build_records_sort, parse_record_fields, build_records_projection
+from app.database import MongoClientManager, PoolMetrics, mongo_client_options, read_preferences
+from app.config import Settings
+from app.metrics import Histogram, MongoCommandTimer, RequestTimings, current_timings, server_timing_header
+from app.profiling import sample_stacks, format_collapsed
+from app.rate_limit import InMemoryRateLimitBackend, ConcurrencyLimiter
+from app.recurrence import CronSchedule, next_occurrence, occurrences_between
+from app.budgets import spend_deltas, month_key
+from app.currency import DEFAULT_RATES_FILE, ExchangeRateTable, UnknownCurrencyError, load_exchange_rates
+from datetime import date
+from decimal import Decimal
+from app.money import to_cents, from_cents, bound_to_cents, legacy_cents
+from app.analytics import (
+    RecordFrame, daily_expenses, rolling_mean, monthly_totals, month_over_month,
+    category_shares, find_outliers, format_month,
+)
+from app.user_cache import UserCache
+from app.search import SearchIndex, parse_query
+from app.sharding import ShardTargetingMonitor, is_targeted
+from app.responses import CompressionMiddleware, FastJSONResponse, negotiate_encoding
+from bson import ObjectId
+from types import SimpleNamespace
+import threading
+from pymongo import ReadPreference
+from app.schemas import RecordType
+from fastapi import HTTPException
+from datetime import datetime, timedelta, timezone
 import os
 from dotenv import load_dotenv
 import time
@@ -36,6 +62,297 @@ def test_create_token():
     assert payload["sub"] == "testuser"
 
 
+def test_build_records_filter_ranges():
+    date_from = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    date_to = datetime(2025, 4, 1, tzinfo=timezone.utc)
+    query_filter = build_records_filter(
+        "user-1",
+        record_type=RecordType.expense,
+        date_from=date_from,
+        date_to=date_to,
+        min_amount=500,
+        max_amount=750.005,
+    )
+    assert query_filter == {
+        "user_id": "user-1",
+        "type": "expense",
+        "date": {"$gte": date_from, "$lt": date_to},
+        "amount_cents": {"$gte": 50000, "$lte": 75000},
+    }
+
+
+def test_build_records_filter_rejects_inverted_ranges():
+    with pytest.raises(HTTPException) as exc_info:
+        build_records_filter("user-1", min_amount=10, max_amount=5)
+    assert exc_info.value.status_code == 400
+
+    now = datetime.now(timezone.utc)
+    with pytest.raises(HTTPException) as exc_info:
+        build_records_filter("user-1", date_from=now, date_to=now)
+    assert exc_info.value.status_code == 400
+
+    # A naive bound is UTC, and compares with an aware one.
+    with pytest.raises(HTTPException) as exc_info:
+        build_records_filter("user-1", date_from=now, date_to=now.replace(tzinfo=None))
+    assert exc_info.value.status_code == 400
+    query_filter = build_records_filter(
+        "user-1", date_from=datetime(2024, 1, 1, tzinfo=timezone.utc), date_to=datetime(2024, 2, 1))
+    assert query_filter["date"] == {"$gte": datetime(2024, 1, 1, tzinfo=timezone.utc),
+                                    "$lt": datetime(2024, 2, 1, tzinfo=timezone.utc)}
+
+
+def test_build_records_sort_adds_tiebreak():
+    assert build_records_sort("amount", -1) == [("amount_cents", -1), ("_id", -1)]
+    assert build_records_sort("date", 1) == [("date", 1), ("_id", 1)]
+
+
+def test_build_records_sort_rejects_unsupported_sorts():
+    with pytest.raises(HTTPException) as exc_info:
+        build_records_sort("user_id", 1)
+    assert exc_info.value.status_code == 400
+
+    with pytest.raises(HTTPException) as exc_info:
+        build_records_sort("date", 0)
+    assert exc_info.value.status_code == 400
+
+
+def test_record_fields_map_to_a_projection():
+    assert parse_record_fields(None) is None
+    fields = parse_record_fields("id, amount,category,date,amount")
+    assert fields == ["id", "amount", "category", "date"]
+    sort = build_records_sort("date", -1)
+    assert build_records_projection(fields, sort) == {
+        "_id": 1, "amount_cents": 1, "category": 1, "date": 1}
+    # Sort fields are read even if not returned.
+    assert build_records_projection(["id"], build_records_sort("description", 1)) == {
+        "_id": 1, "description": 1}
+
+    for fields in ("id,user_password", ",", ""):
+        with pytest.raises(HTTPException) as exc_info:
+            parse_record_fields(fields)
+        assert exc_info.value.status_code == 400
+
+
+def test_mongo_client_options_from_settings():
+    settings = Settings(
+        mongo_max_pool_size=250,
+        mongo_min_pool_size=10,
+        mongo_wait_queue_timeout_ms=2000,
+        mongo_compressors="zstd,zlib",
+    )
+    options = mongo_client_options(settings)
+    assert options["maxPoolSize"] == 250
+    assert options["minPoolSize"] == 10
+    assert options["waitQueueTimeoutMS"] == 2000
+    assert options["compressors"] == "zstd,zlib"
+
+
+def test_read_preferences():
+    assert read_preferences("secondaryPreferred") == ReadPreference.SECONDARY_PREFERRED
+    with pytest.raises(ValueError):
+        read_preferences("anywhere")
+
+
+def test_mongo_client_manager_reuses_one_client():
+    manager = MongoClientManager()
+    client = manager.connect()
+    assert manager.connect() is client
+    manager.close()
+    assert manager.connect() is not client
+    manager.close()
+
+
+def test_pool_metrics_tracks_connections_in_use():
+    metrics = PoolMetrics()
+    metrics.connection_created(None)
+    metrics.connection_checked_out(None)
+    metrics.connection_checked_out(None)
+    metrics.connection_checked_in(None)
+    snapshot = metrics.snapshot()
+    assert snapshot["connections_created"] == 1
+    assert snapshot["checkouts"] == 2
+    assert snapshot["connections_in_use"] == 1
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(("/records/",), 0.05)
+    histogram.observe(("/records/",), 0.5)
+    lines = list(histogram.render())
+    assert 'test_seconds_bucket{route="/records/",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/records/",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/records/",le="+Inf"} 2' in lines
+    assert 'test_seconds_count{route="/records/"} 2' in lines
+
+
+def test_mongo_commands_are_attributed_to_the_request():
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    try:
+        timer = MongoCommandTimer()
+        timer.succeeded(SimpleNamespace(command_name="find", duration_micros=1500))
+        timer.failed(SimpleNamespace(command_name="insert", duration_micros=500))
+    finally:
+        current_timings.reset(token)
+    assert timings.db_operations == 2
+    assert timings.db_seconds == pytest.approx(0.002)
+
+    timings.add_external("llm", 1.25)
+    header = server_timing_header(1.5, timings)
+    assert header == 'app;dur=1500.0, db;dur=2.0;desc="2 ops", llm;dur=1250.0'
+
+
+def test_sample_stacks_collects_folded_stacks():
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker)
+    worker.start()
+    try:
+        samples = sample_stacks(0.1, 0.005, thread_id=worker.ident)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert samples
+    assert all("busy_worker" in stack for stack in samples)
+    first_line = format_collapsed(samples).splitlines()[0]
+    assert first_line.rsplit(" ", 1)[1].isdigit()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_refills_over_time():
+    now = [0.0]
+    backend = InMemoryRateLimitBackend(clock=lambda: now[0])
+    for _ in range(3):
+        allowed, _ = await backend.take("signin:ip:1.2.3.4", capacity=3, refill_per_second=1)
+        assert allowed
+    allowed, retry_after = await backend.take("signin:ip:1.2.3.4", capacity=3, refill_per_second=1)
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+    allowed, _ = await backend.take("signin:ip:5.6.7.8", capacity=3, refill_per_second=1)
+    assert allowed
+
+    now[0] = 1.0
+    allowed, _ = await backend.take("signin:ip:1.2.3.4", capacity=3, refill_per_second=1)
+    assert allowed
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_sheds_excess_requests():
+    limiter = ConcurrencyLimiter("test", max_concurrent=1)
+    first = limiter()
+    await first.__anext__()
+    with pytest.raises(HTTPException) as exc_info:
+        await limiter().__anext__()
+    assert exc_info.value.status_code == 503
+
+    with pytest.raises(StopAsyncIteration):
+        await first.__anext__()
+    assert limiter.in_flight == 0
+
+
+
+def test_monthly_occurrences_clamp_to_month_end():
+    template = {"frequency": "monthly", "interval": 1,
+                "start_date": datetime(2024, 1, 31, 9, tzinfo=timezone.utc)}
+    occurrences = list(occurrences_between(
+        template, datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2024, 5, 1, tzinfo=timezone.utc)))
+    assert [o.date().isoformat() for o in occurrences] == [
+        "2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30"]
+
+
+def test_weekly_occurrences_respect_interval_and_end_date():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    template = {"frequency": "weekly", "interval": 2, "start_date": start,
+                "end_date": datetime(2024, 2, 1, tzinfo=timezone.utc)}
+    assert next_occurrence(template, start + timedelta(days=1)) == start + timedelta(days=14)
+    assert len(list(occurrences_between(template, start, datetime(2025, 1, 1, tzinfo=timezone.utc)))) == 3
+    assert next_occurrence(template, datetime(2024, 2, 2, tzinfo=timezone.utc)) is None
+
+
+def test_cron_schedule():
+    # 08:30 on weekdays.
+    schedule = CronSchedule("30 8 * * 1-5")
+    # 2024-01-06 is a Saturday.
+    assert schedule.next_after(datetime(2024, 1, 6, 12, tzinfo=timezone.utc)) == \
+        datetime(2024, 1, 8, 8, 30, tzinfo=timezone.utc)
+    # First of the month or any Sunday, at midnight.
+    schedule = CronSchedule("0 0 1 * 0")
+    assert schedule.next_after(datetime(2024, 1, 2, tzinfo=timezone.utc)) == \
+        datetime(2024, 1, 7, tzinfo=timezone.utc)
+    assert schedule.times_per_day == 1
+    assert CronSchedule("*/15 9-17 * * *").times_per_day == 36
+    with pytest.raises(ValueError):
+        CronSchedule("61 * * * *")
+    with pytest.raises(ValueError):
+        CronSchedule("* * *")
+
+
+def test_spend_deltas_group_expenses_by_category_and_month():
+    jan = datetime(2024, 1, 31, 23, tzinfo=timezone.utc)
+    feb = datetime(2024, 2, 1, tzinfo=timezone.utc)
+    records = [
+        {"user_id": "u1", "category": "Food", "type": "expense", "amount_cents": 1010, "date": jan},
+        {"user_id": "u1", "category": "food ", "type": "expense", "amount_cents": 520, "date": jan},
+        {"user_id": "u1", "category": "Food", "type": "expense", "amount_cents": 700, "date": feb},
+        {"user_id": "u1", "category": "Salary", "type": "income", "amount_cents": 90000, "date": jan},
+        # Not yet migrated from a float amount.
+        {"user_id": "u1", "category": "Food", "type": "expense", "amount": 0.1, "date": feb},
+    ]
+    assert month_key(jan) == "2024-01"
+    assert spend_deltas(records) == {("u1", "food", "2024-01"): 1530, ("u1", "food", "2024-02"): 710}
+    assert spend_deltas(records[:1], sign=-1) == {("u1", "food", "2024-01"): -1010}
+
+
+def test_exchange_rate_table_converts_at_each_dates_rate():
+    table = ExchangeRateTable("USD", [
+        (date(2024, 1, 1), "EUR", 1.10),
+        (date(2024, 2, 1), "EUR", 1.20),
+        (date(2024, 1, 1), "GBP", 1.25),
+    ])
+    converted = table.convert(
+        [10.0, 10.0, 10.0, 10.0, 5.0],
+        ["EUR", "EUR", "EUR", "USD", "GBP"],
+        [date(2023, 6, 1), date(2024, 1, 15), datetime(2024, 3, 1, 12), date(2024, 1, 15), date(2024, 1, 15)],
+        "USD",
+    )
+    # Before the first rate the earliest rate applies; afterwards the latest earlier one.
+    assert converted.tolist() == pytest.approx([11.0, 11.0, 12.0, 10.0, 6.25])
+    assert table.convert_one(12.0, "USD", date(2024, 2, 2), "EUR") == pytest.approx(10.0)
+    assert table.convert_one(11.0, "EUR", date(2024, 1, 2), "GBP") == pytest.approx(9.68)
+    with pytest.raises(UnknownCurrencyError):
+        table.convert([1.0], ["XYZ"], [date(2024, 1, 1)], "USD")
+
+
+def test_exchange_rates_file_states_its_quote_currency(tmp_path):
+    assert load_exchange_rates(DEFAULT_RATES_FILE, "USD").supports("EUR")
+    with pytest.raises(ValueError, match="quoted in USD"):
+        load_exchange_rates(DEFAULT_RATES_FILE, "EUR")
+
+    # Files without a base line are taken to be in the configured currency.
+    rates_file = tmp_path / "rates.csv"
+    rates_file.write_text("date,currency,rate\n2024-01-01,USD,0.9\n")
+    table = load_exchange_rates(rates_file, "EUR")
+    assert table.convert_one(10.0, "USD", date(2024, 1, 2), "EUR") == pytest.approx(9.0)
+
+
+def test_money_in_integer_cents_sums_exactly():
+    amounts = [0.1] * 10 + [0.2] * 10
+    assert sum(amounts) != 3.0
+    assert sum(to_cents(amount) for amount in amounts) == 300
+    assert to_cents(Decimal("19.99")) == 1999
+    assert from_cents(1999) == 19.99
+    with pytest.raises(ValueError):
+        to_cents(Decimal("1.005"))
+    assert bound_to_cents(10.005, lower=True) == 1001
+    assert bound_to_cents(10.005, lower=False) == 1000
+    assert legacy_cents(19.989999999) == 1999
+
 def unique_email(base="testuser"):
     return f"{base}_{int(time.time() * 1000)}@example.com"
 
@@ -211,3 +528,200 @@ async def test_delete_record(async_client):
     )
     assert delete_response.status_code == 200, delete_response.text
     assert delete_response.json()["message"] == "Record deleted successfully."
+
+
+def test_analytics_over_record_frame():
+    def record(day, cents, category="Food", type="expense", **extra):
+        return {"_id": ObjectId(), "date": datetime(2024, 3, day) if isinstance(day, int) else day,
+                "amount_cents": cents, "category": category, "type": type, **extra}
+
+    records = [record(day, 1000) for day in range(1, 11)] + [
+        record(11, 9000),
+        record(5, 2500, "Rent"),
+        record(datetime(2024, 2, 10), 4000),
+        record(datetime(2024, 2, 1), 100000, "Salary", "income"),
+    ]
+    frame = RecordFrame.from_records(records, "USD")
+    march_11 = date(2024, 3, 11).toordinal()
+
+    daily = daily_expenses(frame, march_11 - 2, march_11)
+    assert daily.tolist() == [1000, 1000, 9000]
+    assert rolling_mean(daily, 2).tolist() == [1000, 1000, 5000]
+
+    months, income, expense = monthly_totals(frame, 2, march_11)
+    assert [format_month(m) for m in months] == ["2024-02", "2024-03"]
+    assert income.tolist() == [100000, 0]
+    assert expense.tolist() == [4000, 21500]
+    change, fraction = month_over_month(expense)
+    assert change.tolist() == [0, 17500]
+    assert fraction[1] == pytest.approx(4.375)
+
+    shares = category_shares(frame, date(2024, 3, 1).toordinal())
+    assert [(category, cents) for category, cents, _ in shares] == [("Food", 19000), ("Rent", 2500)]
+    assert sum(share for _, _, share in shares) == pytest.approx(1.0)
+
+    (outlier,) = find_outliers(frame, date(2024, 3, 1).toordinal(), threshold=2.0)
+    assert frame.record_id(outlier[0]) == records[10]["_id"]
+
+
+@pytest.mark.asyncio
+async def test_user_cache_expires_and_invalidates():
+    now = [0.0]
+    loads = []
+
+    async def loader(user_id):
+        loads.append(user_id)
+        return RecordFrame.from_records([], "USD")
+
+    cache = UserCache(loader, max_users=1, ttl=10, clock=lambda: now[0])
+    await cache.get("u1")
+    await cache.get("u1")
+    assert loads == ["u1"]
+
+    cache.invalidate("u1")
+    await cache.get("u1")
+    now[0] = 11
+    await cache.get("u1")
+    await cache.get("u2")
+    await cache.get("u1")  # Evicted by u2.
+    assert loads == ["u1", "u1", "u1", "u2", "u1"]
+
+
+@pytest.mark.asyncio
+async def test_user_cache_recovers_from_a_cancelled_load():
+    import asyncio
+
+    started = asyncio.Event()
+    loads = []
+
+    async def loader(user_id):
+        loads.append(user_id)
+        if len(loads) == 1:
+            started.set()
+            await asyncio.sleep(60)
+        return user_id.upper()
+
+    cache = UserCache(loader, max_users=10, ttl=10)
+    first = asyncio.create_task(cache.get("u1"))
+    await started.wait()
+    waiter = asyncio.create_task(cache.get("u1"))
+    await asyncio.sleep(0)
+    cache.invalidate("u1")
+    first.cancel()
+
+    # The waiter loads again instead of hanging on the cancelled load.
+    assert await asyncio.wait_for(waiter, 1) == "U1"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert await asyncio.wait_for(cache.get("u1"), 1) == "U1"
+    assert loads == ["u1", "u1"]
+    assert not cache._loading and not cache._raced
+
+
+def test_search_index_ranks_multi_term_and_prefix_matches():
+    def record(description, category="Food", day=1):
+        return {"_id": ObjectId(), "description": description, "category": category,
+                "date": datetime(2024, 3, day)}
+
+    records = [
+        record("Coffee at Starbucks", day=1),
+        record("Coffee beans", "Groceries", day=2),
+        record("Starbucks gift card", "Gifts", day=3),
+        record("Lunch", day=4),
+    ]
+    index = SearchIndex.build(records)
+
+    def search(query, prefix_last=True):
+        slots, _ = index.search(parse_query(query, prefix_last))
+        return [index.ids[slot] for slot in slots]
+
+    assert parse_query("Coffee star* bean") == [("coffee", False), ("star", True), ("bean", True)]
+    # Every term must match.
+    assert search("coffee starbucks") == [records[0]["_id"]]
+    # Equal scores: newest first.
+    assert search("starb") == [records[2]["_id"], records[0]["_id"]]
+    assert search("starb", prefix_last=False) == []
+    # Category words are indexed and weighted above description words.
+    assert search("food")[0] == records[3]["_id"]
+
+    index.add({**records[3], "description": "Starbucks lunch"})
+    index.remove(records[0]["_id"])
+    assert set(search("starbucks")) == {records[2]["_id"], records[3]["_id"]}
+    index.pack()
+    assert set(search("starbucks")) == {records[2]["_id"], records[3]["_id"]}
+    assert search("coffee") == [records[1]["_id"]]
+
+
+def test_shard_targeting_of_commands():
+    assert is_targeted({"user_id": "u1", "date": {"$gte": 1}}, "user_id")
+    assert is_targeted({"user_id": {"$in": ["u1", "u2"]}}, "user_id")
+    assert is_targeted({"$and": [{"user_id": "u1"}, {"$or": [{"a": 1}, {"b": 2}]}]}, "user_id")
+    assert is_targeted({"$or": [{"user_id": "u1"}, {"user_id": "u2", "category": "Food"}]}, "user_id")
+    assert not is_targeted({"_id": ObjectId()}, "user_id")
+    assert not is_targeted({"user_id": {"$gt": "u1"}}, "user_id")
+    assert not is_targeted({"$or": [{"user_id": "u1"}, {"category": "Food"}]}, "user_id")
+
+    monitor = ShardTargetingMonitor()
+
+    def started(command):
+        monitor.started(SimpleNamespace(command_name=next(iter(command)), command=command))
+
+    started({"find": "records", "filter": {"user_id": "u1"}})
+    started({"aggregate": "records", "pipeline": [{"$match": {"user_id": "u1"}}, {"$group": {"_id": None}}]})
+    started({"update": "budgets", "updates": [{"q": {"_id": 1, "user_id": "u1"}, "u": {}}]})
+    started({"insert": "records", "documents": [{"user_id": "u1"}]})
+    started({"find": "users", "filter": {"_id": ObjectId()}})
+    # Unsharded collections and cursor commands are not checked.
+    started({"findAndModify": "rate_limits", "query": {"_id": "ip:1"}})
+    started({"getMore": 1, "collection": "records"})
+    assert monitor.commands == 5
+    assert monitor.scattered == []
+
+    started({"delete": "records", "deletes": [{"q": {"_id": 1}, "limit": 1}]})
+    started({"find": "users", "filter": {"email": "a@b.c"}})
+    assert [(name, collection) for name, collection, _ in monitor.scattered] == [
+        ("delete", "records"), ("find", "users")]
+
+
+def test_negotiate_encoding(monkeypatch):
+    import app.responses as responses
+    monkeypatch.setattr(responses, "SUPPORTED_ENCODINGS", ("zstd", "br", "gzip"))
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    # Equal weights: the server's preference.
+    assert negotiate_encoding("gzip, deflate, br, zstd") == "zstd"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.8") == "gzip"
+    assert negotiate_encoding("GZIP, br;q=0") == "gzip"
+    assert negotiate_encoding("*") == "zstd"
+    assert negotiate_encoding("zstd;q=0, *;q=0.5") == "br"
+    assert negotiate_encoding("gzip;q=0, *;q=0") is None
+
+
+def test_fast_json_response_renders_like_json():
+    import json
+    import numpy as np
+    content = {"records": [{"id": "a", "amount": 12.5, "date": "2024-01-01T00:00:00"}],
+               "by_year": {2024: np.float64(1.5)}, "note": "café"}
+    rendered = FastJSONResponse(content).body
+    assert json.loads(rendered) == {**content, "by_year": {"2024": 1.5}}
+
+
+@pytest.mark.asyncio
+async def test_compression_middleware_streams_chunks():
+    from httpx import AsyncClient, ASGITransport
+
+    async def chunked_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/csv")]})
+        for i in range(3):
+            await send({"type": "http.response.body", "body": b"a,b,c\n" * 10, "more_body": i < 2})
+
+    transport = ASGITransport(app=CompressionMiddleware(chunked_app, minimum_size=1024))
+    async with AsyncClient(base_url="http://testserver", transport=transport) as client:
+        response = await client.get("/", headers={"Accept-Encoding": "gzip"})
+    # Streamed bodies are compressed whatever their size.
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.content == b"a,b,c\n" * 30
+
@@ -0,0 +1,92 @@
+# app/user_cache.py
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Set, Tuple
+
+
+class UserCache:
+    """
+    LRU of values built per user from their records (analytics frames,
+    search indexes).
+
+    Writes in this process either invalidate() a user's value or update()
+    it in place. Writes handled by other workers are picked up when the
+    entry's ttl expires. Concurrent misses for one user share a single load,
+    and a load that raced a write is returned but not cached. If the request
+    running a shared load is cancelled, the requests waiting on it load again.
+    """
+
+    def __init__(self, loader: Callable[[str], Awaitable[Any]], max_users: int, ttl: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.loader = loader
+        self.max_users = max_users
+        self.ttl = ttl
+        self.clock = clock
+        self._values: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Users whose load in progress raced a write.
+        self._raced: Set[str] = set()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def invalidate(self, *user_ids: str):
+        for user_id in user_ids:
+            self._values.pop(user_id, None)
+            if user_id in self._loading:
+                self._raced.add(user_id)
+            self.stats["invalidations"] += 1
+
+    def update(self, user_id: str, apply: Callable[[Any], None]):
+        """
+        Apply a change to the user's cached value, if there is one. A load
+        in progress may or may not see the write, so it is not cached.
+        """
+        if user_id in self._loading:
+            self._raced.add(user_id)
+        cached = self._values.get(user_id)
+        if cached is not None:
+            apply(cached[1])
+
+    async def get(self, user_id: str) -> Any:
+        cached = self._values.get(user_id)
+        if cached is not None and self.clock() - cached[0] < self.ttl:
+            self._values.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return cached[1]
+
+        while user_id in self._loading:
+            loading = self._loading[user_id]
+            try:
+                return await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                if not loading.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # The request running the load was cancelled, not this one.
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[user_id] = future
+        try:
+            value = await self.loader(user_id)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when no one else is waiting on it.
+            future.exception()
+            raise
+        except BaseException:
+            # Cancelled (client disconnect, timeout): release the waiters.
+            future.cancel()
+            raise
+        finally:
+            self._loading.pop(user_id, None)
+            raced = user_id in self._raced
+            self._raced.discard(user_id)
+        future.set_result(value)
+
+        if not raced:
+            self._values[user_id] = (self.clock(), value)
+            self._values.move_to_end(user_id)
+            while len(self._values) > self.max_users:
+                self._values.popitem(last=False)
+        return value
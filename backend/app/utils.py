@@ -4,18 +4,8 @@ import bcrypt
 import jwt
 from datetime import datetime, timedelta, timezone
 from typing import Optional
-import os
 from fastapi import HTTPException, status
-from dotenv import load_dotenv
-
-load_dotenv()
-
-
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
-REFRESH_TOKEN_EXPIRE_MINUTES = int(
-    os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES", 1440))
+from app.config import get_settings
 
 
 def hash_password(plain_password: str) -> str:
@@ -65,18 +55,20 @@ def create_token(data: dict, expires_delta: Optional[timedelta] = None, token_ty
     Returns:
         str: The encoded JWT token.
     """
+    settings = get_settings()
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         if token_type == "access":
             expire = datetime.now(timezone.utc) + \
-                timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+                timedelta(minutes=settings.access_token_expire_minutes)
         else:
             expire = datetime.now(timezone.utc) + \
-                timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+                timedelta(minutes=settings.refresh_token_expire_minutes)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(
+        to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
 
@@ -91,7 +83,9 @@ def decode_access_token(token: str) -> dict:
         dict: The decoded payload data.
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        settings = get_settings()
+        payload = jwt.decode(token, settings.secret_key,
+                             algorithms=[settings.algorithm])
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(
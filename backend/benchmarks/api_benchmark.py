@@ -0,0 +1,331 @@
+# benchmarks/api_benchmark.py
+"""
+Load test for the backend API.
+
+Runs the FastAPI app in-process against an in-memory MongoDB stand-in
+(mongomock-motor) and a stubbed LLM microservice, seeds deterministic user and
+record volumes, then drives each flow with concurrent clients and reports
+p50/p95/p99 latency and requests per second per endpoint.
+
+    python -m benchmarks.api_benchmark --users 5 --records-per-user 10000 \\
+        --requests 500 --concurrency 20 --output bench.json --compare baseline.json
+
+Run it from the backend directory. The same seed and parameters produce the
+same data and request mix, so result files from different commits compare
+like for like. Seeding 1M records per user works but takes several minutes
+with the in-memory stand-in.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from bson import ObjectId
+from httpx import AsyncClient, ASGITransport
+from mongomock_motor import AsyncMongoMockClient
+
+CATEGORIES = ["Groceries", "Rent", "Salary", "Utilities", "Transport",
+              "Dining", "Entertainment", "Healthcare", "Travel", "Shopping"]
+MERCHANTS = ["Whole Foods", "Trader Joes", "Shell", "Amazon", "Netflix", "Uber",
+             "Starbucks", "Home Depot", "Costco", "Delta Airlines"]
+PASSWORD = "benchmarkpass"
+SEED_BATCH_SIZE = 5000
+
+
+class FakeLLMResponse:
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"response": "Spend less on dining out."}
+
+
+class FakeLLMSession:
+    """
+    Stands in for the requests.Session used to reach the LLM microservice.
+    Blocks for llm_latency seconds per call, as the real requests call does.
+    """
+
+    def __init__(self, llm_latency: float):
+        self.llm_latency = llm_latency
+
+    def post(self, url, json=None, **kwargs):
+        time.sleep(self.llm_latency)
+        return FakeLLMResponse()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def seed(users: int, records_per_user: int, rng: random.Random) -> List[dict]:
+    """
+    Insert users and records. Returns the users with their email and id.
+    """
+    from app.database import mongo
+    from app.utils import hash_password
+
+    hashed_password = hash_password(PASSWORD)
+    now = datetime.now(timezone.utc)
+    seeded_users = []
+    for u in range(users):
+        user = {
+            "username": f"benchuser{u}",
+            "email": f"benchuser{u}@example.com",
+            "password": hashed_password,
+            "created_at": now,
+            "updated_at": now,
+        }
+        result = await mongo.users.insert_one(user)
+        await mongo.user_emails.insert_one({"_id": user["email"], "user_id": result.inserted_id})
+        user_id = str(result.inserted_id)
+        seeded_users.append({"id": user_id, "email": user["email"]})
+
+        batch = []
+        for i in range(records_per_user):
+            record_type = "income" if rng.random() < 0.2 else "expense"
+            batch.append({
+                "_id": ObjectId(),
+                "user_id": user_id,
+                "amount_cents": rng.randint(100, 200000),
+                "category": rng.choice(CATEGORIES),
+                "description": f"{rng.choice(MERCHANTS)} transaction {i}",
+                "type": record_type,
+                "date": now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60)),
+            })
+            if len(batch) == SEED_BATCH_SIZE:
+                await mongo.records.insert_many(batch)
+                batch = []
+        if batch:
+            await mongo.records.insert_many(batch)
+    return seeded_users
+
+
+def build_flows(users: List[dict], records_per_user: int) -> Dict[str, Callable]:
+    """
+    Map each benchmarked flow to a function building (method, url, kwargs)
+    for one request.
+    """
+    from app.utils import create_token
+
+    headers = {user["id"]: {"Authorization": f"Bearer {create_token({'sub': user['id']})}"}
+               for user in users}
+
+    def signin(rng):
+        user = rng.choice(users)
+        return "POST", "/users/signin", {"json": {"email": user["email"], "password": PASSWORD}}
+
+    def list_records(rng):
+        user = rng.choice(users)
+        return "GET", "/records/", {"headers": headers[user["id"]]}
+
+    def paginate(rng):
+        user = rng.choice(users)
+        params = {
+            "skip": rng.randint(0, max(0, records_per_user - 20)),
+            "limit": 20,
+            "sortField": rng.choice(["date", "amount", "category"]),
+            "sortOrder": rng.choice([1, -1]),
+        }
+        return "GET", "/records/", {"headers": headers[user["id"]], "params": params}
+
+    def create(rng):
+        user = rng.choice(users)
+        payload = {
+            "amount": round(rng.uniform(1, 500), 2),
+            "category": rng.choice(CATEGORIES),
+            "description": "Benchmark create",
+            "type": "expense",
+        }
+        return "POST", "/records/", {"headers": headers[user["id"]], "json": payload}
+
+    def search(rng):
+        user = rng.choice(users)
+        query = rng.choice(MERCHANTS).split()[0].lower()
+        # Search-as-you-type: a prefix of a merchant name.
+        return "GET", "/records/search", {
+            "headers": headers[user["id"]], "params": {"q": query[:rng.randint(2, len(query))]}}
+
+    def assistant(rng):
+        user = rng.choice(users)
+        return "POST", "/personal_assistant/", {
+            "headers": headers[user["id"]],
+            "json": {"question": "How can I save more this month?"},
+        }
+
+    return {
+        "signin": signin,
+        "list": list_records,
+        "paginate": paginate,
+        "create": create,
+        "search": search,
+        "assistant": assistant,
+    }
+
+
+async def run_flow(client: AsyncClient, build_request: Callable, requests: int,
+                   concurrency: int, rng: random.Random) -> dict:
+    """
+    Send `requests` requests from `concurrency` concurrent clients.
+    """
+    planned = [build_request(rng) for _ in range(requests)]
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while planned:
+            method, url, kwargs = planned.pop()
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+async def run_benchmark(users: int = 5, records_per_user: int = 1000, requests: int = 200,
+                        concurrency: int = 10, llm_latency: float = 0.05, seed_value: int = 42,
+                        flows: Optional[List[str]] = None) -> dict:
+    """
+    Seed the in-memory database and benchmark each flow in turn.
+
+    Returns:
+        dict: Run parameters and environment under "meta", per-flow stats under "results".
+    """
+    from app.config import get_settings
+    from app.database import mongo, ensure_indexes
+    from app.main import app
+    from app import assistant_jobs
+
+    settings = get_settings()
+    settings.secret_key = settings.secret_key or "benchmark-secret-key"
+    # Measure the endpoints themselves; per-client limits would cap every flow.
+    # Concurrency caps stay on, so shed requests show up as errors.
+    settings.rate_limit_enabled = False
+    mongo.use_client(AsyncMongoMockClient())
+    await ensure_indexes()
+    # mongomock ignores partialFilterExpression, so this unique index would
+    # also cover records without a recurring_id: two of a user's records
+    # dated the same millisecond would collide on (user_id, None, date).
+    await mongo.records.drop_index("user_id_recurring_id_date")
+    original_session = assistant_jobs.get_http_session
+    assistant_jobs.get_http_session = lambda: FakeLLMSession(llm_latency)
+
+    rng = random.Random(seed_value)
+    try:
+        seeded_users = await seed(users, records_per_user, rng)
+        flow_builders = build_flows(seeded_users, records_per_user)
+        results = {}
+        transport = ASGITransport(app=app)
+        async with AsyncClient(base_url="http://benchmark", transport=transport) as client:
+            for name, build_request in flow_builders.items():
+                if flows and name not in flows:
+                    continue
+                results[name] = await run_flow(client, build_request, requests, concurrency, rng)
+    finally:
+        assistant_jobs.get_http_session = original_session
+        mongo.close()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "users": users,
+            "records_per_user": records_per_user,
+            "requests": requests,
+            "concurrency": concurrency,
+            "llm_latency": llm_latency,
+            "seed": seed_value,
+        },
+        "results": results,
+    }
+
+
+def format_report(report: dict, baseline: Optional[dict] = None) -> str:
+    lines = [f"{'flow':<10} {'reqs':>6} {'errs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>9}"]
+    for name, stats in report["results"].items():
+        line = (f"{name:<10} {stats['requests']:>6} {stats['errors']:>5} {stats['p50_ms']:>9.1f} "
+                f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['rps']:>9.1f}")
+        previous = (baseline or {}).get("results", {}).get(name)
+        if previous and previous["p95_ms"] and previous["rps"]:
+            p95_change = (stats["p95_ms"] / previous["p95_ms"] - 1) * 100
+            rps_change = (stats["rps"] / previous["rps"] - 1) * 100
+            line += f"   p95 {p95_change:+.0f}%  rps {rps_change:+.0f}%"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--records-per-user", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per flow")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.05,
+                        help="Seconds the stubbed LLM takes per call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--flows", nargs="*", help="Only run these flows")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="A previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(
+        users=args.users,
+        records_per_user=args.records_per_user,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        llm_latency=args.llm_latency,
+        seed_value=args.seed,
+        flows=args.flows,
+    ))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(format_report(report, baseline))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
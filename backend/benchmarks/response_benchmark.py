@@ -0,0 +1,145 @@
+# benchmarks/response_benchmark.py
+"""
+Serialization time and bytes on the wire for large record listings.
+
+Builds GET /records/?all=true bodies of 1k, 10k and 100k deterministic
+records, full and in the compact fields=id,date,amount,category,type view,
+then reports for each:
+
+- the time to render the body with FastAPI's default path
+  (jsonable_encoder + JSONResponse) and with FastJSONResponse;
+- the body size and compression time with every encoding the server
+  offers (gzip, and br/zstd when Brotli/zstandard are installed), at the
+  levels configured in the settings.
+
+    python -m benchmarks.response_benchmark --sizes 1000 10000 100000 --output responses.json
+
+Run it from the backend directory. No database is needed.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from app.config import get_settings
+from app.responses import SUPPORTED_ENCODINGS, FastJSONResponse, compress
+from app.serializers import serialize_record, serialize_record_fields
+from benchmarks.api_benchmark import CATEGORIES, MERCHANTS
+
+COMPACT_FIELDS = ["id", "date", "amount", "category", "type"]
+
+
+def build_documents(count: int, rng: random.Random) -> List[dict]:
+    start = datetime(2020, 1, 1)
+    user_id = str(ObjectId.from_datetime(start))
+    return [{
+        "_id": ObjectId.from_datetime(start + timedelta(minutes=i)),
+        "user_id": user_id,
+        "amount_cents": rng.randint(100, 50000),
+        "category": rng.choice(CATEGORIES),
+        "description": f"{rng.choice(MERCHANTS)} #{rng.randint(1, 9999)}",
+        "date": start + timedelta(minutes=rng.randint(0, 60 * 24 * 365 * 4)),
+        "type": "income" if rng.random() < 0.1 else "expense",
+        "currency": "USD",
+    } for i in range(count)]
+
+
+def best_time(function: Callable, repeat: int):
+    """
+    The fastest of `repeat` runs, in seconds, and the last result.
+    """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def measure(records: list, repeat: int) -> dict:
+    content = {"records": records, "total": len(records)}
+    default_seconds, default_body = best_time(
+        lambda: JSONResponse(jsonable_encoder(content)).body, repeat)
+    fast_seconds, body = best_time(lambda: FastJSONResponse(content).body, repeat)
+    assert json.loads(body) == json.loads(default_body)
+
+    settings = get_settings()
+    levels = {"gzip": settings.compression_gzip_level, "br": settings.compression_brotli_quality,
+              "zstd": settings.compression_zstd_level}
+    wire = {"identity": {"bytes": len(body), "compress_ms": 0.0}}
+    for encoding in SUPPORTED_ENCODINGS:
+        seconds, compressed = best_time(lambda: compress(encoding, levels[encoding], body), repeat)
+        wire[encoding] = {
+            "bytes": len(compressed),
+            "ratio": round(len(body) / len(compressed), 2),
+            "compress_ms": round(seconds * 1000, 2),
+        }
+    return {
+        "default_render_ms": round(default_seconds * 1000, 2),
+        "fast_render_ms": round(fast_seconds * 1000, 2),
+        "render_speedup": round(default_seconds / fast_seconds, 1) if fast_seconds else 0.0,
+        "wire": wire,
+    }
+
+
+def run_benchmark(sizes: List[int], repeat: int = 3, seed: int = 42) -> dict:
+    results = {}
+    for size in sizes:
+        documents = build_documents(size, random.Random(seed))
+        results[f"{size}"] = measure([serialize_record(document) for document in documents], repeat)
+        results[f"{size}_compact"] = measure(
+            [serialize_record_fields(document, COMPACT_FIELDS) for document in documents], repeat)
+    return {
+        "meta": {
+            "sizes": sizes,
+            "repeat": repeat,
+            "seed": seed,
+            "encodings": list(SUPPORTED_ENCODINGS),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def format_report(report: dict) -> str:
+    encodings = ["identity"] + report["meta"]["encodings"]
+    lines = [f"{'records':<14} {'default ms':>11} {'orjson ms':>10} "
+             + " ".join(f"{encoding + ' KB':>12} {encoding[:4] + ' ms':>8}" for encoding in encodings[1:])
+             + f" {'identity KB':>12}"]
+    for name, stats in report["results"].items():
+        wire = stats["wire"]
+        line = f"{name:<14} {stats['default_render_ms']:>11.1f} {stats['fast_render_ms']:>10.1f} "
+        line += " ".join(f"{wire[encoding]['bytes'] / 1024:>12.1f} {wire[encoding]['compress_ms']:>8.1f}"
+                         for encoding in encodings[1:])
+        line += f" {wire['identity']['bytes'] / 1024:>12.1f}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.sizes, args.repeat, args.seed)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
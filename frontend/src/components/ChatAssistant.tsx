@@ -8,6 +8,16 @@ interface ChatMessage {
   text: string;
 }
 
+interface AssistantJob {
+  id: string;
+  status: "queued" | "running" | "done" | "failed";
+  response?: string;
+  error?: string;
+}
+
+// Seconds each poll waits on the server for the answer.
+const POLL_WAIT_SECONDS = 20;
+
 const ChatAssistant: React.FC = () => {
   const [isOpen, setIsOpen] = useState(false);
   const [messages, setMessages] = useState<ChatMessage[]>([]);
@@ -34,15 +44,29 @@ const ChatAssistant: React.FC = () => {
     const accessToken = localStorage.getItem("accessToken") || "";
 
     try {
-      const response = await axios.post(
-        `${API_URL}/personal_assistant/`,
-        { question: input },
-        { headers: { Authorization: `Bearer ${accessToken}` } }
-      );
-      const data = response.data as { response: string };
+      const headers = { Authorization: `Bearer ${accessToken}` };
+      // The answer is generated in the background; long-poll until it is ready.
+      let job = (
+        await axios.post<AssistantJob>(
+          `${API_URL}/personal_assistant/jobs`,
+          { question: input },
+          { headers }
+        )
+      ).data;
+      while (job.status === "queued" || job.status === "running") {
+        job = (
+          await axios.get<AssistantJob>(
+            `${API_URL}/personal_assistant/jobs/${job.id}`,
+            { headers, params: { wait: POLL_WAIT_SECONDS } }
+          )
+        ).data;
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error);
+      }
       const assistantMsg: ChatMessage = {
         sender: "assistant",
-        text: data.response,
+        text: job.response ?? "",
       };
       setMessages((prev) => [...prev, assistantMsg]);
     } catch (error) {
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useContext } from "react";
+import React, { useState, useEffect, useContext, useRef } from "react";
 import {
   Container,
   Row,
@@ -232,11 +232,38 @@ const DashboardPage: React.FC = () => {
     }
   };
 
+  // The first page and the chart data load together in one batch request.
+  const initialLoad = useRef(true);
+
   useEffect(() => {
-    fetchAllRecords();
+    const loadDashboard = async () => {
+      try {
+        const { page, all } = await recordService.getDashboard({
+          skip: 0,
+          limit,
+          category: filterCategory || undefined,
+          sortField,
+          sortOrder,
+        });
+        setRecords(page.records);
+        setTotalRecords(page.total);
+        setAllRecords(all);
+        setErrorMsg("");
+      } catch (error) {
+        console.error("Error loading dashboard:", error);
+        setErrorMsg("Failed to fetch records.");
+      } finally {
+        setLoading(false);
+      }
+    };
+    loadDashboard();
   }, []);
 
   useEffect(() => {
+    if (initialLoad.current) {
+      initialLoad.current = false;
+      return;
+    }
     fetchPaginatedRecords();
   }, [currentPage, filterCategory, sortField, sortOrder]);
 
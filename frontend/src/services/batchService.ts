@@ -0,0 +1,28 @@
+// src/services/batchService.ts
+import api from "./api";
+
+export interface BatchOperation {
+  id?: string;
+  method?: "GET" | "POST" | "PUT" | "PATCH" | "DELETE";
+  // Path and query string, e.g. "/records/?limit=10".
+  path: string;
+  body?: unknown;
+  headers?: { [name: string]: string };
+}
+
+export interface BatchResult<T = unknown> {
+  id: string | null;
+  status: number;
+  body: T;
+}
+
+// Run several API requests in one round trip, authenticated once. The
+// operations run concurrently; results come back in the same order.
+async function batch(requests: BatchOperation[]): Promise<BatchResult[]> {
+  const response = await api.post<{ responses: BatchResult[] }>("/batch/", { requests });
+  return response.data.responses;
+}
+
+export default {
+  batch,
+};
@@ -1,13 +1,21 @@
 // src/services/recordService.ts
 import api from "./api";
-import { Record, RecordCreate, RecordUpdate } from "../types/record";
+import batchService, { BatchResult } from "./batchService";
+import { Attachment, Record, RecordCreate, RecordUpdate, RecordSyncPage } from "../types/record";
 
 interface GetRecordsParams {
   skip: number;
   limit: number;
   category?: string;
+  type?: "income" | "expense";
+  date_from?: string;
+  date_to?: string;
+  min_amount?: number;
+  max_amount?: number;
   sortField?: string;
   sortOrder?: number;
+  // Comma-separated fields to return, e.g. "id,amount,category,date".
+  fields?: string;
 }
 
 async function getRecords(params: GetRecordsParams): Promise<{ records: Record[]; total: number }> {
@@ -15,12 +23,46 @@ async function getRecords(params: GetRecordsParams): Promise<{ records: Record[]
   return response.data;
 }
 
+interface SearchRecordsParams {
+  q: string;
+  skip?: number;
+  limit?: number;
+  prefix?: boolean;
+}
+
+async function search(params: SearchRecordsParams): Promise<{ records: Record[]; total: number }> {
+  const response = await api.get<{ records: Record[]; total: number }>("/records/search", { params });
+  return response.data;
+}
+
 async function getAll(): Promise<Record[]> {
   // Pass the all flag to bypass pagination for chart data
   const response = await api.get<{ records: Record[]; total: number }>("/records", { params: { all: true } });
   return response.data.records;
 }
 
+// The first page of the table and all records for the charts, in one request.
+async function getDashboard(params: GetRecordsParams): Promise<{ page: { records: Record[]; total: number }; all: Record[] }> {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== undefined) query.set(key, String(value));
+  });
+  const [page, all] = (await batchService.batch([
+    { id: "page", path: `/records/?${query.toString()}` },
+    { id: "all", path: "/records/?all=true" },
+  ])) as BatchResult<{ records: Record[]; total: number }>[];
+  for (const result of [page, all]) {
+    if (result.status !== 200) throw new Error(`Failed to load ${result.id}: ${result.status}`);
+  }
+  return { page: page.body, all: all.body.records };
+}
+
+async function sync(since?: string, limit?: number): Promise<RecordSyncPage> {
+  // Omit since for a full sync; pass next_token back until has_more is false.
+  const response = await api.get<RecordSyncPage>("/records/sync", { params: { since, limit } });
+  return response.data;
+}
+
 async function createRecord(data: RecordCreate): Promise<Record> {
   const response = await api.post<Record>("/records/", data);
   return response.data;
@@ -36,10 +78,42 @@ async function deleteRecord(recordId: string): Promise<{ message: string }> {
   return response.data;
 }
 
+// The file is sent as the request body and streamed to storage by the backend.
+async function uploadAttachment(recordId: string, file: File): Promise<Attachment> {
+  const response = await api.post<Attachment>(`/records/${recordId}/attachments`, file, {
+    params: { filename: file.name },
+    headers: { "Content-Type": file.type || "application/octet-stream" },
+  });
+  return response.data;
+}
+
+async function downloadAttachment(recordId: string, attachmentId: string): Promise<Blob> {
+  const response = await api.get<Blob>(`/records/${recordId}/attachments/${attachmentId}`, { responseType: "blob" });
+  return response.data;
+}
+
+// Only image attachments have thumbnails.
+async function getAttachmentThumbnail(recordId: string, attachmentId: string): Promise<Blob> {
+  const response = await api.get<Blob>(`/records/${recordId}/attachments/${attachmentId}/thumbnail`, { responseType: "blob" });
+  return response.data;
+}
+
+async function deleteAttachment(recordId: string, attachmentId: string): Promise<{ message: string }> {
+  const response = await api.delete<{ message: string }>(`/records/${recordId}/attachments/${attachmentId}`);
+  return response.data;
+}
+
 export default {
   getRecords,
+  search,
   getAll,
+  getDashboard,
+  sync,
   createRecord,
   update,
   deleteRecord,
+  uploadAttachment,
+  downloadAttachment,
+  getAttachmentThumbnail,
+  deleteAttachment,
 };
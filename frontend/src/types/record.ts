@@ -1,3 +1,11 @@
+// Metadata of a file attached to a record; the contents are downloaded separately.
+export interface Attachment {
+  id: string;
+  filename: string;
+  content_type: string;
+  size: number;
+}
+
 export interface Record {
   id: string;
   user_id: string;
@@ -6,6 +14,16 @@ export interface Record {
   description?: string;
   date: string;
   type: 'income' | 'expense';
+  currency: string;
+  updated_at?: string;
+  attachments?: Attachment[];
+}
+
+export interface RecordSyncPage {
+  records: Record[];
+  deleted: string[];
+  next_token: string;
+  has_more: boolean;
 }
 
 export interface RecordUpdate {
@@ -13,6 +31,7 @@ export interface RecordUpdate {
   category: string;
   description?: string;
   type: 'income' | 'expense';
+  currency?: string;
 }
 
 export interface RecordCreate {
@@ -20,4 +39,5 @@ export interface RecordCreate {
   category: string;
   description?: string;
   type: 'income' | 'expense';
+  currency?: string;
 }
@@ -0,0 +1,274 @@
+# llm_microservice/app/backends.py
+"""
+Text generation backends.
+
+LLM_BACKEND selects one:
+
+- "huggingface" (default): the Hugging Face Inference API. Needs
+  HF_API_TOKEN and network access.
+- "local": a GGUF model (e.g. a 4-bit quantized Phi-3 mini) run on the CPU
+  with llama.cpp. Needs llama-cpp-python (requirements-local.txt) and
+  LLM_MODEL_PATH; works offline.
+
+The local model is loaded once at startup and warmed up before the service
+takes requests. Concurrent prompts are queued and handed to the model in
+batches by a single worker, which owns the model (a llama.cpp context is
+not thread-safe).
+"""
+
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+SYSTEM_PROMPT = "You are a highly knowledgeable personal finance assistant. Provide concise and actionable advice."
+
+
+class Generation(NamedTuple):
+    text: str
+    completion_tokens: int
+
+
+class BackendUnavailable(Exception):
+    """
+    Raised when a backend cannot serve requests: misconfigured, not loaded
+    yet, or (for the local backend) its queue is full.
+    """
+
+
+def chat_messages(prompt: str) -> List[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+class LLMBackend(ABC):
+    """
+    Interface of a generation backend.
+    """
+
+    name = "base"
+
+    async def start(self):
+        """
+        Prepare the backend before the first request (load, warm up).
+        """
+
+    async def close(self):
+        pass
+
+    @property
+    def ready(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def generate(self, prompt: str, max_tokens: int) -> Generation:
+        """
+        Generate an answer to the prompt.
+        """
+
+
+class HuggingFaceBackend(LLMBackend):
+    """
+    Chat completions from the Hugging Face Inference API.
+    """
+
+    name = "huggingface"
+
+    def __init__(self, api_token: Optional[str], model: str):
+        self.api_token = api_token
+        self.model = model
+        self._client = None
+
+    def get_client(self):
+        # Built on the first request rather than at startup, so the service
+        # starts even before the token is configured.
+        if not self.api_token:
+            raise BackendUnavailable("HF_API_TOKEN is not set correctly. Please update your .env file.")
+        if self._client is None:
+            from huggingface_hub import InferenceClient
+            self._client = InferenceClient(api_key=self.api_token)
+        return self._client
+
+    async def generate(self, prompt: str, max_tokens: int) -> Generation:
+        client = self.get_client()
+        # The client is synchronous; keep the event loop free while it waits.
+        completion = await asyncio.to_thread(
+            client.chat.completions.create,
+            model=self.model, messages=chat_messages(prompt), max_tokens=max_tokens)
+        usage = getattr(completion, "usage", None)
+        return Generation(completion.choices[0].message.content,
+                          getattr(usage, "completion_tokens", 0) or 0)
+
+
+class LlamaCppBackend(LLMBackend):
+    """
+    A GGUF model run on the CPU with llama.cpp.
+
+    Requests wait in a queue of at most max_queue prompts. The worker takes
+    the first waiting prompt, then up to max_batch_size - 1 more arriving
+    within max_wait_ms, and runs the batch on its thread. llama-cpp-python
+    decodes one sequence at a time, so a batch runs back to back on the
+    loaded model: identical prompts are generated once, and prompts are
+    ordered so that consecutive ones share the longest prefix, which
+    llama.cpp keeps in its KV cache instead of evaluating it again. Every
+    assistant prompt starts with the same system message and instructions.
+    A prompt that fails (e.g. one longer than n_ctx) fails only the requests
+    waiting on it, not the rest of its batch.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path: str, n_ctx: int = 4096, n_threads: Optional[int] = None,
+                 max_batch_size: int = 8, max_wait_ms: float = 10, max_queue: int = 64,
+                 temperature: float = 0.2):
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.temperature = temperature
+        self.stats = {"batches": 0, "prompts": 0, "deduplicated": 0, "failed": 0, "warmup_seconds": 0.0}
+        self._model = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._worker is not None
+
+    def _load(self):
+        try:
+            from llama_cpp import Llama
+        except ImportError:
+            raise BackendUnavailable(
+                "LLM_BACKEND=local needs llama-cpp-python: pip install -r requirements-local.txt")
+        if not self.model_path or not os.path.exists(self.model_path):
+            raise BackendUnavailable(f"LLM_MODEL_PATH does not point to a GGUF model: {self.model_path!r}")
+        self._model = Llama(model_path=self.model_path, n_ctx=self.n_ctx,
+                            n_threads=self.n_threads, verbose=False)
+
+    def _complete(self, prompt: str, max_tokens: int) -> Generation:
+        completion = self._model.create_chat_completion(
+            messages=chat_messages(prompt), max_tokens=max_tokens, temperature=self.temperature)
+        return Generation(completion["choices"][0]["message"]["content"],
+                          completion["usage"]["completion_tokens"])
+
+    def _run_batch(self, prompts: List[Tuple[str, int]]) -> Dict[Tuple[str, int], Union[Generation, Exception]]:
+        """
+        Generate each distinct prompt once, in prefix order.
+
+        Returns:
+            Dict: The generation, or the error it raised, of every (prompt, max_tokens).
+        """
+        results = {}
+        for prompt, max_tokens in sorted(set(prompts)):
+            try:
+                results[(prompt, max_tokens)] = self._complete(prompt, max_tokens)
+            except Exception as e:
+                results[(prompt, max_tokens)] = e
+        return results
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        started = time.perf_counter()
+        await asyncio.to_thread(self._load)
+        # Touch every weight page and fill the KV cache with the system
+        # prompt, so the first real request is not the slow one.
+        await asyncio.to_thread(self._complete, "Say hello.", 8)
+        self.stats["warmup_seconds"] = round(time.perf_counter() - started, 3)
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._work())
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._queue = None
+        self._model = None
+
+    async def generate(self, prompt: str, max_tokens: int) -> Generation:
+        if self._queue is None:
+            raise BackendUnavailable("The local model is still loading.")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((prompt, max_tokens, future))
+        except asyncio.QueueFull:
+            raise BackendUnavailable("Too many pending prompts. Retry shortly.")
+        return await future
+
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _work(self):
+        while True:
+            batch = await self._next_batch()
+            prompts = [(prompt, max_tokens) for prompt, max_tokens, _ in batch]
+            try:
+                results = await asyncio.to_thread(self._run_batch, prompts)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["prompts"] += len(batch)
+            self.stats["deduplicated"] += len(batch) - len(results)
+            self.stats["failed"] += sum(isinstance(result, Exception) for result in results.values())
+            for prompt, max_tokens, future in batch:
+                # The caller may have given up (client disconnected).
+                if future.done():
+                    continue
+                result = results[(prompt, max_tokens)]
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name, "").strip()
+    return int(value) if value else default
+
+
+@lru_cache
+def get_backend() -> LLMBackend:
+    """
+    The backend selected by LLM_BACKEND, configured from the environment.
+    """
+    backend = os.getenv("LLM_BACKEND", "huggingface").strip()
+    if backend == "local":
+        return LlamaCppBackend(
+            model_path=os.getenv("LLM_MODEL_PATH", "").strip(),
+            n_ctx=env_int("LLM_CONTEXT_SIZE", 4096),
+            n_threads=env_int("LLM_THREADS", None),
+            max_batch_size=env_int("LLM_MAX_BATCH_SIZE", 8),
+            max_wait_ms=env_int("LLM_MAX_WAIT_MS", 10),
+            max_queue=env_int("LLM_MAX_QUEUE", 64),
+        )
+    if backend == "huggingface":
+        hf_api_token = os.getenv("HF_API_TOKEN", "default_value").strip()
+        return HuggingFaceBackend(
+            api_token=None if hf_api_token == "default_value" else hf_api_token,
+            model=os.getenv("HF_MODEL", "microsoft/Phi-3-mini-4k-instruct").strip(),
+        )
+    raise ValueError(f"Unknown LLM_BACKEND: {backend}")
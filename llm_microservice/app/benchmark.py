@@ -0,0 +1,141 @@
+# llm_microservice/app/benchmark.py
+"""
+Latency and throughput benchmark for the configured generation backend.
+
+Loads the backend in-process (LLM_BACKEND, LLM_MODEL_PATH, ... as for the
+service), then sends prompts shaped like the personal assistant's from
+concurrent clients and reports load and warmup time, p50/p95/p99 latency,
+requests per second and generated tokens per second. With LLM_BACKEND=local
+it needs no network:
+
+    LLM_BACKEND=local LLM_MODEL_PATH=models/phi-3-mini-4k-instruct-q4.gguf \\
+        python -m app.benchmark --requests 32 --concurrency 8 --max-tokens 64
+
+Run it from the llm_microservice directory. Compare --concurrency 1 with
+higher values to see what batching buys on a given machine.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from app.backends import get_backend
+
+CATEGORIES = ["Groceries", "Rent", "Utilities", "Transport", "Dining", "Entertainment"]
+QUESTIONS = [
+    "How can I spend less on dining out?",
+    "Am I saving enough each month?",
+    "Which category should I cut first?",
+    "Is my spending going up?",
+]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def build_prompt(rng: random.Random) -> str:
+    history = "\n".join(
+        f"2024-03-{day:02d}: Spent {rng.uniform(5, 200):.2f} USD on {rng.choice(CATEGORIES)}."
+        for day in sorted(rng.sample(range(1, 29), 8))
+    )
+    return (
+        "You are a highly knowledgeable personal finance assistant. The user, benchuser, "
+        f"has the following recent transaction history:\n{history}\n\n"
+        "Provide personalized financial advice, budgeting tips, and recommendations. "
+        f"Limit the response to 100 words.\nUser question: {rng.choice(QUESTIONS)}"
+    )
+
+
+async def run_benchmark(requests: int = 32, concurrency: int = 4, max_tokens: int = 64,
+                        seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    prompts = [build_prompt(rng) for _ in range(requests)]
+    backend = get_backend()
+
+    started = time.perf_counter()
+    await backend.start()
+    startup_seconds = time.perf_counter() - started
+
+    latencies: List[float] = []
+    tokens = 0
+    errors = 0
+    next_prompt = iter(prompts)
+
+    async def client():
+        nonlocal tokens, errors
+        for prompt in next_prompt:
+            sent = time.perf_counter()
+            try:
+                generation = await backend.generate(prompt, max_tokens)
+                tokens += generation.completion_tokens
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - sent)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await backend.close()
+
+    latencies.sort()
+    return {
+        "meta": {
+            "backend": backend.name,
+            "model": os.getenv("LLM_MODEL_PATH") or os.getenv("HF_MODEL"),
+            "requests": requests,
+            "concurrency": concurrency,
+            "max_tokens": max_tokens,
+            "seed": seed,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "startup_seconds": round(startup_seconds, 3),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "requests_per_second": round(requests / elapsed, 3) if elapsed else 0.0,
+        "tokens_per_second": round(tokens / elapsed, 1) if elapsed else 0.0,
+        "backend_stats": getattr(backend, "stats", {}),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    report = asyncio.run(run_benchmark(args.requests, args.concurrency, args.max_tokens, args.seed))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# unit_test.py
+
+import asyncio
+import pytest
+from app.backends import Generation, LLMBackend, LlamaCppBackend
+
+
+class FakeModelBackend(LlamaCppBackend):
+    """
+    A LlamaCppBackend with no model: _complete echoes the prompt, and fails
+    for prompts containing "too long" as llama.cpp does past n_ctx.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(model_path="", **kwargs)
+        self.completed = []
+
+    def _complete(self, prompt: str, max_tokens: int) -> Generation:
+        self.completed.append(prompt)
+        if "too long" in prompt:
+            raise ValueError(f"Requested tokens exceed context window of {self.n_ctx}")
+        return Generation(f"Answer to {prompt}", max_tokens)
+
+    async def start(self):
+        # Skip loading and warming up a model.
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._work())
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        LLMBackend()
+
+
+@pytest.mark.asyncio
+async def test_identical_prompts_are_generated_once():
+    backend = FakeModelBackend(max_batch_size=8, max_wait_ms=50)
+    await backend.start()
+    try:
+        prompts = ["How do I save?", "How do I save?", "How do I budget?", "How do I save?"]
+        generations = await asyncio.gather(*(backend.generate(prompt, 16) for prompt in prompts))
+    finally:
+        await backend.close()
+
+    assert [generation.text for generation in generations] == [f"Answer to {prompt}" for prompt in prompts]
+    assert sorted(backend.completed) == ["How do I budget?", "How do I save?"]
+    assert backend.stats["batches"] == 1
+    assert backend.stats["prompts"] == 4
+    assert backend.stats["deduplicated"] == 2
+
+
+@pytest.mark.asyncio
+async def test_batches_are_limited_to_max_batch_size():
+    backend = FakeModelBackend(max_batch_size=2, max_wait_ms=50)
+    await backend.start()
+    try:
+        prompts = [f"Question {i}" for i in range(5)]
+        generations = await asyncio.gather(*(backend.generate(prompt, 16) for prompt in prompts))
+    finally:
+        await backend.close()
+
+    assert [generation.text for generation in generations] == [f"Answer to {prompt}" for prompt in prompts]
+    assert backend.stats["batches"] == 3
+    assert backend.stats["prompts"] == 5
+
+
+@pytest.mark.asyncio
+async def test_failing_prompt_fails_only_its_requests():
+    backend = FakeModelBackend(max_batch_size=8, max_wait_ms=50)
+    await backend.start()
+    try:
+        prompts = ["How do I save?", "A prompt far too long", "How do I budget?", "A prompt far too long"]
+        results = await asyncio.gather(*(backend.generate(prompt, 16) for prompt in prompts),
+                                       return_exceptions=True)
+    finally:
+        await backend.close()
+
+    assert results[0].text == "Answer to How do I save?"
+    assert results[2].text == "Answer to How do I budget?"
+    assert isinstance(results[1], ValueError) and isinstance(results[3], ValueError)
+    assert backend.stats["batches"] == 1
+    assert backend.stats["failed"] == 1